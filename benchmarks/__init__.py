@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Набор бенчмарков bitrixogram.
+
+Запуск из корня репозитория:
+    PYTHONPATH=src python -m benchmarks run --output results.json
+    PYTHONPATH=src python -m benchmarks compare old.json new.json
+"""
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Командная строка набора бенчмарков: запуск, сохранение и сравнение результатов.
+"""
+
+import argparse
+import sys
+
+from bitrixogram import loops
+
+from . import harness
+from . import bench_webhook, bench_dispatch, bench_fsm, bench_flatten, bench_e2e, bench_import, bench_outbox, bench_ratelimit, bench_loops  # noqa: F401  регистрация бенчмарков
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='bitrixogram benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='выполнить бенчмарки')
+    run.add_argument('-k', '--filter', help='подстрока имени бенчмарка')
+    run.add_argument('-r', '--rounds', type=int, default=5, help='количество раундов')
+    run.add_argument('--min-time', type=float, default=0.2, help='минимальная длительность раунда, с')
+    run.add_argument('-o', '--output', help='файл JSON для результатов')
+    run.add_argument('--loop', default='asyncio', help='цикл событий: asyncio, uvloop или auto')
+
+    cmp = commands.add_parser('compare', help='сравнить два файла результатов')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.05, help='порог относительного изменения')
+
+    commands.add_parser('list', help='показать список бенчмарков')
+
+    args = parser.parse_args(argv)
+    if args.command == 'list':
+        for bench in harness.BENCHMARKS:
+            print(bench.name, bench.params or '')
+    elif args.command == 'run':
+        results = loops.run(harness.run_all(args.filter, args.rounds, args.min_time), args.loop)
+        if args.output:
+            harness.save(results, args.output)
+    else:
+        print('\n'.join(harness.compare(harness.load(args.old), harness.load(args.new), args.threshold)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки выбора обработчика сообщений и команд в Dispatcher.
+"""
+
+from bitrixogram.core import BitrixBot, Dispatcher, HandlerCache, MagicFilter, Router
+from bitrixogram.keyboard import ReplyKeyboardBuilder
+
+from .harness import benchmark
+from bitrixogram.mockportal import command_event, message_event
+
+F = MagicFilter()
+
+
+def build_dispatcher(routers: int, handlers: int) -> Dispatcher:
+    """
+    Создает диспетчер из routers маршрутизаторов по handlers обработчиков сообщений и команд.
+    Обработчики сопоставляются с текстом "r{i}h{j}" и командой "c{i}_{j}".
+
+    Args:
+        routers (int): Количество маршрутизаторов.
+        handlers (int): Количество обработчиков в маршрутизаторе.
+
+    Returns:
+        Dispatcher: Диспетчер.
+    """
+    dispatcher = Dispatcher()
+    for i in range(routers):
+        router = Router()
+        for j in range(handlers):
+            async def on_message(message, fsm):
+                pass
+            on_message.__name__ = f"on_message_{i}_{j}"
+            router.message(F.text() == f"r{i}h{j}")(on_message)
+
+            async def on_command(command, fsm):
+                pass
+            on_command.__name__ = f"on_command_{i}_{j}"
+            router.callback_query(F.command() == f"c{i}_{j}")(on_command)
+        dispatcher.add_router(router)
+    return dispatcher
+
+
+@benchmark("dispatch.message.last_handler", routers=10, handlers=20)
+async def dispatch_message(routers, handlers):
+    dispatcher = build_dispatcher(routers, handlers)
+    update = message_event(text=f"r{routers - 1}h{handlers - 1}")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+@benchmark("dispatch.message.no_match", routers=10, handlers=20)
+async def dispatch_no_match(routers, handlers):
+    dispatcher = build_dispatcher(routers, handlers)
+    update = message_event(text="nothing matches")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+@benchmark("dispatch.command.last_handler", routers=10, handlers=20)
+async def dispatch_command(routers, handlers):
+    dispatcher = build_dispatcher(routers, handlers)
+    update = command_event(command=f"c{routers - 1}_{handlers - 1}")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+@benchmark("dispatch.message.path_filter", routers=1, handlers=200)
+async def dispatch_path_filter(routers, handlers):
+    dispatcher = Dispatcher()
+    router = Router()
+    for j in range(handlers):
+        async def on_message(message, fsm):
+            pass
+        on_message.__name__ = f"on_path_{j}"
+        router.message(F["data.PARAMS.MESSAGE"] == f"h{j}", F["data[USER][ID]"] != "0")(on_message)
+    dispatcher.add_router(router)
+    update = message_event(text=f"h{handlers - 1}")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+@benchmark("dispatch.message.keywords", handlers=200)
+async def dispatch_keywords(handlers):
+    dispatcher = Dispatcher()
+    router = Router()
+    for j in range(handlers):
+        async def on_message(message, fsm):
+            pass
+        on_message.__name__ = f"on_keyword_{j}"
+        router.message(F.contains_any(f"alpha{j}", f"beta{j}", f"gamma{j}"))(on_message)
+    dispatcher.add_router(router)
+    update = message_event(text=f"please tell me about beta{handlers - 1} today")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+class NullBot(BitrixBot):
+    """
+    Бот без HTTP: запрос только преобразуется в плоские параметры.
+    """
+
+    def __init__(self):
+        super().__init__('http://localhost/rest/1/token/', 'token', 1, None)
+
+    async def _request(self, method, params=None):
+        self.flatten_params({**(params or {}), 'CLIENT_ID': self.bot_token})
+        if method == 'batch':
+            return {'result': {'result': {key: True for key in params['cmd']}}}
+        return {'result': True}
+
+
+def _faq_dispatcher(cache):
+    bot = NullBot()
+    router = Router()
+
+    @router.message(F.contains_any("delivery"), cache=cache)
+    async def faq(message, fsm):
+        builder = ReplyKeyboardBuilder()
+        for i in range(12):
+            builder.button(text=f"Option {i}", command="faq", command_params=str(i))
+        builder.adjust(3)
+        await bot.send_message(message.get_chat_id(), "Delivery takes 2-3 days. " * 10, keyboard=builder.as_markup())
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    return dispatcher
+
+
+@benchmark("dispatch.message.faq")
+async def dispatch_faq():
+    dispatcher = _faq_dispatcher(None)
+    update = message_event(text="how long is delivery?")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
+
+
+@benchmark("dispatch.message.faq.cached")
+async def dispatch_faq_cached():
+    dispatcher = _faq_dispatcher(HandlerCache())
+    update = message_event(text="how long is delivery?")
+
+    async def op():
+        await dispatcher.process_update(update)
+    yield op
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Сквозные бенчмарки: вебхук, обработчик и вызов REST API через MockPortal.
+"""
+
+import asyncio
+
+from aiohttp import ClientSession, TCPConnector, web
+
+from bitrixogram.core import BitrixBot, Dispatcher, MagicFilter, Router, WebhookListener
+from bitrixogram.mockportal import MockPortal, encode_event, message_event
+
+from .harness import benchmark, free_port
+
+F = MagicFilter()
+
+
+@benchmark("e2e.webhook_to_rest", items=200, concurrency=200)
+async def webhook_to_rest(concurrency):
+    """
+    Полный путь обновления: HTTP POST вебхука -> handle_post -> Dispatcher -> Router ->
+    обработчик -> send_message -> MockPortal без ограничения частоты. Операция - пакет из
+    concurrency одновременных обновлений от разных диалогов.
+    """
+    rest = MockPortal(rate=None, record=False)
+    await rest.start()
+    rest_session = ClientSession(connector=TCPConnector(limit=0))
+    bot = BitrixBot(rest.endpoint, 'token', 1, rest_session)
+
+    router = Router()
+
+    @router.message(F.text())
+    async def echo(message, fsm):
+        await bot.send_message(message.get_chat_id(), message.get_text())
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    listener = WebhookListener('127.0.0.1', free_port(), dispatcher)
+    app = web.Application()
+    app.router.add_post('/', listener.handle_post)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listener.host, listener.port).start()
+
+    url = f"http://{listener.host}:{listener.port}/"
+    bodies = [encode_event(message_event(text=f"text {i}", dialog_id=i + 1, message_id=i + 1)) for i in range(concurrency)]
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    client = ClientSession(connector=TCPConnector(limit=0))
+
+    async def post(body):
+        async with client.post(url, data=body, headers=headers) as response:
+            await response.read()
+
+    async def op():
+        await asyncio.gather(*(post(body) for body in bodies))
+    yield op
+
+    await client.close()
+    await runner.cleanup()
+    await listener.close()
+    await rest_session.close()
+    await rest.stop()
+
+
+async def _handler_latency(concurrency: int, outbox: bool):
+    """
+    Обработчики отвечают на concurrency обновлений разных диалогов: сразу через send_message
+    или через bot.outbox. Портал отвечает с задержкой 20 мс, соединений не более 10.
+    Операция завершается, когда все ответы доставлены.
+    """
+    rest = MockPortal(rate=None, record=False, latency=0.02)
+    await rest.start()
+    rest_session = ClientSession(connector=TCPConnector(limit=10))
+    bot = BitrixBot(rest.endpoint, 'token', 1, rest_session)
+
+    router = Router()
+
+    @router.message(F.text())
+    async def echo(message, fsm):
+        if outbox:
+            bot.outbox.send_message(message.get_chat_id(), message.get_text())
+        else:
+            await bot.send_message(message.get_chat_id(), message.get_text())
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    updates = [message_event(text=f"text {i}", dialog_id=i + 1, message_id=i + 1) for i in range(concurrency)]
+
+    async def op():
+        await asyncio.gather(*(dispatcher.process_update(update) for update in updates))
+        await bot.outbox.flush()
+    yield op
+
+    await bot.outbox.close()
+    await rest_session.close()
+    await rest.stop()
+
+
+@benchmark("e2e.reply.inline", items=200, concurrency=200)
+async def reply_inline(concurrency):
+    async for op in _handler_latency(concurrency, outbox=False):
+        yield op
+
+
+@benchmark("e2e.reply.outbox", items=200, concurrency=200)
+async def reply_outbox(concurrency):
+    async for op in _handler_latency(concurrency, outbox=True):
+        yield op
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки преобразования клавиатур и вложений в параметры запроса.
+"""
+
+from bitrixogram.attach import ReplyAttachBuilder
+from bitrixogram.core import BitrixBot
+from bitrixogram.keyboard import ReplyKeyboardBuilder
+
+from .harness import benchmark
+
+
+def build_keyboard(buttons: int):
+    builder = ReplyKeyboardBuilder()
+    for i in range(buttons):
+        builder.button(text=str(i), command="move", command_params=i, width=30)
+    builder.adjust(4)
+    return builder.as_markup()
+
+
+def build_attach(items: int):
+    builder = ReplyAttachBuilder()
+    grid = builder.grid_block_layout()
+    for i in range(items):
+        grid.add_item(name=f"Field {i}", value=f"Value {i}", width=100)
+    return (builder
+            .user(name="John Smith", avatar="https://example.test/avatar.png", link="https://example.test/")
+            .message("API version [B]im 1.1.0[/B]")
+            .grid(grid)
+            .build()).to_dict()
+
+
+@benchmark("flatten_params.keyboard", buttons=100)
+async def flatten_keyboard(buttons):
+    bot = BitrixBot('http://127.0.0.1/rest/', 'token', 1, None)
+    data = bot._message_data(1, "text", keyboard=build_keyboard(buttons))
+    yield lambda: bot.flatten_params(data)
+
+
+@benchmark("flatten_params.attach", grid_items=50)
+async def flatten_attach(grid_items):
+    bot = BitrixBot('http://127.0.0.1/rest/', 'token', 1, None)
+    data = bot._message_data(1, "text", attach=build_attach(grid_items))
+    yield lambda: bot.flatten_params(data)
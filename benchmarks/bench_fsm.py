@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки доступа к контекстам FSM и таймеров состояний.
+"""
+
+import itertools
+import random
+
+from bitrixogram.core import FSM
+
+from .harness import benchmark
+
+
+@benchmark("fsm.get_context.existing", chats=1_000_000)
+async def get_context_existing(chats):
+    fsm = FSM()
+    for chat_id in range(chats):
+        await (await fsm.get_context(chat_id)).set_state('state')
+    chat_ids = itertools.cycle([random.randrange(chats) for _ in range(10_000)])
+
+    async def op():
+        await fsm.get_context(next(chat_ids))
+    yield op
+
+
+@benchmark("fsm.get_context.state_roundtrip", chats=1_000_000)
+async def state_roundtrip(chats):
+    fsm = FSM()
+    for chat_id in range(chats):
+        await (await fsm.get_context(chat_id)).set_state('state')
+    chat_ids = itertools.cycle([random.randrange(chats) for _ in range(10_000)])
+
+    async def op():
+        context = await fsm.get_context(next(chat_ids))
+        await context.set_state('state')
+        await context.get_state()
+        await context.clear_state()
+    yield op
+
+
+@benchmark("fsm.set_state.ttl", timers=100_000)
+async def set_state_ttl(timers):
+    fsm = FSM()
+    for chat_id in range(timers):
+        await (await fsm.get_context(chat_id)).set_state('state', ttl=3600 + random.random())
+    chat_ids = itertools.cycle([random.randrange(timers) for _ in range(10_000)])
+
+    async def op():
+        await (await fsm.get_context(next(chat_ids))).set_state('state', ttl=3600 + random.random())
+    yield op
+    for chat_id in range(timers):
+        await (await fsm.get_context(chat_id)).clear_state()
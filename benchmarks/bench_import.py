@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Время запуска: интерпретатор в отдельном процессе импортирует точку входа пакета.
+Разница с import.python - стоимость импорта.
+"""
+
+import os
+import subprocess
+import sys
+
+from .harness import benchmark
+
+
+ENTRY_POINTS = {
+    'python': 'pass',
+    'package': 'import bitrixogram',
+    'keyboard': 'from bitrixogram.keyboard import ReplyKeyboardBuilder',
+    'attach': 'from bitrixogram.attach import ReplyAttachBuilder',
+    'client': 'from bitrixogram.core import BitrixBot',
+    'dispatcher': 'from bitrixogram.core import Dispatcher, Router, MagicFilter',
+    'webhook': 'from bitrixogram.core import WebhookListener',
+}
+
+
+def _import_op(statement: str):
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src, env.get('PYTHONPATH')]))
+    command = [sys.executable, '-c', statement]
+
+    def op():
+        subprocess.run(command, env=env, check=True)
+    return op
+
+
+def _register(name: str, statement: str):
+    @benchmark(f"import.{name}")
+    async def bench():
+        yield _import_op(statement)
+
+
+for _name, _statement in ENTRY_POINTS.items():
+    _register(_name, _statement)
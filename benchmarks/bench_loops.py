@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Операции, зависящие от реализации цикла событий. Сравнение циклов:
+    PYTHONPATH=src python -m benchmarks run -k loop. --loop asyncio -o asyncio.json
+    PYTHONPATH=src python -m benchmarks run -k loop. --loop uvloop -o uvloop.json
+    PYTHONPATH=src python -m benchmarks compare asyncio.json uvloop.json
+"""
+
+import asyncio
+
+from .harness import benchmark
+
+
+@benchmark("loop.tasks", items=1000, tasks=1000)
+async def loop_tasks(tasks):
+    async def noop():
+        pass
+
+    async def op():
+        await asyncio.gather(*(noop() for _ in range(tasks)))
+    yield op
+
+
+@benchmark("loop.call_soon", items=1000, callbacks=1000)
+async def loop_call_soon(callbacks):
+    loop = asyncio.get_running_loop()
+
+    async def op():
+        done = loop.create_future()
+        left = [callbacks]
+
+        def callback():
+            left[0] -= 1
+            if not left[0]:
+                done.set_result(None)
+        for _ in range(callbacks):
+            loop.call_soon(callback)
+        await done
+    yield op
+
+
+@benchmark("loop.tcp_roundtrip", items=100, messages=100)
+async def loop_tcp_roundtrip(messages):
+    async def echo(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            writer.write(line)
+        writer.close()
+
+    server = await asyncio.start_server(echo, '127.0.0.1', 0)
+    reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+    payload = b'x' * 200 + b'\n'
+
+    async def op():
+        for _ in range(messages):
+            writer.write(payload)
+            await reader.readline()
+    yield op
+
+    writer.close()
+    server.close()
+    await server.wait_closed()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки очередей исходящих вызовов Outbox и PersistentOutbox.
+"""
+
+import itertools
+import os
+import tempfile
+
+from bitrixogram.outbox import Outbox, PersistentOutbox
+
+from .bench_dispatch import NullBot
+from .harness import benchmark
+
+
+@benchmark("outbox.send_message", items=1000, messages=1000, chats=100)
+async def outbox_send(messages, chats):
+    outbox = Outbox(NullBot())
+
+    async def op():
+        for i in range(messages):
+            outbox.send_message(i % chats, "hello")
+        await outbox.flush()
+    yield op
+
+    await outbox.close()
+
+
+@benchmark("outbox.persistent.send_message", items=1000, messages=1000, chats=100)
+async def persistent_outbox_send(messages, chats):
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = PersistentOutbox(NullBot(), os.path.join(directory, 'outbox.db'))
+        await outbox.open()
+        keys = itertools.count()
+
+        async def op():
+            for i in range(messages):
+                outbox.send_message(i % chats, "hello", dedup_key=f"reply:{next(keys)}")
+            await outbox.flush()
+        yield op
+
+        await outbox.close()
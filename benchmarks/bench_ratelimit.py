@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки задержки команд при фоновой нагрузке с очередью FIFO и с классами приоритета.
+"""
+
+import asyncio
+
+from bitrixogram.core import BULK, Dispatcher, MagicFilter, PriorityRateLimiter, RateLimiter, Router, priority
+from bitrixogram.mockportal import command_event
+
+from .bench_dispatch import NullBot
+from .harness import benchmark
+
+F = MagicFilter()
+
+
+class LimitedBot(NullBot):
+    """
+    Бот без HTTP, запросы которого проходят через ограничитель частоты.
+    """
+
+    def __init__(self, rate_limiter):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+
+    async def _request(self, method, params=None):
+        await self.rate_limiter.acquire()
+        return await super()._request(method, params)
+
+
+async def _command_under_bulk(rate_limiter, backlog):
+    """
+    Нажатие кнопки, пока в очереди ограничителя ждут backlog вызовов массовой рассылки.
+    Операция - обработка команды, отвечающей одним сообщением.
+    """
+    bot = LimitedBot(rate_limiter)
+    router = Router()
+
+    @router.callback_query(F.command() == "menu")
+    async def menu(command, fsm):
+        await bot.send_message(command.get_chat_id(), "menu")
+
+    dispatcher = Dispatcher(bot)
+    dispatcher.add_router(router)
+    update = command_event(command="menu")
+
+    async def bulk():
+        with priority(BULK):
+            await bot.send_message(1, "news")
+
+    async def op():
+        tasks = [asyncio.ensure_future(bulk()) for _ in range(backlog)]
+        await asyncio.sleep(0)
+        await dispatcher.process_update(update)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return op
+
+
+@benchmark("ratelimit.command_under_bulk.fifo", rate=5000, backlog=200)
+async def command_under_bulk_fifo(rate, backlog):
+    yield await _command_under_bulk(RateLimiter(rate, 1), backlog)
+
+
+@benchmark("ratelimit.command_under_bulk.lanes", rate=5000, backlog=200)
+async def command_under_bulk_lanes(rate, backlog):
+    yield await _command_under_bulk(PriorityRateLimiter(rate, 1), backlog)
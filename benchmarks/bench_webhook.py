@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки разбора тел вебхуков.
+"""
+
+import asyncio
+import warnings
+
+from aiohttp import web
+from aiohttp.streams import StreamReader
+from aiohttp.test_utils import make_mocked_request
+
+from bitrixogram.core import Dispatcher, Router, WebhookListener
+from bitrixogram.formdata import WebhookUpdate, decode_form
+
+from .harness import benchmark
+from bitrixogram.mockportal import APPLICATION_TOKEN, command_event, encode_event, message_event
+
+
+_template = None
+
+
+def make_request(body: bytes):
+    """
+    Создает запрос aiohttp с заданным телом формы без сетевого соединения.
+
+    Заголовки, протокол и прочие заглушки создаются один раз, чтобы в измерение
+    попадала только работа aiohttp и bitrixogram с телом запроса.
+
+    Args:
+        body (bytes): Тело запроса.
+
+    Returns:
+        BaseRequest: Запрос aiohttp.
+    """
+    global _template
+    if _template is None:
+        request = make_mocked_request('POST', '/', headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            _template = (request.message, request.protocol, request.writer, request.task)
+    message, protocol, writer, task = _template
+    loop = asyncio.get_running_loop()
+    payload = StreamReader(protocol, 2 ** 16, loop=loop)
+    payload.feed_data(body)
+    payload.feed_eof()
+    return web.BaseRequest(message, payload, protocol, writer, task, loop)
+
+
+async def _decode(event: dict, decoder: str):
+    body = encode_event(event)
+    if decoder == 'post':
+        # прежний путь: MultiDict aiohttp, копия в dict и разбор ключей команды
+        router = Router()
+
+        async def op():
+            await router.parse_command_data(dict(await make_request(body).post()))
+    else:
+        listener = WebhookListener('127.0.0.1', 0, Dispatcher())
+
+        async def op():
+            (await listener.read_update(make_request(body))).command
+    yield op
+    if decoder != 'post':
+        await listener.close()
+
+
+@benchmark("webhook.decode.message", decoder='post')
+@benchmark("webhook.decode.message.stream", decoder='stream')
+async def decode_message(decoder):
+    async for op in _decode(message_event(), decoder):
+        yield op
+
+
+@benchmark("webhook.decode.command", decoder='post')
+@benchmark("webhook.decode.command.stream", decoder='stream')
+async def decode_command(decoder):
+    async for op in _decode(command_event(), decoder):
+        yield op
+
+
+@benchmark("webhook.decode_form.command")
+async def decode_form_command():
+    body = encode_event(command_event())
+
+    def op():
+        decode_form(body).command
+    yield op
+
+
+@benchmark("webhook.parse_command_data", update='dict')
+@benchmark("webhook.parse_command_data.update", update='WebhookUpdate')
+async def parse_command_data(update):
+    router = Router()
+    data = command_event() if update == 'dict' else WebhookUpdate(command_event())
+
+    async def op():
+        await router.parse_command_data(data)
+    yield op
+
+
+@benchmark("webhook.handle_post.message")
+async def handle_post_message():
+    router = Router()
+
+    @router.message()
+    async def handler(message, fsm):
+        pass
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    listener = WebhookListener('127.0.0.1', 0, dispatcher)
+    body = encode_event(message_event())
+
+    async def op():
+        await listener.handle_post(make_request(body))
+    yield op
+    await listener.close()
+
+
+@benchmark("webhook.handle_post.command")
+async def handle_post_command():
+    router = Router()
+
+    @router.callback_query()
+    async def handler(command, fsm):
+        pass
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    listener = WebhookListener('127.0.0.1', 0, dispatcher)
+    body = encode_event(command_event())
+
+    async def op():
+        await listener.handle_post(make_request(body))
+    yield op
+    await listener.close()
+
+
+@benchmark("webhook.handle_post.message.auth")
+async def handle_post_message_auth():
+    router = Router()
+
+    @router.message()
+    async def handler(message, fsm):
+        pass
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    listener = WebhookListener('127.0.0.1', 0, dispatcher, application_token=APPLICATION_TOKEN)
+    body = encode_event(message_event())
+
+    async def op():
+        await listener.handle_post(make_request(body))
+    yield op
+    await listener.close()
+
+
+@benchmark("webhook.handle_post.rejected")
+async def handle_post_rejected():
+    listener = WebhookListener('127.0.0.1', 0, Dispatcher(), application_token=APPLICATION_TOKEN)
+    body = encode_event(message_event(application_token='wrong'))
+
+    async def op():
+        await listener.handle_post(make_request(body))
+    yield op
+    await listener.close()
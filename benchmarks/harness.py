@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Регистрация, запуск и форматирование результатов бенчмарков.
+"""
+
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from bitrixogram.loops import loop_name
+
+
+BENCHMARKS: List['Benchmark'] = []
+
+
+class Benchmark:
+    """
+    Описание зарегистрированного бенчмарка.
+
+    Функция бенчмарка - асинхронный генератор: до yield выполняется подготовка, yield возвращает
+    измеряемую операцию (обычную или асинхронную функцию без аргументов), после yield - очистка.
+
+    Attributes:
+        name (str): Имя бенчмарка.
+        func (Callable): Асинхронный генератор подготовки.
+        params (Dict[str, Any]): Параметры, передаваемые в func.
+        items (int): Количество элементов, обрабатываемых одной операцией, для расчета пропускной способности.
+    """
+
+    def __init__(self, name: str, func: Callable, params: Dict[str, Any], items: int = 1):
+        self.name = name
+        self.func = func
+        self.params = params
+        self.items = items
+
+
+def benchmark(name: str, items: int = 1, **params):
+    """
+    Регистрирует бенчмарк.
+
+    Args:
+        name (str): Имя бенчмарка.
+        items (int, optional): Количество элементов в одной операции.
+        **params: Параметры бенчмарка.
+
+    Returns:
+        Callable: Декоратор.
+    """
+    def decorator(func: Callable):
+        BENCHMARKS.append(Benchmark(name, func, params, items))
+        return func
+    return decorator
+
+
+async def _time_op(op: Callable, number: int, is_async: bool) -> float:
+    """
+    Измеряет время выполнения операции number раз.
+
+    Args:
+        op (Callable): Операция.
+        number (int): Количество повторений.
+        is_async (bool): Операция асинхронная.
+
+    Returns:
+        float: Затраченное время в секундах.
+    """
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        if is_async:
+            start = time.perf_counter()
+            for _ in range(number):
+                await op()
+            return time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+async def run_benchmark(bench: Benchmark, rounds: int = 5, min_time: float = 0.2) -> Dict[str, Any]:
+    """
+    Выполняет бенчмарк: калибрует количество повторений и измеряет несколько раундов.
+
+    Args:
+        bench (Benchmark): Бенчмарк.
+        rounds (int, optional): Количество раундов измерения.
+        min_time (float, optional): Минимальная длительность раунда в секундах.
+
+    Returns:
+        Dict[str, Any]: Результат: время одной операции (min, median, mean, stdev) и пропускная способность.
+    """
+    random.seed(0)
+    gen = bench.func(**bench.params)
+    op = await gen.__anext__()
+    try:
+        is_async = asyncio.iscoroutinefunction(op)
+        number = 1
+        while True:
+            elapsed = await _time_op(op, number, is_async)
+            if elapsed >= min_time or number >= 1 << 24:
+                break
+            number *= 10 if elapsed < min_time / 10 else 2
+        timings = [await _time_op(op, number, is_async) / number for _ in range(rounds)]
+    finally:
+        try:
+            await gen.__anext__()
+        except StopAsyncIteration:
+            pass
+    median = statistics.median(timings)
+    return {
+        'params': bench.params,
+        'unit': 's/op',
+        'number': number,
+        'rounds': rounds,
+        'min': min(timings),
+        'median': median,
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if rounds > 1 else 0.0,
+        'items': bench.items,
+        'items_per_sec': bench.items / median if median else None,
+    }
+
+
+def free_port() -> int:
+    """
+    Возвращает свободный TCP-порт на 127.0.0.1.
+
+    Returns:
+        int: Номер порта.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def environment() -> Dict[str, Any]:
+    """
+    Собирает сведения об окружении для сопоставления результатов разных запусков.
+
+    Returns:
+        Dict[str, Any]: Версии Python, aiohttp, цикл событий, платформа и коммит.
+    """
+    try:
+        import aiohttp
+        aiohttp_version = aiohttp.__version__
+    except ImportError:
+        aiohttp_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'aiohttp': aiohttp_version,
+        'event_loop': loop_name(),
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+async def run_all(pattern: str = None, rounds: int = 5, min_time: float = 0.2, log: Callable[[str], None] = print) -> Dict[str, Any]:
+    """
+    Выполняет все зарегистрированные бенчмарки, имя которых содержит pattern.
+
+    Args:
+        pattern (str, optional): Подстрока имени для отбора бенчмарков.
+        rounds (int, optional): Количество раундов измерения.
+        min_time (float, optional): Минимальная длительность раунда в секундах.
+        log (Callable[[str], None], optional): Функция вывода прогресса.
+
+    Returns:
+        Dict[str, Any]: Сведения об окружении и результаты бенчмарков.
+    """
+    results = {}
+    for bench in BENCHMARKS:
+        if pattern and pattern not in bench.name:
+            continue
+        result = await run_benchmark(bench, rounds, min_time)
+        results[bench.name] = result
+        log(f"{bench.name:<45} {format_time(result['median']):>12}/op  ±{format_time(result['stdev']):>10}"
+            + (f"  {result['items_per_sec']:,.0f} items/s" if bench.items > 1 else ''))
+    return {'environment': environment(), 'benchmarks': results}
+
+
+def format_time(seconds: float) -> str:
+    """
+    Форматирует время в удобных единицах.
+
+    Args:
+        seconds (float): Время в секундах.
+
+    Returns:
+        str: Строка вида "12.3 us".
+    """
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.05) -> List[str]:
+    """
+    Сравнивает медианы двух запусков.
+
+    Args:
+        old (Dict[str, Any]): Результаты базового запуска.
+        new (Dict[str, Any]): Результаты нового запуска.
+        threshold (float, optional): Относительное изменение, начиная с которого результат помечается.
+
+    Returns:
+        List[str]: Строки отчета.
+    """
+    lines = [f"{'benchmark':<45} {'old':>12} {'new':>12} {'change':>9}"]
+    for name, result in new['benchmarks'].items():
+        base = old['benchmarks'].get(name)
+        if base is None:
+            lines.append(f"{name:<45} {'-':>12} {format_time(result['median']):>12} {'new':>9}")
+            continue
+        change = result['median'] / base['median'] - 1
+        mark = ''
+        if change > threshold:
+            mark = ' slower'
+        elif change < -threshold:
+            mark = ' faster'
+        lines.append(f"{name:<45} {format_time(base['median']):>12} {format_time(result['median']):>12} {change:>+8.1%}{mark}")
+    return lines
+
+
+def save(results: Dict[str, Any], path: str):
+    """
+    Сохраняет результаты в JSON.
+
+    Args:
+        results (Dict[str, Any]): Результаты.
+        path (str): Путь к файлу.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str) -> Dict[str, Any]:
+    """
+    Загружает результаты из JSON.
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        Dict[str, Any]: Результаты.
+    """
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор нагрузки на WebhookListener с открытой моделью нагрузки.
+
+Запросы отправляются по фиксированному расписанию независимо от времени ответа,
+задержки считаются от запланированного момента отправки, поэтому медленные ответы
+не снижают нагрузку и не скрывают хвост распределения (coordinated omission).
+
+Примеры:
+    PYTHONPATH=src python -m benchmarks.loadgen --rate 500 --duration 20 --dialogs 10000
+    PYTHONPATH=src python -m benchmarks.loadgen --sweep 250,500,1000,2000 --slo-p99 0.25 -o sweep.json
+    PYTHONPATH=src python -m benchmarks.loadgen --url http://10.0.0.5:8080/ --portal-port 9000 --rate 300
+
+По умолчанию бот-эхо, WebhookListener и MockPortal запускаются в этом же процессе. Задержка
+"ack" - время до ответа WebhookListener, "e2e" - время до получения порталом ответа бота
+imbot.message.add. Для внешнего бота (--url) e2e измеряется, если бот направлен на портал
+--portal-port и отвечает текстом полученного сообщения.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from bitrixogram.core import BitrixBot, Dispatcher, MagicFilter, Router, WebhookListener
+from bitrixogram.loops import run
+from bitrixogram.metrics import LatencyHistogram
+from bitrixogram.mockportal import MockPortal, command_event, encode_event, message_event
+
+from .harness import environment, format_time, free_port
+
+F = MagicFilter()
+TOKEN_PREFIX = 'lg:'
+
+
+def synthetic_events(dialogs: int, command_ratio: float = 0.0, seed: int = 0) -> Callable[[int], Dict[str, Any]]:
+    """
+    Возвращает генератор синтетических событий с меткой последовательности в тексте.
+
+    Args:
+        dialogs (int): Количество различных DIALOG_ID.
+        command_ratio (float, optional): Доля событий ONIMCOMMANDADD.
+        seed (int, optional): Начальное значение генератора случайных чисел.
+
+    Returns:
+        Callable[[int], Dict[str, Any]]: Функция (номер запроса) -> событие.
+    """
+    rng = random.Random(seed)
+
+    def make(seq: int) -> Dict[str, Any]:
+        dialog_id = rng.randrange(dialogs) + 1
+        if command_ratio and rng.random() < command_ratio:
+            return command_event('loadgen', f"{TOKEN_PREFIX}{seq}", dialog_id, seq + 1)
+        return message_event(f"{TOKEN_PREFIX}{seq}", dialog_id, seq + 1)
+    return make
+
+
+def recorded_events(path: str) -> Callable[[int], Dict[str, Any]]:
+    """
+    Возвращает генератор событий из файла JSON Lines (по одному плоскому событию в строке).
+    События повторяются по кругу.
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        Callable[[int], Dict[str, Any]]: Функция (номер запроса) -> событие.
+    """
+    with open(path, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return lambda seq: events[seq % len(events)]
+
+
+class EchoTracker:
+    """
+    Измеряет сквозную задержку: от запланированной отправки вебхука до вызова imbot.message.add
+    с меткой этого вебхука на портале.
+
+    Attributes:
+        histogram (LatencyHistogram): Сквозные задержки.
+        scheduled (Dict[str, float]): Запланированное время отправки по меткам.
+    """
+
+    def __init__(self, portal: MockPortal):
+        self.histogram = LatencyHistogram()
+        self.scheduled: Dict[str, float] = {}
+        self._add = portal._imbot_message_add
+        portal.handlers['imbot.message.add'] = self._on_message_add
+
+    def _on_message_add(self, params: Dict[str, Any]):
+        scheduled = self.scheduled.pop(str(params.get('MESSAGE', '')), None)
+        if scheduled is not None:
+            self.histogram.record(time.perf_counter() - scheduled)
+        return self._add(params)
+
+
+def echo_dispatcher(bot: BitrixBot) -> Dispatcher:
+    """
+    Создает диспетчер с ботом-эхо: на сообщение и команду отвечает их текстом или параметрами.
+
+    Args:
+        bot (BitrixBot): Бот.
+
+    Returns:
+        Dispatcher: Диспетчер.
+    """
+    router = Router()
+
+    @router.message(F.text())
+    async def echo_message(message, fsm):
+        await bot.send_message(message.get_chat_id(), message.get_text())
+
+    @router.callback_query(F.command())
+    async def echo_command(command, fsm):
+        await bot.send_message(command.get_chat_id(), command.get_command_params())
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    return dispatcher
+
+
+async def run_load(url: str, events: Callable[[int], Dict[str, Any]], rate: float, duration: float,
+                   tracker: EchoTracker = None, connections: int = 0, timeout: float = 30.0) -> Dict[str, Any]:
+    """
+    Выполняет один прогон с фиксированной частотой запросов.
+
+    Args:
+        url (str): Адрес WebhookListener.
+        events (Callable[[int], Dict[str, Any]]): Генератор событий.
+        rate (float): Запросов в секунду.
+        duration (float): Длительность прогона в секундах.
+        tracker (EchoTracker, optional): Измеритель сквозной задержки.
+        connections (int, optional): Ограничение количества соединений, 0 - без ограничения.
+        timeout (float, optional): Таймаут запроса в секундах.
+
+    Returns:
+        Dict[str, Any]: Результаты прогона.
+    """
+    ack = LatencyHistogram()
+    if tracker is not None:
+        tracker.histogram.reset()
+        tracker.scheduled.clear()
+    total = int(rate * duration)
+    bodies, tokens = [], []
+    for seq in range(total):
+        event = events(seq)
+        bodies.append(encode_event(event))
+        token = event.get('data[PARAMS][MESSAGE]') or event.get('data[COMMAND][12][COMMAND_PARAMS]')
+        tokens.append(token if token and token.startswith(TOKEN_PREFIX) else None)
+
+    errors = 0
+    completed = 0
+    late = LatencyHistogram()
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    session = ClientSession(connector=TCPConnector(limit=connections), timeout=ClientTimeout(total=timeout))
+
+    async def send(body: bytes, scheduled: float):
+        nonlocal errors, completed
+        try:
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+        except Exception:
+            errors += 1
+        ack.record(time.perf_counter() - scheduled)
+        completed += 1
+
+    tasks = []
+    start = time.perf_counter()
+    try:
+        for seq, body in enumerate(bodies):
+            scheduled = start + seq / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                late.record(-delay)
+            if tracker is not None and tokens[seq] is not None:
+                tracker.scheduled[tokens[seq]] = scheduled
+            tasks.append(asyncio.ensure_future(send(body, scheduled)))
+        await asyncio.gather(*tasks)
+        if tracker is not None:
+            deadline = time.perf_counter() + timeout
+            while tracker.scheduled and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+    finally:
+        await session.close()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'rate': rate,
+        'duration': duration,
+        'sent': total,
+        'completed': completed,
+        'errors': errors,
+        'throughput': completed / elapsed if elapsed else 0.0,
+        'ack': ack.to_dict(),
+        'generator_lag': late.summary(),
+    }
+    if tracker is not None:
+        result['e2e'] = tracker.histogram.to_dict()
+        result['e2e_missing'] = len(tracker.scheduled)
+    return result
+
+
+def is_saturated(result: Dict[str, Any], slo_p99: float, max_error_rate: float = 0.01) -> bool:
+    """
+    Проверяет, достигнуто ли насыщение: ошибки, превышение p99 или недостижение целевой частоты.
+
+    Args:
+        result (Dict[str, Any]): Результат прогона.
+        slo_p99 (float): Допустимый p99 задержки подтверждения в секундах.
+        max_error_rate (float, optional): Допустимая доля ошибок.
+
+    Returns:
+        bool: True, если система насыщена.
+    """
+    if result['errors'] > max_error_rate * result['sent']:
+        return True
+    if result['ack']['p99'] > slo_p99:
+        return True
+    return result['throughput'] < 0.9 * result['rate']
+
+
+def report(result: Dict[str, Any]) -> str:
+    line = (f"rate {result['rate']:>8.0f}/s  done {result['throughput']:>8.0f}/s  err {result['errors']:>5}  "
+            f"ack p50 {format_time(result['ack']['p50']):>9} p95 {format_time(result['ack']['p95']):>9} "
+            f"p99 {format_time(result['ack']['p99']):>9} p999 {format_time(result['ack']['p999']):>9}")
+    if result.get('e2e', {}).get('count'):
+        line += (f"  e2e p50 {format_time(result['e2e']['p50']):>9} p99 {format_time(result['e2e']['p99']):>9}"
+                 f" p999 {format_time(result['e2e']['p999']):>9}")
+    return line
+
+
+async def main_async(args) -> Dict[str, Any]:
+    portal = MockPortal(port=args.portal_port or 0, rate=args.portal_rate, burst=args.portal_burst,
+                        latency=args.portal_latency, record=False, seed=0)
+    await portal.start()
+    tracker = EchoTracker(portal)
+    runner = None
+    bot_session = None
+    listener = None
+    url = args.url
+    try:
+        if url is None:
+            bot_session = ClientSession(connector=TCPConnector(limit=0))
+            bot = BitrixBot(portal.endpoint, 'token', 1, bot_session)
+            listener = WebhookListener('127.0.0.1', free_port(), echo_dispatcher(bot))
+            app = web.Application()
+            app.router.add_post('/', listener.handle_post)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, listener.host, listener.port).start()
+            url = f"http://{listener.host}:{listener.port}/"
+
+        events = recorded_events(args.events) if args.events else synthetic_events(args.dialogs, args.command_ratio)
+        rates = [float(rate) for rate in args.sweep.split(',')] if args.sweep else [args.rate]
+        runs: List[Dict[str, Any]] = []
+        saturation = None
+        for rate in rates:
+            result = await run_load(url, events, rate, args.duration, tracker, args.connections, args.timeout)
+            runs.append(result)
+            print(report(result))
+            if args.sweep and is_saturated(result, args.slo_p99):
+                saturation = rate
+                break
+        if args.sweep:
+            good = [run['rate'] for run in runs if run['rate'] != saturation]
+            print(f"saturation at {saturation:.0f}/s, last good rate {good[-1] if good else 0:.0f}/s"
+                  if saturation else "no saturation reached")
+        return {'environment': environment(), 'args': vars(args), 'runs': runs, 'saturation': saturation}
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        if listener is not None:
+            await listener.close()
+        if bot_session is not None:
+            await bot_session.close()
+        await portal.stop()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadgen', description='open-loop load generator for WebhookListener')
+    parser.add_argument('--url', help='адрес внешнего WebhookListener, по умолчанию запускается бот-эхо')
+    parser.add_argument('--rate', type=float, default=200, help='запросов в секунду')
+    parser.add_argument('--duration', type=float, default=10, help='длительность прогона, с')
+    parser.add_argument('--dialogs', type=int, default=10000, help='количество различных DIALOG_ID')
+    parser.add_argument('--command-ratio', type=float, default=0.0, help='доля событий ONIMCOMMANDADD')
+    parser.add_argument('--events', help='файл JSON Lines с событиями для воспроизведения')
+    parser.add_argument('--connections', type=int, default=0, help='ограничение количества соединений клиента')
+    parser.add_argument('--timeout', type=float, default=30, help='таймаут запроса, с')
+    parser.add_argument('--sweep', help='список частот через запятую для поиска точки насыщения')
+    parser.add_argument('--slo-p99', type=float, default=0.5, help='допустимый p99 подтверждения при поиске насыщения, с')
+    parser.add_argument('--portal-port', type=int, help='порт MockPortal')
+    parser.add_argument('--portal-rate', type=float, default=None, help='ограничение частоты запросов портала')
+    parser.add_argument('--portal-burst', type=int, default=50, help='накопление запросов портала')
+    parser.add_argument('--portal-latency', type=float, default=0.0, help='задержка ответа портала, с')
+    parser.add_argument('--loop', default='asyncio', help='цикл событий: asyncio, uvloop или auto')
+    parser.add_argument('-o', '--output', help='файл JSON для результатов')
+    args = parser.parse_args(argv)
+
+    results = run(main_async(args), args.loop)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
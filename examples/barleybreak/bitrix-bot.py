@@ -5,11 +5,11 @@ Created on Sun May 19 13:58:21 2024
 @author: Aleksey Rublev RCBD.org
 """
 
-import asyncio
 from aiohttp import ClientSession
 import logging
 
 from bitrixogram.core import BitrixBot,WebhookListener,Dispatcher
+from bitrixogram.loops import run
 
 from handlers import barleybreak_handler
 
@@ -30,14 +30,11 @@ async def main():
         dp.add_router(barleybreak_handler.barleybreak_router(bx))                          
         
         webhooks = WebhookListener(host=config.server_whook_addr_ip, port=config.server_whook_port, dispatcher=dp)
-        await webhooks.start()
-        logger.info("Bitrix bot webhook listener started")
-        
-    
-        while True:
-            await asyncio.sleep(3600)
-            logging.info("Bitrix bot active...")
+        logger.info("Bitrix bot webhook listener starting")
+        # работает до SIGTERM/SIGINT, затем дожидается обработки принятых вебхуков и закрывает ресурсы
+        await webhooks.serve()
+        logger.info("Bitrix bot webhook listener stopped")
  
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
 
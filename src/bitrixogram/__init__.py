@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 12:20:09 2026
+
+@author: Aleksey Rublev RCBD.org
+
+Основные классы доступны из пакета и загружаются при первом обращении: построители клавиатур
+и вложений не загружают REST-клиент, REST-клиент не загружает сервер вебхуков.
+"""
+
+from .core import _EXPORTS as _CORE_EXPORTS, _load
+
+
+_EXPORTS = {
+    **_CORE_EXPORTS,
+    'ReplyKeyboardBuilder': 'keyboard',
+    'ReplyAttachMarkup': 'attach',
+    'ReplyAttachBuilder': 'attach',
+    'GridLayout': 'attach',
+    'MultiPortalListener': 'portals',
+    'SessionPool': 'portals',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    return _load(globals(), __name__, _EXPORTS, name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Результат и контрольная точка рассылки BitrixBot.broadcast.
+"""
+
+import os
+from typing import Any, Union, Iterable, AsyncIterable
+
+
+class BroadcastResult:
+    """
+    Результат отправки сообщения одному получателю рассылки.
+
+    Attributes:
+        chat_id (Union[int, str]): ID чата получателя.
+        result (Any): Результат метода imbot.message.add (ID сообщения).
+        error (Any): Ошибка отправки: исключение или описание ошибки от Bitrix24.
+    """
+
+    def __init__(self, chat_id: Union[int, str], result: Any = None, error: Any = None):
+        self.chat_id = chat_id
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """
+        Признак успешной отправки.
+
+        Returns:
+            bool: True, если сообщение доставлено.
+        """
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"BroadcastResult(chat_id={self.chat_id}, result={self.result})"
+        return f"BroadcastResult(chat_id={self.chat_id}, error={self.error})"
+
+
+class BroadcastCheckpoint:
+    """
+    Контрольная точка рассылки: файл с ID чатов, которым сообщение уже доставлено.
+
+    Прерванную рассылку можно запустить повторно с той же контрольной точкой,
+    уже обслуженные получатели будут пропущены. Используется как контекстный менеджер
+    или закрывается методом close.
+
+    Attributes:
+        path (str): Путь к файлу контрольной точки.
+        done (set): Множество ID обслуженных чатов.
+    """
+
+    def __init__(self, path: str):
+        """
+        Загружает контрольную точку из файла, если он существует.
+
+        Args:
+            path (str): Путь к файлу контрольной точки.
+        """
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done.update(line.strip() for line in f if line.strip())
+        self._file = None
+
+    def __contains__(self, chat_id) -> bool:
+        return str(chat_id) in self.done
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def mark(self, chat_id: Union[int, str]):
+        """
+        Отмечает чат как обслуженный.
+
+        Args:
+            chat_id (Union[int, str]): ID чата.
+        """
+        key = str(chat_id)
+        if key in self.done:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(key + '\n')
+        self.done.add(key)
+
+    def flush(self):
+        """
+        Сбрасывает отметки на диск.
+        """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """
+        Закрывает файл контрольной точки.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'BroadcastCheckpoint':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+async def aiter_items(items: Union[Iterable, AsyncIterable]):
+    """
+    Итерирует обычный или асинхронный итерируемый объект.
+
+    Args:
+        items (Union[Iterable, AsyncIterable]): Источник элементов.
+    """
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
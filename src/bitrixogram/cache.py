@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+"""
+Кеширование ответов REST API и обработчиков, объединение одинаковых запросов.
+"""
+
+import asyncio
+import contextvars
+import fnmatch
+import functools
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .client import BitrixBot
+    from .dispatcher import Message
+    from .fsm import FSMContext, State
+    from .outbox import Outbox
+
+
+DEFAULT_TTL = {
+    'user.get': 300,
+    'user.current': 300,
+    'im.user.get': 300,
+    'im.user.list.get': 300,
+    'im.dialog.get': 60,
+    'im.chat.get': 60,
+    'im.dialog.users.list': 60,
+    'department.get': 600,
+}
+
+DEFAULT_INVALIDATE_ON = {
+    'ONIMBOTJOINCHAT': ('im.dialog.get', 'im.chat.get', 'im.dialog.users.list'),
+    'ONUSERADD': ('user.get', 'im.user.get', 'im.user.list.get', 'department.get'),
+}
+
+DEFAULT_SINGLE_FLIGHT = ('*.get', '*.list', '*.search', 'user.current', 'profile')
+
+
+def normalize_params(value: Any) -> Hashable:
+    """
+    Приводит параметры запроса к хешируемому виду, не зависящему от порядка ключей.
+
+    Args:
+        value (Any): Параметры запроса.
+
+    Returns:
+        Hashable: Нормализованные параметры.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), normalize_params(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_params(item) for item in value)
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def copy_result(value: Any) -> Any:
+    """
+    Копирует ответ API (вложенные словари и списки), чтобы вызывающие не изменяли общий ответ.
+
+    Args:
+        value (Any): Ответ API.
+
+    Returns:
+        Any: Копия ответа.
+    """
+    if isinstance(value, dict):
+        return {key: copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_result(item) for item in value]
+    return value
+
+
+class _LeaderCancelled(Exception):
+    """
+    Выполнявший запрос вызов отменен: ожидающие вызовы повторяют запрос.
+    """
+
+
+def make_key(method: str, params: Dict[str, Any] = None) -> Tuple[str, Hashable]:
+    """
+    Формирует ключ запроса из метода и нормализованных параметров.
+
+    Args:
+        method (str): Метод API.
+        params (Dict[str, Any], optional): Параметры метода.
+
+    Returns:
+        Tuple[str, Hashable]: Ключ запроса.
+    """
+    return method, normalize_params(params or {})
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых запросов к REST API в один HTTP-запрос.
+
+    Пока запрос с ключом (метод, параметры) выполняется, повторные вызовы с тем же ключом
+    не отправляются на портал, а получают результат выполняющегося запроса. Объединяются
+    только методы из списка разрешенных, чтобы изменяющие методы (например, imbot.message.add)
+    выполнялись при каждом вызове. Присоединившиеся вызовы получают копию ответа. Если вызов,
+    выполняющий запрос, отменен, один из присоединившихся выполняет запрос заново.
+
+    Attributes:
+        allow (Tuple[str, ...]): Шаблоны fnmatch разрешенных методов.
+        calls (int): Количество запросов, отправленных на портал.
+        collapsed (int): Количество вызовов, получивших результат уже выполняющегося запроса.
+    """
+
+    def __init__(self, allow: Iterable[str] = DEFAULT_SINGLE_FLIGHT):
+        """
+        Инициализирует объединение запросов.
+
+        Args:
+            allow (Iterable[str], optional): Шаблоны fnmatch разрешенных методов. По умолчанию DEFAULT_SINGLE_FLIGHT.
+        """
+        self.allow = tuple(allow)
+        self.calls = 0
+        self.collapsed = 0
+        self._allowed: Dict[str, bool] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def is_allowed(self, method: str) -> bool:
+        """
+        Проверяет, можно ли объединять вызовы метода.
+
+        Args:
+            method (str): Метод API.
+
+        Returns:
+            bool: True, если метод соответствует одному из разрешенных шаблонов.
+        """
+        allowed = self._allowed.get(method)
+        if allowed is None:
+            allowed = self._allowed[method] = any(fnmatch.fnmatchcase(method, pattern) for pattern in self.allow)
+        return allowed
+
+    async def run(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет loader или присоединяется к уже выполняющемуся вызову с тем же ключом.
+
+        Args:
+            key (Hashable): Ключ запроса, см. make_key.
+            loader (Callable[[], Awaitable[Any]]): Функция, выполняющая запрос к порталу.
+
+        Returns:
+            Any: Ответ API.
+        """
+        future = self._inflight.get(key)
+        while future is not None:
+            self.collapsed += 1
+            try:
+                return copy_result(await asyncio.shield(future))
+            except _LeaderCancelled:
+                # первый проснувшийся становится новым исполнителем, остальные присоединяются к нему
+                self.collapsed -= 1
+                future = self._inflight.get(key)
+
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await loader()
+        except BaseException as e:
+            future.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+
+class RestCache:
+    """
+    Асинхронный кеш ответов методов REST API, используемых только для чтения.
+
+    Кешируются только методы, для которых задано время жизни записи. Одновременные
+    одинаковые запросы объединяются в один HTTP-запрос, результат которого получают все вызывающие.
+    Каждый вызывающий получает собственную копию ответа, поэтому ее можно изменять.
+
+    Attributes:
+        ttl (Dict[str, float]): Время жизни записей в секундах по методам.
+        max_size (int): Максимальное количество записей, при превышении вытесняются давно не использованные.
+        invalidate_on (Dict[str, Iterable[str]]): Методы, записи которых сбрасываются при получении события.
+        hits (int): Количество ответов из кеша.
+        misses (int): Количество запросов к порталу.
+        collapsed (int): Количество запросов, объединенных с уже выполняющимся.
+    """
+
+    def __init__(self, ttl: Dict[str, float] = None, max_size: int = 1024, invalidate_on: Dict[str, Iterable[str]] = None):
+        """
+        Инициализирует кеш.
+
+        Args:
+            ttl (Dict[str, float], optional): Время жизни записей по методам. По умолчанию DEFAULT_TTL.
+            max_size (int, optional): Максимальное количество записей. По умолчанию 1024.
+            invalidate_on (Dict[str, Iterable[str]], optional): Сброс методов по событиям. По умолчанию DEFAULT_INVALIDATE_ON.
+        """
+        self.ttl = dict(DEFAULT_TTL if ttl is None else ttl)
+        self.max_size = max_size
+        self.invalidate_on = dict(DEFAULT_INVALIDATE_ON if invalidate_on is None else invalidate_on)
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]' = OrderedDict()
+        self._flight = SingleFlight(allow=('*',))
+        self._generation = 0
+
+    def is_cacheable(self, method: str) -> bool:
+        """
+        Проверяет, кешируются ли ответы метода.
+
+        Args:
+            method (str): Метод API.
+
+        Returns:
+            bool: True, если для метода задано время жизни записей.
+        """
+        return method in self.ttl
+
+    @property
+    def collapsed(self) -> int:
+        """
+        Количество запросов, объединенных с уже выполняющимся.
+
+        Returns:
+            int: Количество объединенных запросов.
+        """
+        return self._flight.collapsed
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Доля ответов из кеша.
+
+        Returns:
+            float: Отношение попаданий к общему количеству запросов.
+        """
+        total = self.hits + self.misses + self.collapsed
+        return (self.hits + self.collapsed) / total if total else 0.0
+
+    async def fetch(self, method: str, params: Dict[str, Any], loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает ответ из кеша или выполняет запрос через loader.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any]): Параметры метода.
+            loader (Callable[[], Awaitable[Any]]): Функция, выполняющая запрос к порталу.
+
+        Returns:
+            Any: Ответ API.
+        """
+        key = make_key(method, params)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy_result(entry[1])
+            del self._entries[key]
+
+        return await self._flight.run(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: Tuple[str, Hashable], loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет запрос к порталу и сохраняет успешный ответ.
+
+        Args:
+            key (Tuple[str, Hashable]): Ключ запроса.
+            loader (Callable[[], Awaitable[Any]]): Функция, выполняющая запрос к порталу.
+
+        Returns:
+            Any: Ответ API.
+        """
+        self.misses += 1
+        generation = self._generation
+        result = await loader()
+        if generation == self._generation and not (isinstance(result, dict) and 'error' in result):
+            self._store(key, copy_result(result))
+        return result
+
+    def _store(self, key: Tuple[str, Hashable], value: Any):
+        """
+        Сохраняет запись, вытесняя давно не использованные при превышении размера.
+
+        Args:
+            key (Tuple[str, Hashable]): Ключ запроса.
+            value (Any): Ответ API.
+        """
+        self._entries[key] = (time.monotonic() + self.ttl[key[0]], value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, method: str = None, params: Dict[str, Any] = None):
+        """
+        Сбрасывает записи кеша.
+
+        Args:
+            method (str, optional): Метод API. Если не задан, кеш очищается полностью.
+            params (Dict[str, Any], optional): Параметры метода. Если не заданы, сбрасываются все записи метода.
+        """
+        self._generation += 1
+        if method is None:
+            self._entries.clear()
+        elif params is not None:
+            self._entries.pop(make_key(method, params), None)
+        else:
+            for key in [key for key in self._entries if key[0] == method]:
+                del self._entries[key]
+
+    async def on_update(self, update: Dict[str, Any]):
+        """
+        Сбрасывает записи методов, связанных с событием обновления.
+
+        Подключается к диспетчеру через Dispatcher.add_update_hook.
+
+        Args:
+            update (Dict[str, Any]): Данные обновления.
+        """
+        for method in self.invalidate_on.get(update.get('event'), ()):
+            self.invalidate(method)
+
+
+@functools.lru_cache(maxsize=256)
+def is_read_method(method: str) -> bool:
+    """
+    Проверяет, что метод REST API только читает данные (шаблоны DEFAULT_SINGLE_FLIGHT).
+
+    Args:
+        method (str): Метод API.
+
+    Returns:
+        bool: True для методов чтения.
+    """
+    return any(fnmatch.fnmatchcase(method, pattern) for pattern in DEFAULT_SINGLE_FLIGHT)
+
+
+class _ReplyCapture:
+    """
+    Ответы обработчика, записанные во время его выполнения в HandlerCache.
+    """
+
+    __slots__ = ('chat_id', 'replies', 'pure')
+
+    def __init__(self, chat_id: Any):
+        self.chat_id = str(chat_id)
+        self.replies: List[Tuple['BitrixBot', Optional['Outbox'], Dict[str, Any]]] = []
+        self.pure = True
+
+
+_capture: contextvars.ContextVar[Optional[_ReplyCapture]] = contextvars.ContextVar('bitrixogram_reply_capture', default=None)
+
+
+def capture_request(bot: 'BitrixBot', method: str, params: Optional[Dict[str, Any]], outbox: 'Outbox' = None):
+    """
+    Записывает вызов REST API, если он выполняется обработчиком с HandlerCache.
+
+    Сообщения в чат обработчика (imbot.message.add) сохраняются как ответ, методы чтения
+    пропускаются, любой другой вызов делает ответ некешируемым.
+
+    Args:
+        bot (BitrixBot): Бот, выполняющий вызов.
+        method (str): Метод API.
+        params (Optional[Dict[str, Any]]): Параметры метода.
+        outbox (Outbox, optional): Очередь, в которую поставлен вызов, если он выполняется не напрямую.
+    """
+    capture = _capture.get()
+    if capture is None:
+        return
+    if method == 'imbot.message.add' and params and str(params.get('DIALOG_ID')) == capture.chat_id:
+        reply = bot.flatten_params(params)
+        del reply['DIALOG_ID']
+        capture.replies.append((bot, outbox, reply))
+    elif not is_read_method(method):
+        capture.pure = False
+
+
+class HandlerCache:
+    """
+    Кеш ответов обработчиков сообщений, которые зависят только от текста и состояния
+    (например, ответы на частые вопросы).
+
+    При первом вызове обработчик выполняется как обычно, а отправленные им в чат сообщения
+    (imbot.message.add с текстом, вложениями и клавиатурой) запоминаются в готовом для отправки
+    виде. Повторный вызов с тем же ключом отправляет сохраненные сообщения, не выполняя
+    обработчик, тем же путем, которым их отправил обработчик: напрямую через бота или
+    через очередь Outbox (повторная отправка ставится в очередь без dedup_key). Ответ не сохраняется, если обработчик вызвал изменяющие методы REST API,
+    писал в другой чат или изменил состояние FSM. Изменения данных FSM не отслеживаются.
+
+    Attributes:
+        ttl (float): Время жизни записи в секундах.
+        max_size (int): Максимальное количество записей, при превышении вытесняются давно не использованные.
+        hits (int): Количество ответов из кеша.
+        misses (int): Количество вызовов обработчика.
+        skipped (int): Количество вызовов, результат которых нельзя кешировать.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 1024, key: Callable[['Message', Optional['State']], Hashable] = None):
+        """
+        Инициализирует кеш.
+
+        Args:
+            ttl (float, optional): Время жизни записи в секундах. По умолчанию 300.
+            max_size (int, optional): Максимальное количество записей. По умолчанию 1024.
+            key (Callable[[Message, Optional[State]], Hashable], optional): Ключ записи по сообщению
+                и состоянию. По умолчанию текст без учета регистра и лишних пробелов и состояние.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.key = key or self.default_key
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Tuple[Tuple[BitrixBot, Optional[Outbox], Dict[str, Any]], ...]]]' = OrderedDict()
+
+    @staticmethod
+    def default_key(message: 'Message', state: Optional['State']) -> Hashable:
+        """
+        Ключ по умолчанию: нормализованный текст и состояние.
+
+        Args:
+            message (Message): Сообщение.
+            state (Optional[State]): Текущее состояние.
+
+        Returns:
+            Hashable: Ключ записи.
+        """
+        return ' '.join(message.get_text().lower().split()), state
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Доля ответов из кеша.
+
+        Returns:
+            float: Отношение попаданий к общему количеству вызовов.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Статистика кеша.
+
+        Returns:
+            Dict[str, Any]: hits, misses, skipped, hit_ratio и size.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'skipped': self.skipped,
+                'hit_ratio': self.hit_ratio, 'size': len(self._entries)}
+
+    def invalidate(self):
+        """
+        Очищает кеш.
+        """
+        self._entries.clear()
+
+    def wrap(self, handler: Callable[['Message', 'FSMContext'], Awaitable[Any]]) -> Callable[['Message', 'FSMContext'], Awaitable[Any]]:
+        """
+        Оборачивает обработчик сообщений кешем. Используется Router.message(..., cache=...).
+
+        Args:
+            handler (Callable[[Message, FSMContext], Awaitable[Any]]): Обработчик.
+
+        Returns:
+            Callable[[Message, FSMContext], Awaitable[Any]]: Обработчик с кешем.
+        """
+        @functools.wraps(handler)
+        async def cached_handler(message: 'Message', fsm_context: 'FSMContext'):
+            state = await fsm_context.get_state()
+            key = (message.bot, self.key(message, state))
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    chat_id = message.get_chat_id()
+                    for bot, outbox, reply in entry[1]:
+                        if outbox is not None:
+                            outbox.submit('imbot.message.add', {'DIALOG_ID': chat_id, **reply}, chat_id)
+                        else:
+                            await bot.rest_command('imbot.message.add', {'DIALOG_ID': chat_id, **reply})
+                    return None
+                del self._entries[key]
+
+            self.misses += 1
+            capture = _ReplyCapture(message.get_chat_id())
+            token = _capture.set(capture)
+            try:
+                result = await handler(message, fsm_context)
+            finally:
+                _capture.reset(token)
+            if capture.pure and capture.replies and await fsm_context.get_state() == state:
+                self._entries[key] = (time.monotonic() + self.ttl, tuple(capture.replies))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                self.skipped += 1
+            return result
+        return cached_handler
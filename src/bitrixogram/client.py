@@ -0,0 +1,856 @@
+# -*- coding: utf-8 -*-
+"""
+REST-клиент бота Bitrix24.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Optional, Union, Iterable, AsyncIterable, Tuple
+from urllib.parse import urlencode
+
+from .ratelimit import BACKGROUND, BULK, RateLimiter, priority
+from .broadcast import BroadcastResult, BroadcastCheckpoint, aiter_items
+from .cache import RestCache, SingleFlight, capture_request, make_key
+from .dispatcher import Dispatcher
+from .fsm import FSM
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
+    from .dispatcher import Command, Message
+    from .keyboard import ReplyKeyboardMarkup
+    from .outbox import Outbox
+
+
+class BitrixError(Exception):
+    """
+    Ошибка, возвращенная методом REST API Bitrix24.
+
+    Attributes:
+        error (str): Код ошибки, например QUERY_LIMIT_EXCEEDED.
+        description (str): Описание ошибки.
+        response (Any): Исходный ответ API.
+    """
+
+    def __init__(self, error: str, description: str = '', response: Any = None):
+        super().__init__(f"{error}: {description}" if description else error)
+        self.error = error
+        self.description = description
+        self.response = response
+
+    @classmethod
+    def from_response(cls, response: Dict[str, Any]) -> 'BitrixError':
+        """
+        Создает исключение из ответа API с полями error и error_description.
+
+        Args:
+            response (Dict[str, Any]): Ответ API.
+
+        Returns:
+            BitrixError: Исключение.
+        """
+        return cls(str(response.get('error')), str(response.get('error_description', '')), response)
+
+
+class BitrixBot:
+    """
+    Класс для взаимодействия с Bitrix24 через чат-бот.
+
+    Атрибуты:
+        bot_token (str): Токен для авторизации бота.
+        base_url (str): URL для взаимодействия с Bitrix24.
+        base_id (str): ID бота.
+        dispatcher (Dispatcher): Диспетчер для обработки сообщений.
+        fsm (FSM): Машина состояний для обработки состояний сообщений.
+        session (ClientSession): Сессия для выполнения HTTP-запросов.
+        rate_limiter (RateLimiter): Ограничитель частоты запросов к REST API.
+        cache (RestCache): Кеш ответов методов REST API только для чтения.
+        single_flight (SingleFlight): Объединение одновременных одинаковых запросов к REST API.
+        outbox (Outbox): Очередь исходящих вызовов, создается при первом обращении.
+    """
+
+    def __init__(self, bot_endpoint:str,  bot_token: str,bot_id:str, session: 'ClientSession', rate_limiter: RateLimiter = None, cache: RestCache = None, single_flight: SingleFlight = None):
+        """
+        Инициализирует BitrixBot с заданными параметрами.
+
+        Args:
+            bot_endpoint (str): Базовый URL для Bitrix24.
+            bot_token (str): Токен для авторизации.
+            bot_id (str): ID бота.
+            session (ClientSession): Сессия для выполнения HTTP-запросов.
+            rate_limiter (RateLimiter, optional): Ограничитель частоты запросов к REST API.
+            cache (RestCache, optional): Кеш ответов методов REST API только для чтения.
+            single_flight (SingleFlight, optional): Объединение одновременных одинаковых запросов к REST API.
+        """
+        self.bot_token = bot_token
+        self.base_url = bot_endpoint
+        self.base_id = bot_id
+        self.dispatcher = Dispatcher()
+        self.fsm = FSM()        
+        self.session = session  
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.single_flight = single_flight
+        self._outbox = None
+        self._broadcast_limiter = None
+
+    @property
+    def outbox(self) -> 'Outbox':
+        """
+        Очередь исходящих вызовов бота: bot.outbox.send_message(...) ставит сообщение в очередь
+        и не ожидает ответа портала. Для других параметров очереди присвойте bot.outbox = Outbox(bot, ...).
+
+        Returns:
+            Outbox: Очередь исходящих вызовов.
+        """
+        if self._outbox is None:
+            from .outbox import Outbox
+            self._outbox = Outbox(self)
+        return self._outbox
+
+    @outbox.setter
+    def outbox(self, outbox: 'Outbox'):
+        self._outbox = outbox
+                
+    async def register_commands(self,commands, ip_whook_endpoint: str = None, manifest_path: str = None, concurrency: int = 4):
+        """
+        Регистрирует команды для бота в Bitrix24.
+
+        Bitrix24 не позволяет получить список зарегистрированных команд, поэтому состояние
+        последней регистрации хранится в файле манифеста manifest_path. По манифесту вычисляется
+        разница с требуемым набором команд и выполняются только необходимые вызовы
+        register/update/unregister, сгруппированные в пакеты batch. Если набор команд не изменился,
+        обращения к API не выполняются. Без манифеста команда могла остаться на портале от прошлого
+        развертывания, поэтому зарегистрированные команды сразу обновляются, а ошибка "команда уже
+        зарегистрирована" не считается ошибкой: команда записывается в манифест с ID из ответа портала
+        и обновляется, а если портал не вернул ID, больше не регистрируется повторно.
+    
+        Args:
+            commands (list): Список команд для регистрации.
+            ip_whook_endpoint: Ip адрес и порт для обработки команд http://xx.xx.xx.xx:XXXX/
+            manifest_path (str, optional): Путь к файлу манифеста. Без него регистрируются все команды.
+            concurrency (int, optional): Максимальное количество одновременно выполняемых пакетов.
+
+        Returns:
+            dict: Итог регистрации: списки registered, updated, unregistered, existing
+                (уже зарегистрированные команды) и словарь errors по именам команд.
+        """
+        desired = {}
+        for command in commands:
+            if ip_whook_endpoint:            
+                command_whook = ip_whook_endpoint
+            else:
+                command_whook = command.get('EVENT_COMMAND_ADD')
+            desired[command['COMMAND']] = {
+                'COMMON': 'Y',
+                'HIDDEN': 'Y',
+                'EXTRANET_SUPPORT': 'N',
+                'CLIENT_ID': self.bot_token,
+                'LANG': [{'LANGUAGE_ID': 'en', 'TITLE': command['TITLE'], 'PARAMS': command['PARAMS']}],                
+                'EVENT_COMMAND_ADD': command_whook
+            }
+        hashes = {name: self._manifest_hash(fields) for name, fields in desired.items()}
+        manifest_hash = self._manifest_hash({'BOT_ID': self.base_id, 'COMMANDS': hashes})
+        summary = {'registered': [], 'updated': [], 'unregistered': [], 'existing': [], 'errors': {}}
+
+        manifest = {}
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('BOT_ID') != self.base_id:
+                manifest = {}
+        if manifest.get('HASH') == manifest_hash:
+            logging.info("register_commands: commands are up to date")
+            return summary
+        applied = manifest.get('COMMANDS', {})
+        # без манифеста команда могла остаться от прошлого развертывания: register вернет ее ID,
+        # не изменив ее, поэтому после регистрации команды обновляются
+        adopt = not applied
+
+        # ключи пакета не зависят от имен команд: действие и имя хранятся отдельно
+        actions: Dict[str, Tuple[str, str]] = {}
+        calls = {}
+
+        def add_call(action: str, name: str, method: str, params: Dict[str, Any]):
+            key = f"c{len(actions)}"
+            actions[key] = (action, name)
+            calls[key] = (method, params)
+
+        for name, fields in desired.items():
+            known = applied.get(name)
+            if known is None or (not known.get('ID') and known.get('HASH') != hashes[name]):
+                add_call('register', name, 'imbot.command.register', {'BOT_ID': self.base_id, 'COMMAND': name, **fields})
+            elif known.get('ID') and known.get('HASH') != hashes[name]:
+                add_call('update', name, 'imbot.command.update', {'BOT_ID': self.base_id, 'COMMAND_ID': known['ID'], 'FIELDS': fields})
+        for name, known in list(applied.items()):
+            if name in desired:
+                continue
+            if known.get('ID'):
+                add_call('unregister', name, 'imbot.command.unregister', {'BOT_ID': self.base_id, 'COMMAND_ID': known['ID']})
+            else:
+                logging.warning(f"register_commands: command {name} cannot be unregistered, its ID is unknown")
+                del applied[name]
+
+        errors = {}
+        while calls:
+            with priority(BACKGROUND):
+                results, call_errors = await self._batch_calls(calls, concurrency)
+            calls = {}
+            for key, result in results.items():
+                action, name = actions[key]
+                if action == 'register' and adopt:
+                    applied[name] = {'ID': result, 'HASH': None}
+                    summary['registered'].append(name)
+                    add_call('update', name, 'imbot.command.update',
+                             {'BOT_ID': self.base_id, 'COMMAND_ID': result, 'FIELDS': desired[name]})
+                elif action == 'register':
+                    applied[name] = {'ID': result, 'HASH': hashes[name]}
+                    summary['registered'].append(name)
+                elif action == 'update':
+                    if applied[name]['HASH'] is not None or name in summary['existing']:
+                        summary['updated'].append(name)
+                    applied[name]['HASH'] = hashes[name]
+                else:
+                    applied.pop(name, None)
+                    summary['unregistered'].append(name)
+            for key, error in call_errors.items():
+                action, name = actions[key]
+                if action == 'register' and self._command_exists(error):
+                    # команда осталась от прошлого развертывания без манифеста
+                    command_id = self._existing_command_id(error)
+                    summary['existing'].append(name)
+                    if command_id:
+                        applied[name] = {'ID': command_id, 'HASH': None}
+                        add_call('update', name, 'imbot.command.update',
+                                 {'BOT_ID': self.base_id, 'COMMAND_ID': command_id, 'FIELDS': desired[name]})
+                    else:
+                        logging.warning(f"register_commands: command {name} is already registered, its ID is unknown")
+                        applied[name] = {'ID': None, 'HASH': hashes[name]}
+                    continue
+                errors[name] = error
+        summary['errors'] = errors
+        if errors:
+            logging.error(f"register_commands errors: {errors}")
+
+        if manifest_path:
+            manifest = {'BOT_ID': self.base_id, 'HASH': None if errors else manifest_hash, 'COMMANDS': applied}
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return summary
+
+    @staticmethod
+    def _command_exists(error: Any) -> bool:
+        """
+        Проверяет, что ошибка imbot.command.register означает уже зарегистрированную команду.
+
+        Args:
+            error (Any): Ошибка команды пакета.
+
+        Returns:
+            bool: True для ошибок вида COMMAND_EXISTS / "already registered".
+        """
+        if not isinstance(error, dict):
+            return False
+        text = f"{error.get('error', '')} {error.get('error_description', '')}".upper().replace('_', ' ')
+        if 'NOT EXIST' in text or "N'T EXIST" in text:
+            return False
+        return 'EXIST' in text or 'ALREADY' in text
+
+    @staticmethod
+    def _existing_command_id(error: Dict[str, Any]) -> Optional[int]:
+        """
+        Возвращает ID уже зарегистрированной команды из ответа с ошибкой, если портал его передал.
+
+        Args:
+            error (Dict[str, Any]): Ошибка команды пакета.
+
+        Returns:
+            Optional[int]: ID команды или None.
+        """
+        for field in ('result', 'COMMAND_ID', 'ID', 'error_data'):
+            value = error.get(field)
+            if isinstance(value, dict):
+                value = value.get('COMMAND_ID') or value.get('ID')
+            if isinstance(value, (int, str)) and str(value).isdigit() and int(value):
+                return int(value)
+        return None
+
+    @staticmethod
+    def _manifest_hash(data: Any) -> str:
+        """
+        Вычисляет хеш описания команд для манифеста.
+
+        Args:
+            data (Any): Сериализуемые в JSON данные.
+
+        Returns:
+            str: Хеш SHA-256.
+        """
+        return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _parse_batch(response: Dict[str, Any], keys: Iterable[str]):
+        """
+        Разбирает ответ метода batch на результаты и ошибки отдельных команд.
+
+        Args:
+            response (Dict[str, Any]): Ответ метода batch.
+            keys (Iterable[str]): Ключи команд пакета.
+
+        Returns:
+            Tuple[dict, dict]: Результаты и ошибки команд по ключам.
+        """
+        if 'error' in response:
+            return {}, {key: response for key in keys}
+        payload = response.get('result') or {}
+        batch_results = payload.get('result') or {}
+        batch_errors = payload.get('result_error') or {}
+        if not isinstance(batch_results, dict):
+            batch_results = {}
+        if not isinstance(batch_errors, dict):
+            batch_errors = {}
+        results, errors = {}, {}
+        for key in keys:
+            if key in batch_errors:
+                errors[key] = batch_errors[key]
+            elif key in batch_results:
+                results[key] = batch_results[key]
+            else:
+                errors[key] = {'error': 'NO_RESULT'}
+        return results, errors
+
+    async def _batch_calls(self, calls: Dict[str, Tuple[str, Dict[str, Any]]], concurrency: int = 4):
+        """
+        Выполняет произвольное количество вызовов API пакетами batch по 50 команд.
+
+        Args:
+            calls (Dict[str, Tuple[str, Dict[str, Any]]]): Словарь {ключ: (метод, параметры)}.
+            concurrency (int, optional): Максимальное количество одновременно выполняемых пакетов.
+
+        Returns:
+            Tuple[dict, dict]: Результаты и ошибки вызовов по ключам.
+        """
+        results, errors = {}, {}
+        keys = list(calls)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run_chunk(chunk_keys):
+            async with semaphore:
+                try:
+                    response = await self.batch({key: calls[key] for key in chunk_keys})
+                except Exception as e:
+                    logging.exception("batch error")
+                    errors.update({key: e for key in chunk_keys})
+                    return
+            chunk_results, chunk_errors = self._parse_batch(response, chunk_keys)
+            results.update(chunk_results)
+            errors.update(chunk_errors)
+
+        await asyncio.gather(*(run_chunk(keys[i:i + 50]) for i in range(0, len(keys), 50)))
+        return results, errors
+      
+
+    async def send_message(self, chat_id: int, text: str, attach:Dict[str, Any] = None, keyboard: 'ReplyKeyboardMarkup' = None):
+        """
+        Отправляет сообщение в чат.
+
+        Args:
+            chat_id (int): ID чата.
+            text (str): Текст сообщения.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+        """
+        data = self._message_data(chat_id, text, attach, keyboard)
+        logging.debug(f"send_message data: {data}")            
+        response = await self.rest_command("imbot.message.add", params=data)
+        return response
+
+    def _message_data(self, chat_id: int, text: str, attach:Dict[str, Any] = None, keyboard: 'ReplyKeyboardMarkup' = None) -> Dict[str, Any]:
+        """
+        Формирует параметры метода imbot.message.add.
+
+        Args:
+            chat_id (int): ID чата.
+            text (str): Текст сообщения.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+
+        Returns:
+            dict: Параметры сообщения.
+        """
+        data = {
+            'DIALOG_ID': chat_id,
+            'MESSAGE': text,
+        }
+        if attach:
+            data['ATTACH'] = attach
+        else:
+            data['ATTACH'] = ''
+        if keyboard:
+            data['KEYBOARD'] = keyboard.to_dict()
+        return data
+
+    async def broadcast(self, chat_ids: Union[Iterable, AsyncIterable], render: Callable, batch_size: int = 50, concurrency: int = 4, checkpoint: Union[BroadcastCheckpoint, str] = None):
+        """
+        Рассылает сообщения множеству чатов пакетами через метод batch.
+
+        Сообщения формируются по мере чтения получателей, одновременно выполняется
+        не более concurrency пакетов, частота запросов ограничивается rate_limiter бота. Пакеты
+        отправляются в классе приоритета BULK и не задерживают ответы на команды и сообщения,
+        если rate_limiter - PriorityRateLimiter. Если у бота нет rate_limiter, пакеты рассылки
+        ограничиваются общим для рассылок бота RateLimiter с лимитом портала по умолчанию
+        (2 запроса в секунду, накопление до 50), иначе рассылка получает QUERY_LIMIT_EXCEEDED.
+        Результаты возвращаются по мере готовности, порядок получателей не сохраняется.
+
+        Args:
+            chat_ids (Union[Iterable, AsyncIterable]): Получатели рассылки.
+            render (Callable): Функция (может быть асинхронной), возвращающая для ID чата текст сообщения
+                или словарь аргументов send_message (text, attach, keyboard).
+            batch_size (int, optional): Количество сообщений в одном пакете, не более 50.
+            concurrency (int, optional): Максимальное количество одновременно выполняемых пакетов.
+            checkpoint (Union[BroadcastCheckpoint, str], optional): Контрольная точка для продолжения прерванной
+                рассылки или путь к ее файлу. Контрольная точка, открытая по пути, закрывается по окончании рассылки.
+
+        Yields:
+            BroadcastResult: Результат отправки для каждого получателя.
+        """
+        if self.rate_limiter is None and self._broadcast_limiter is None:
+            logging.warning("bot has no rate_limiter, broadcast batches are limited to 2 requests per second")
+            self._broadcast_limiter = RateLimiter()
+        owned = isinstance(checkpoint, (str, os.PathLike))
+        if owned:
+            checkpoint = BroadcastCheckpoint(checkpoint)
+        batch_size = max(1, min(batch_size, 50))
+        pending = set()
+        chunk = []
+
+        def collect(tasks):
+            results = []
+            for task in tasks:
+                for result in task.result():
+                    if checkpoint is not None and result.ok:
+                        checkpoint.mark(result.chat_id)
+                    results.append(result)
+            if checkpoint is not None:
+                checkpoint.flush()
+            return results
+
+        try:
+            async for chat_id in aiter_items(chat_ids):
+                if checkpoint is not None and chat_id in checkpoint:
+                    continue
+                try:
+                    content = render(chat_id)
+                    if asyncio.iscoroutine(content):
+                        content = await content
+                    if isinstance(content, str):
+                        content = {'text': content}
+                    chunk.append((chat_id, self._message_data(chat_id, **content)))
+                except Exception as e:
+                    logging.exception(f"broadcast render error for chat {chat_id}")
+                    yield BroadcastResult(chat_id, error=e)
+                    continue
+
+                if len(chunk) >= batch_size:
+                    pending.add(asyncio.ensure_future(self._broadcast_chunk(chunk)))
+                    chunk = []
+                    done = {task for task in pending if task.done()}
+                    if len(pending) >= concurrency:
+                        finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        done |= finished
+                    pending -= done
+                    for result in collect(done):
+                        yield result
+
+            if chunk:
+                pending.add(asyncio.ensure_future(self._broadcast_chunk(chunk)))
+                chunk = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for result in collect(done):
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
+            if owned:
+                checkpoint.close()
+            elif checkpoint is not None:
+                checkpoint.flush()
+
+    async def _broadcast_chunk(self, chunk: List[Tuple[Any, Dict[str, Any]]]) -> List[BroadcastResult]:
+        """
+        Отправляет пакет сообщений рассылки одним запросом batch.
+
+        Args:
+            chunk (List[Tuple[Any, Dict[str, Any]]]): Пары (ID чата, параметры сообщения).
+
+        Returns:
+            List[BroadcastResult]: Результаты отправки.
+        """
+        commands = {f"m{i}": ("imbot.message.add", data) for i, (chat_id, data) in enumerate(chunk)}
+        try:
+            if self.rate_limiter is None and self._broadcast_limiter is not None:
+                await self._broadcast_limiter.acquire()
+            with priority(BULK):
+                response = await self.batch(commands)
+        except Exception as e:
+            logging.exception("broadcast batch error")
+            return [BroadcastResult(chat_id, error=e) for chat_id, data in chunk]
+
+        results, errors = self._parse_batch(response, commands)
+        return [BroadcastResult(chat_id, result=results.get(f"m{i}"), error=errors.get(f"m{i}"))
+                for i, (chat_id, data) in enumerate(chunk)]
+    
+    
+    async def command_answer(self,command: 'Command', text: str, attach:Dict[str, Any] = None,  keyboard: 'ReplyKeyboardMarkup' = None):             
+        """
+       Отвечает на команду.
+
+       Args:
+           command (Command): Команда, на которую нужно ответить.
+           text (str): Текст ответа.
+           attach (Dict[str, Any], optional): Вложения к сообщению.
+           keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+       """       
+        data = {
+            'BOT_ID': self.base_id,
+            'COMMAND': command.get_command_name(),
+            'MESSAGE_ID': command.get_message_id(),
+            'MESSAGE': text            
+        }
+        if attach:
+            data['ATTACH'] = attach
+        if keyboard:
+            data['KEYBOARD'] = keyboard.to_dict()
+        logging.debug(f"command_answer_message data: {data}")   
+        response = await self.rest_command("imbot.command.answer", params=data)
+        return response
+    
+    async def message_delete(self, message_id: int, complete: str ="Y"):
+        """
+        Удаляет сообщение.
+
+        Args:
+            message_id (int): ID сообщения.
+            complete (str, optional): Статус завершения. По умолчанию "Y".
+        """        
+        data = {
+            'BOT_ID': self.base_id,
+            'MESSAGE_ID': message_id,            
+            'COMPLETE': complete
+        }
+        logging.debug(f"delete_message data: {data}")   
+        response = await self.rest_command("imbot.message.delete", params=data)
+        return response
+ 
+    async def command_update_message(self, text: str, command: 'Command' , attach:Dict[str, Any] = None, chat_id: int = None,message_id: int = None, keyboard: 'ReplyKeyboardMarkup' = None):
+        """
+        Обновляет сообщение от команды.
+
+        Args:
+            text (str): Новый текст сообщения.
+            command (Command): Команда, для которой обновляется сообщение.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            chat_id (int, optional): ID чата. Если не задан, используется ID чата из команды.
+            message_id (int, optional): ID сообщения. Если не задан, используется ID сообщения из команды.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+        """
+        if chat_id == None:
+            chat_id=command.get_chat_id()
+        if message_id == None:
+            message_id=command.get_message_id()
+            
+        data = {
+            'DIALOG_ID': chat_id,
+            'MESSAGE': text,
+            'BOT_ID': self.base_id,
+            'MESSAGE_ID': message_id
+            
+        }
+        if attach:
+            data['ATTACH'] = attach
+        else:
+            data['ATTACH'] = ''
+        if keyboard:
+            data['KEYBOARD'] = keyboard.to_dict()
+        else:
+            data['KEYBOARD'] = ''
+            
+        logging.debug(f"command_update_message data: {data}")            
+        response = await self.rest_command("imbot.message.update", params=data) 
+        return response
+
+    async def update_message(self,  text: str, message: 'Message' , attach:Dict[str, Any] = None, chat_id: int = None, message_id: int = None, keyboard: 'ReplyKeyboardMarkup' = None):
+        """
+        Обновляет сообщение.
+
+        Args:
+            text (str): Новый текст сообщения.
+            message (Message): Сообщение, которое нужно обновить.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            chat_id (int, optional): ID чата. Если не задан, используется ID чата из сообщения.
+            message_id (int, optional): ID сообщения. Если не задан, используется ID сообщения из сообщения.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+        """
+        if chat_id == None:            
+            chat_id=message.get_chat_id()
+        if message_id == None:
+            message_id=message.get_message_id()
+
+        data = {
+            'DIALOG_ID': chat_id,
+            'MESSAGE': text,
+            'BOT_ID': self.base_id,
+            'MESSAGE_ID': message_id                        
+        }
+        if attach:
+            data['ATTACH'] = [attach]
+        else:
+            data['ATTACH'] = ''
+        if keyboard:
+            data['KEYBOARD'] = keyboard.to_dict()
+        else:
+            data['KEYBOARD'] = ''
+        logging.debug(f"update_message data: {data}")            
+        response = await self.rest_command("imbot.message.update", params=data) 
+        return response
+
+
+    async def set_webhook(self, webhook_url: str):
+        """
+        Устанавливает вебхук для получения обновлений от Bitrix24.
+    
+        Args:
+            webhook_url (str): URL вебхука.
+        """
+        url = self.base_url + 'imbot.register'
+        data = {'EVENT_HANDLER': webhook_url}
+        async with self.session.post(url, json=data) as response:
+            return await response.json()
+
+    async def handle_update(self, update: Dict[str, Any]):
+        """
+        Обрабатывает обновление от Bitrix24.
+
+        Args:
+            update (Dict[str, Any]): Данные обновления.
+        """
+        self.dispatcher.process_update(self, update, self.fsm)
+
+    async def register_message_handler(self, handler: Callable, commands: List[str] = None, state: str = None):
+        """
+        Регистрирует обработчик сообщений.
+
+        Args:
+            handler (Callable): Функция-обработчик сообщений.
+            commands (List[str], optional): Список команд для обработки.
+            state (str, optional): Состояние для обработки.
+        """
+        self.dispatcher.register_message_handler(handler, commands, state)
+    
+    async def iterate(self, method: str, params: Dict[str, Any] = None, result_key: str = None, prefetch: bool = True, fan_out: int = 0):
+        """
+        Постранично перебирает элементы списочного метода REST API.
+
+        Bitrix24 возвращает списки страницами по 50 элементов с полями next и total. Пока
+        обрабатываются элементы текущей страницы, следующая страница уже запрашивается.
+        Если задан fan_out и известно общее количество элементов, оставшиеся страницы
+        запрашиваются группами по fan_out страниц одним запросом batch. В памяти одновременно
+        находится не более двух страниц (или двух групп страниц при fan_out).
+
+        Args:
+            method (str): Списочный метод API, например user.get или im.dialog.users.list.
+            params (Dict[str, Any], optional): Параметры метода, start задает начальное смещение.
+            result_key (str, optional): Ключ списка элементов, если result является словарем (например, tasks).
+            prefetch (bool, optional): Запрашивать следующую страницу заранее. По умолчанию True.
+            fan_out (int, optional): Количество страниц в одном запросе batch, не более 50. По умолчанию 0 - без batch.
+
+        Yields:
+            Any: Элементы списка.
+
+        Raises:
+            BitrixError: Если метод вернул ошибку.
+        """
+        params = {**(params or {})}
+        start = params.pop('start', 0)
+        fan_out = min(fan_out, 50)
+        pending = asyncio.ensure_future(self._iterate_page(method, params, start, result_key))
+        try:
+            while pending is not None:
+                items, next_start, total = await pending
+                pending = None
+                if next_start is not None and fan_out > 1 and total is not None and items:
+                    for item in items:
+                        yield item
+                    offsets = range(int(next_start), int(total), len(items))
+                    groups = [offsets[i:i + fan_out] for i in range(0, len(offsets), fan_out)]
+                    for index, group in enumerate(groups):
+                        if pending is None:
+                            pending = asyncio.ensure_future(self._iterate_batch(method, params, group, result_key))
+                        pages = await pending
+                        pending = None
+                        if index + 1 < len(groups) and prefetch:
+                            pending = asyncio.ensure_future(self._iterate_batch(method, params, groups[index + 1], result_key))
+                        for page in pages:
+                            for item in page:
+                                yield item
+                    return
+                if next_start is not None and prefetch:
+                    pending = asyncio.ensure_future(self._iterate_page(method, params, next_start, result_key))
+                for item in items:
+                    yield item
+                if next_start is not None and pending is None:
+                    pending = asyncio.ensure_future(self._iterate_page(method, params, next_start, result_key))
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    @staticmethod
+    def _page_items(result: Any, result_key: str = None) -> List[Any]:
+        """
+        Извлекает элементы из результата списочного метода.
+
+        Args:
+            result (Any): Поле result ответа API.
+            result_key (str, optional): Ключ списка элементов в result.
+
+        Returns:
+            List[Any]: Элементы страницы.
+        """
+        if result_key is not None and isinstance(result, dict):
+            result = result.get(result_key) or []
+        if isinstance(result, dict):
+            return list(result.values())
+        return result or []
+
+    async def _iterate_page(self, method: str, params: Dict[str, Any], start: int, result_key: str = None):
+        """
+        Запрашивает одну страницу списочного метода.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any]): Параметры метода.
+            start (int): Смещение страницы.
+            result_key (str, optional): Ключ списка элементов в result.
+
+        Returns:
+            Tuple[List[Any], Optional[int], Optional[int]]: Элементы, смещение следующей страницы и общее количество.
+        """
+        response = await self.rest_command(method, {**params, 'start': start})
+        if 'error' in response:
+            raise BitrixError.from_response(response)
+        return self._page_items(response.get('result'), result_key), response.get('next'), response.get('total')
+
+    async def _iterate_batch(self, method: str, params: Dict[str, Any], offsets: Iterable[int], result_key: str = None) -> List[List[Any]]:
+        """
+        Запрашивает несколько страниц списочного метода одним запросом batch.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any]): Параметры метода.
+            offsets (Iterable[int]): Смещения страниц.
+            result_key (str, optional): Ключ списка элементов в result.
+
+        Returns:
+            List[List[Any]]: Элементы страниц в порядке смещений.
+        """
+        commands = {f"p{offset}": (method, {**params, 'start': offset}) for offset in offsets}
+        response = await self.batch(commands)
+        results, errors = self._parse_batch(response, commands)
+        if errors:
+            error = next(iter(errors.values()))
+            if isinstance(error, dict):
+                raise BitrixError.from_response(error)
+            raise BitrixError(str(error), response=response)
+        return [self._page_items(results[key], result_key) for key in commands]
+
+    def flatten_params(self,json_data, parent_key='', separator='_'):
+        """
+        Преобразует параметры в плоский формат.
+
+        Args:
+            json_data (dict): Данные для преобразования.
+            parent_key (str, optional): Родительский ключ.
+            separator (str, optional): Разделитель для ключей.
+
+        Returns:
+            dict: Преобразованные данные.
+        """
+        items = {}
+        for key, value in json_data.items():
+            new_key = f'{parent_key}[{key}]' if parent_key else key
+            if isinstance(value, dict):
+                items.update(self.flatten_params(value, new_key, separator))
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    items.update(self.flatten_params(item, f'{new_key}[{i}]', separator))
+            else:
+                items[new_key] = value
+        return items
+
+    async def batch(self, commands: Dict[str, Tuple[str, Dict[str, Any]]], halt: bool = False):
+        """
+        Выполняет несколько методов REST API одним запросом batch.
+
+        Args:
+            commands (Dict[str, Tuple[str, Dict[str, Any]]]): Словарь {ключ: (метод, параметры)}, не более 50 команд.
+            halt (bool, optional): Прерывать выполнение пакета при первой ошибке.
+
+        Returns:
+            dict: Ответ от API. Результаты команд находятся в ['result']['result'], ошибки - в ['result']['result_error'].
+        """
+        cmd = {}
+        for key, (method, params) in commands.items():
+            query_data = {**(params or {})}
+            if query_data.get("CLIENT_ID", None) is None:
+                query_data["CLIENT_ID"] = self.bot_token
+            cmd[key] = f"{method}?{urlencode(self.flatten_params(query_data))}"
+        return await self.rest_command('batch', {'halt': int(halt), 'cmd': cmd})
+        
+  
+    async def rest_command(self, method, params=None):
+        """
+        Выполняет команду REST API.
+
+        Если у бота задан кеш и метод кешируется, ответ берется из кеша. Если задано объединение
+        запросов и метод разрешен, одновременные одинаковые вызовы выполняются одним HTTP-запросом.
+
+        Args:
+            method (str): Метод API.
+            params (dict, optional): Параметры для метода.
+
+        Returns:
+            dict: Ответ от API.
+        """
+        capture_request(self, method, params)
+        if self.cache is not None and self.cache.is_cacheable(method):
+            return await self.cache.fetch(method, params, lambda: self._request(method, params))
+        if self.single_flight is not None and self.single_flight.is_allowed(method):
+            return await self.single_flight.run(make_key(method, params), lambda: self._request(method, params))
+        return await self._request(method, params)
+
+    async def _request(self, method, params=None):
+        """
+        Отправляет HTTP-запрос метода REST API на портал.
+
+        Args:
+            method (str): Метод API.
+            params (dict, optional): Параметры для метода.
+
+        Returns:
+            dict: Ответ от API.
+        """
+        query_url = self.base_url + method
+        query_data = {**(params or {})}
+        if query_data.get("CLIENT_ID", None) is None: 
+            query_data["CLIENT_ID"] = self.bot_token
+        logging.debug(f"ImBot send data \n URL: {query_url} \n PARAMS: {query_data}")
+        flattern_data = self.flatten_params(query_data)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self.session.post(query_url, data=flattern_data) as response:
+            result = await response.json()
+            logging.debug(f"response : {result}")
+            return result
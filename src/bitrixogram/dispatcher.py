@@ -0,0 +1,1001 @@
+# -*- coding: utf-8 -*-
+"""
+Маршрутизация обновлений: сообщения, команды, фильтры, Dispatcher и Router.
+"""
+
+import asyncio
+import difflib
+import json
+import logging
+import operator
+import os
+import re
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Pattern, Tuple, Union
+
+from .formdata import WebhookUpdate
+from .fsm import FSM, FSMContext, State
+from .matching import Keywords, TextMatcher, TextRule
+from .workers import Offloader, StallDetector, _detector, call_handler, offload_handler
+from .ratelimit import PrioritySemaphore, event_priority, priority
+
+if TYPE_CHECKING:
+    from .cache import HandlerCache
+    from .client import BitrixBot
+
+
+def _int_field(data: Dict[str, Any], key: str) -> int:
+    return int(data.get(key, 0))
+
+
+class Message:
+    """
+    Класс, представляющий сообщение в чате Bitrix24.
+
+    Представление над исходным обновлением без копирования: поля вычисляются при первом
+    обращении и запоминаются.
+
+    Attributes:
+        data (Dict[str, Any]): Сырой словарь данных сообщения.
+        bot (BitrixBot): Бот портала, от которого получено сообщение (если задан в Dispatcher).
+    """
+
+    __slots__ = ('data', 'bot', '_text', '_message_id', '_chat_id', '_user_id')
+
+    def __init__(self, data: Dict[str, Any], bot: 'BitrixBot' = None):
+        """
+        Инициализация сообщения.
+
+        Args:
+            data (Dict[str, Any]): исходное сообщение из ответа сервера.
+            bot (BitrixBot, optional): Бот портала, от которого получено сообщение.
+        """
+        self.data = data
+        self.bot = bot
+        self._text = None
+        self._message_id = None
+        self._chat_id = None
+        self._user_id = None
+
+    def get_text(self) -> str:
+        """
+        Возвращает текст сообщения [PARAMS][MESSAGE].
+
+        Returns:
+            str: Текст сообщения.
+        """
+        if self._text is None:
+            self._text = self.data.get('data[PARAMS][MESSAGE]', '')
+        return self._text
+
+    def get_message_id(self) -> int:
+        """
+        Возвращает идентификатор сообщения [PARAMS][MESSAGE_ID].
+
+        Returns:
+            int: Идентификатор сообщения.
+        """
+        if self._message_id is None:
+            self._message_id = _int_field(self.data, 'data[PARAMS][MESSAGE_ID]')
+        return self._message_id
+
+    def get_chat_id(self) -> int:
+        """
+        Возвращает идентификатор чата, в котором было отправлено сообщение.
+
+        Returns:
+            int: Идентификатор чата [PARAMS][DIALOG_ID].
+        """
+        if self._chat_id is None:
+            self._chat_id = _int_field(self.data, 'data[PARAMS][DIALOG_ID]')
+        return self._chat_id
+
+    def get_user_id(self) -> int:
+        """
+        Возвращает идентификатор пользователя, отправившего сообщение.
+
+        Returns:
+            int: Идентификатор пользователя [USER][ID].
+        """
+        if self._user_id is None:
+            self._user_id = _int_field(self.data, 'data[USER][ID]')
+        return self._user_id
+
+    def get_raw_data(self) -> Dict[str, Any]:
+        """
+        Возвращает исходное сообщение от сервера.
+
+        Returns:
+            Dict[str, Any]: Сырой словарь данных.
+        """
+        return self.data
+
+
+class Command:
+    """
+    Класс, представляющий команду.
+
+    Представление над исходным обновлением без копирования: данные команды разбираются
+    при первом обращении, идентификаторы вычисляются один раз.
+
+    Attributes:
+        data (Dict[str, Any]): сообщение от сервера.
+        parsed_data (Dict[str, Any]): Распарсенные данные команды.
+        bot (BitrixBot): Бот портала, от которого получена команда (если задан в Dispatcher).
+    """
+
+    __slots__ = ('data', 'bot', '_parsed_data', '_chat_id', '_user_id', '_message_id')
+
+    def __init__(self, data: Dict[str, Any], parsed_data: Dict[str, Any] = None, bot: 'BitrixBot' = None):
+        """
+        Инициализация команды.
+
+        Args:
+            data (Dict[str, Any]): сообщение ответа на команду от сервера.
+            parsed_data (Dict[str, Any], optional): Распарсенные данные команды, по умолчанию
+                вычисляются из data при первом обращении.
+            bot (BitrixBot, optional): Бот портала, от которого получена команда.
+        """
+        self.data = data
+        self.bot = bot
+        self._parsed_data = parsed_data
+        self._chat_id = None
+        self._user_id = None
+        self._message_id = None
+
+    @property
+    def parsed_data(self) -> Dict[str, Any]:
+        """
+        Распарсенные данные команды data[COMMAND][<id>] с ключами в нижнем регистре.
+
+        Returns:
+            Dict[str, Any]: Данные команды.
+        """
+        if self._parsed_data is None:
+            self._parsed_data = WebhookUpdate.from_flat(self.data).command
+        return self._parsed_data
+
+    @parsed_data.setter
+    def parsed_data(self, value: Dict[str, Any]):
+        self._parsed_data = value
+
+    def get_command_name(self) -> str:
+        """
+        Возвращает имя команды.
+
+        Returns:
+            str: Имя команды.
+        """
+        return self.parsed_data.get('command', '')
+
+    def get_command_id(self) -> str:
+        """
+        Возвращает идентификатор команды.
+
+        Returns:
+            str: Идентификатор команды.
+        """
+        return self.parsed_data.get('command_id', '')
+
+    def get_command_params(self) -> str:
+        """
+        Возвращает параметры команды.
+
+        Returns:
+            str: Параметры команды.
+        """
+        return self.parsed_data.get('command_params', '')
+
+    def get_command_raw_params(self) -> Dict[str, Any]:
+        """
+        Возвращает словарь параметров команды в исходном виде.
+
+        Returns:
+            Dict[str, Any]: Сырой словарь параметров команды.
+        """
+        return self.parsed_data
+
+    def get_chat_id(self) -> int:
+        """
+        Возвращает идентификатор чата, в котором была вызвана команда [PARAMS][DIALOG_ID].
+
+        Returns:
+            int: Идентификатор чата.
+        """
+        if self._chat_id is None:
+            self._chat_id = _int_field(self.data, 'data[PARAMS][DIALOG_ID]')
+        return self._chat_id
+
+    def get_user_id(self) -> int:
+        """
+        Возвращает идентификатор пользователя, вызвавшего команду [USER][ID].
+
+        Returns:
+            int: Идентификатор пользователя.
+        """
+        if self._user_id is None:
+            self._user_id = _int_field(self.data, 'data[USER][ID]')
+        return self._user_id
+
+    def get_message_id(self) -> int:
+        """
+        Возвращает идентификатор сообщения, связанного с командой [PARAMS][MESSAGE_ID].
+
+        Returns:
+            int: Идентификатор сообщения.
+        """
+        if self._message_id is None:
+            self._message_id = _int_field(self.data, 'data[PARAMS][MESSAGE_ID]')
+        return self._message_id
+
+    def get_raw_data(self) -> Dict[str, Any]:
+        """
+        Возвращает исходные словарь данных ответа на команду.
+
+        Returns:
+            Dict[str, Any]: Сырой словарь данных.
+        """
+        return self.data
+
+
+class MagicFilter:
+    """
+    Класс для создания магических фильтров, которые можно применять к объектам сообщения или команды с учетом контекста FSM.
+
+    Attributes:
+        filter_func (Callable[[Union[Message, Command], 'FSMContext'], Union[bool, Awaitable[bool]]]): Функция фильтрации.
+        getter (Callable[[Union[Message, Command]], Any]): Значение, с которым сравнивают операторы
+            ==, !=, <, ... По умолчанию текст сообщения или имя команды, для F["..."] - значение по ключу.
+        text_rule (TextRule): Правило фильтров regexp и contains_any. Router проверяет правила
+            своих обработчиков сообщений вместе (TextMatcher), а не каждым фильтром отдельно.
+    """
+
+    text_rule = None
+
+    def __init__(self, filter_func: Callable[[Union[Message, Command], 'FSMContext'], Union[bool, Awaitable[bool]]] = None,
+                 getter: Callable[[Union[Message, Command]], Any] = None):
+        """
+        Инициализация MagicFilter.
+
+        Args:
+            filter_func (Callable[[Union[Message, Command], 'FSMContext'], Union[bool, Awaitable[bool]]], optional): Функция фильтрации.
+            getter (Callable[[Union[Message, Command]], Any], optional): Значение для операторов сравнения.
+        """
+        self.filter_func = filter_func
+        self.getter = getter
+
+    @classmethod
+    def text(cls):
+        """
+        Создает фильтр для объектов типа Message.
+
+        Returns:
+            MagicFilter: Фильтр для сообщений.
+        """
+        return cls(lambda obj, fsm_context: isinstance(obj, Message))
+
+    @classmethod
+    def command(cls):
+        """
+        Создает фильтр для объектов типа Command.
+
+        Returns:
+            MagicFilter: Фильтр для команд.
+        """
+        return cls(lambda obj, fsm_context: isinstance(obj, Command))
+
+    @classmethod
+    def state(cls, expected_state: 'State'):
+        """
+        Создает фильтр для проверки состояния FSM.
+
+        Args:
+            expected_state (State): Ожидаемое состояние.
+
+        Returns:
+            MagicFilter: Фильтр для проверки состояния.
+        """
+        async def filter_func(obj, fsm_context):
+            current_state = await fsm_context.get_state()
+            return current_state == expected_state
+        return cls(filter_func)
+
+    def lower(self, expected_text: str):
+        """
+        Создает фильтр для проверки текста сообщения (без учета регистра).
+
+        Args:
+            expected_text (str): Ожидаемый текст.
+
+        Returns:
+            MagicFilter: Фильтр для проверки текста сообщения.
+        """
+        expected_text = expected_text.lower()
+        return MagicFilter(lambda obj, fsm_context: isinstance(obj, Message) and obj.get_text().lower() == expected_text)
+
+    def startswith(self, expected_text: str):
+        """
+        Создает фильтр для проверки, начинается ли текст сообщения с указанного текста.
+
+        Args:
+            expected_text (str): Ожидаемый начальный текст.
+
+        Returns:
+            MagicFilter: Фильтр для проверки начального текста сообщения.
+        """
+        return MagicFilter(lambda obj, fsm_context: isinstance(obj, Message) and obj.get_text().lower().startswith(expected_text))
+
+    def regexp(self, pattern: Union[str, Pattern], flags: int = 0):
+        """
+        Создает фильтр для поиска регулярного выражения в тексте сообщения (re.search).
+
+        Args:
+            pattern (Union[str, Pattern]): Регулярное выражение.
+            flags (int, optional): Флаги re, например re.IGNORECASE.
+
+        Returns:
+            MagicFilter: Фильтр для проверки текста сообщения.
+        """
+        compiled = re.compile(pattern, flags)
+        result = MagicFilter(lambda obj, fsm_context: isinstance(obj, Message) and compiled.search(obj.get_text()) is not None)
+        result.text_rule = compiled
+        return result
+
+    def contains_any(self, *words: str, whole_words: bool = True):
+        """
+        Создает фильтр для проверки, содержит ли текст сообщения любое из слов (без учета регистра).
+        Слова и текст сравниваются после str.casefold(), как в TextMatcher.
+
+        Args:
+            *words (str): Слова или фразы.
+            whole_words (bool, optional): Искать только целые слова, а не части слов.
+
+        Returns:
+            MagicFilter: Фильтр для проверки текста сообщения.
+        """
+        folded = sorted({word.casefold() for word in words if word}, key=len, reverse=True)
+        pattern = '|'.join(re.escape(word) for word in folded) or '(?!)'
+        if whole_words:
+            pattern = rf"(?<!\w)(?:{pattern})(?!\w)"
+        compiled = re.compile(pattern)
+        result = MagicFilter(lambda obj, fsm_context: isinstance(obj, Message) and compiled.search(obj.get_text().casefold()) is not None)
+        result.text_rule = Keywords(tuple(words), whole_words)
+        return result
+
+    def fuzzy(self, *phrases: str, threshold: float = 0.8):
+        """
+        Создает фильтр для нечеткого сравнения текста сообщения с фразами (без учета регистра),
+        например для команд с опечатками. Сходство вычисляется difflib.SequenceMatcher.ratio().
+
+        Args:
+            *phrases (str): Ожидаемые фразы.
+            threshold (float, optional): Минимальное сходство от 0 до 1.
+
+        Returns:
+            MagicFilter: Фильтр для проверки текста сообщения.
+        """
+        matchers = []
+        for phrase in phrases:
+            matcher = difflib.SequenceMatcher(autojunk=False)
+            matcher.set_seq2(phrase.casefold())
+            matchers.append(matcher)
+
+        def filter_func(obj, fsm_context):
+            if not isinstance(obj, Message):
+                return False
+            text = obj.get_text().strip().casefold()
+            for matcher in matchers:
+                matcher.set_seq1(text)
+                # оценки сверху отсекают непохожие фразы без полного сравнения
+                if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold:
+                    return True
+            return False
+        return MagicFilter(filter_func)
+
+    async def __call__(self, obj: Union['Message', 'Command'], fsm_context: 'FSMContext') -> bool:
+        """
+        Применяет фильтр к объекту сообщения или команды.
+
+        Args:
+            obj (Union[Message, Command]): Объект сообщения или команды.
+            fsm_context (FSMContext): Контекст состояния FSM.
+
+        Returns:
+            bool: Результат применения фильтра.
+        """
+        if self.filter_func:
+            result = self.filter_func(obj, fsm_context)
+            if asyncio.iscoroutine(result):
+                return await result
+            return result
+        return True
+
+    def _combine(self, other, op):
+        """
+        Объединяет два фильтра с использованием указанной логической операции.
+
+        Args:
+            other (MagicFilter): Другой фильтр.
+            op (Callable[[bool, bool], bool]): Логическая операция.
+
+        Returns:
+            MagicFilter: Объединенный фильтр.
+        """
+        async def combined_filter(obj: Union['Message', 'Command'], fsm_context: 'FSMContext') -> bool:
+            self_result = await self.__call__(obj, fsm_context)
+            other_result = await other.__call__(obj, fsm_context)
+            return op(self_result, other_result)
+        return MagicFilter(combined_filter)
+
+    def __and__(self, other):
+        """
+        Объединяет два фильтра с использованием логической операции AND.
+
+        Args:
+            other (MagicFilter): Другой фильтр.
+
+        Returns:
+            MagicFilter: Объединенный фильтр.
+        """
+        return self._combine(other, operator.and_)
+
+    def __or__(self, other):
+        """
+        Объединяет два фильтра с использованием логической операции OR.
+
+        Args:
+            other (MagicFilter): Другой фильтр.
+
+        Returns:
+            MagicFilter: Объединенный фильтр.
+        """
+        return self._combine(other, operator.or_)
+
+    def __eq__(self, other):
+        """
+        Создает фильтр для проверки равенства значения.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки равенства.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) == other)
+
+    def __ne__(self, other):
+        """
+        Создает фильтр для проверки неравенства значения.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки неравенства.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) != other)
+
+    def __lt__(self, other):
+        """
+        Создает фильтр для проверки, меньше ли значение.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки, меньше ли значение.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) < other)
+
+    def __le__(self, other):
+        """
+        Создает фильтр для проверки, меньше ли или равно значение.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки, меньше ли или равно значение.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) <= other)
+
+    def __gt__(self, other):
+        """
+        Создает фильтр для проверки, больше ли значение.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки, больше ли значение.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) > other)
+
+    def __ge__(self, other):
+        """
+        Создает фильтр для проверки, больше ли или равно значение.
+
+        Args:
+            other (Any): Значение для сравнения.
+
+        Returns:
+            MagicFilter: Фильтр для проверки, больше ли или равно значение.
+        """
+        return MagicFilter(lambda obj, fsm_context: self._get_value(obj) >= other)
+
+    def __getitem__(self, key):
+        """
+        Создает фильтр для получения значения по ключу из сырых данных объекта.
+
+        Args:
+            key (str): Ключ для доступа к значению в сыром словаре данных.
+
+        Returns:
+            MagicFilter: Фильтр для получения значения по ключу.
+        """
+        getter = self._path_getter(key)
+        return MagicFilter(lambda obj, fsm_context: getter(obj), getter)
+
+    def _get_value(self, obj: Union[Message, Command]) -> Any:
+        """
+        Возвращает значение объекта для фильтрации.
+
+        Args:
+            obj (Union[Message, Command]): Объект сообщения или команды.
+
+        Returns:
+            Any: Значение объекта.
+        """
+        if self.getter is not None:
+            return self.getter(obj)
+        return obj.get_text() if isinstance(obj, Message) else obj.get_command_name()
+
+    @staticmethod
+    def _path_getter(key: str) -> Callable[[Union[Message, Command]], Any]:
+        """
+        Создает функцию получения значения по ключу. Ключ разбивается на путь один раз,
+        при создании фильтра.
+
+        Args:
+            key (str): Исходный ключ формы ("data[PARAMS][MESSAGE]") или путь "data.PARAMS.MESSAGE".
+
+        Returns:
+            Callable[[Union[Message, Command]], Any]: Функция, принимающая сообщение или команду.
+        """
+        path = tuple(key.split('.'))
+
+        def getter(obj):
+            data = obj.get_raw_data()
+            if isinstance(data, WebhookUpdate) and key not in data:
+                data = data.nested
+            for part in path:
+                if isinstance(data, dict):
+                    data = data.get(part)
+                else:
+                    return None
+            return data
+        return getter
+
+    def _get_nested_value(self, data: Dict[str, Any], key: str) -> Any:
+        """
+        Возвращает вложенное значение по ключу из словаря данных. Для WebhookUpdate ключ
+        вида "data.PARAMS.MESSAGE" ищется во вложенной структуре, исходные ключи формы
+        ("data[PARAMS][MESSAGE]") по-прежнему поддерживаются.
+
+        Args:
+            data (Dict[str, Any]): Словарь данных.
+            key (str): Ключ для доступа к вложенному значению.
+
+        Returns:
+            Any: Вложенное значение.
+        """
+        if isinstance(data, WebhookUpdate) and key not in data:
+            data = data.nested
+        keys = key.split('.')
+        for k in keys:
+            if isinstance(data, dict):
+                data = data.get(k)
+            else:
+                return None
+        return data
+
+    @property
+    def message(self):
+        """
+        Свойство для получения фильтра сообщений.
+
+        Returns:
+            MagicFilter: Фильтр сообщений.
+        """
+        return self
+
+
+class Dispatcher:
+    """
+    Класс для диспетчеризации обновлений и маршрутизации их к соответствующим обработчикам.
+
+    Attributes:
+        routers (List['Router']): Список маршрутизаторов для обработки сообщений и команд.
+        FSM (FSM): Состояние машины состояний для управления контекстом.
+        update_hooks (List[Callable]): Функции, вызываемые для каждого обновления перед маршрутизацией.
+        bot (BitrixBot): Бот по умолчанию, доступный обработчикам как message.bot.
+        priority_of (Callable[[Dict[str, Any]], int]): Класс приоритета обновления, по умолчанию
+            event_priority: команды - INTERACTIVE, сообщения - MESSAGES, остальное - BACKGROUND.
+            Обработчик выполняется с этим приоритетом: его вызовы REST API и Outbox получают
+            токены PriorityRateLimiter в своем классе.
+        slots (PrioritySemaphore): Ограничение одновременно обрабатываемых обновлений или None.
+        stall_detector (StallDetector): Предупреждения об обработчиках, блокирующих цикл событий, или None.
+    """
+
+    def __init__(self, bot: 'BitrixBot' = None, max_concurrency: int = None, weights: Dict[int, float] = None,
+                 stall_threshold: float = None):
+        """
+        Инициализирует Dispatcher с пустым списком маршрутизаторов и FSM.
+
+        Args:
+            bot (BitrixBot, optional): Бот по умолчанию для message.bot и command.bot.
+            max_concurrency (int, optional): Максимальное количество одновременно обрабатываемых
+                обновлений. Ожидающие обновления получают место по классам приоритета с весами weights.
+            weights (Dict[int, float], optional): Веса классов приоритета, по умолчанию DEFAULT_WEIGHTS.
+            stall_threshold (float, optional): Порог в секундах, после которого непрерывное выполнение
+                обработчика между await считается блокировкой цикла событий и записывается в лог.
+        """
+        self.routers = []
+        self.FSM = FSM()
+        self.update_hooks = []
+        self.bot = bot
+        self.priority_of = event_priority
+        self.slots = PrioritySemaphore(max_concurrency, weights) if max_concurrency else None
+        self.stall_detector = StallDetector(stall_threshold) if stall_threshold else None
+
+    def add_router(self, router: 'Router'):
+        """
+        Добавляет маршрутизатор в список маршрутизаторов.
+
+        Args:
+            router (Router): Маршрутизатор для добавления.
+        """
+        self.routers.append(router)
+
+    def _fsms(self):
+        yield 'dispatcher', self.FSM
+        stack = [(f'routers.{index}', router) for index, router in enumerate(self.routers)]
+        while stack:
+            name, router = stack.pop()
+            yield name, router.fsm
+            stack.extend((f'{name}.routers.{index}', child) for index, child in enumerate(router.routers))
+
+    def save_fsm(self, path: str):
+        """
+        Сохраняет контексты FSM всех маршрутизаторов в файл JSON (атомарно, через временный файл).
+        Маршрутизаторы определяются по порядку добавления, данные контекстов должны сериализоваться в JSON.
+
+        Args:
+            path (str): Путь к файлу.
+        """
+        data = {name: fsm.to_dict() for name, fsm in self._fsms()}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load_fsm(self, path: str) -> bool:
+        """
+        Загружает контексты FSM, сохраненные save_fsm. Маршрутизаторы должны быть добавлены заранее.
+
+        Args:
+            path (str): Путь к файлу.
+
+        Returns:
+            bool: True, если файл найден и загружен.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for name, fsm in self._fsms():
+            if name in data:
+                fsm.load_dict(data[name])
+        return True
+
+    async def drain_timers(self, timeout: float = None) -> bool:
+        """
+        Ожидает завершения выполняемых обработчиков таймеров FSM (Router.state_timeout, Router.scheduled).
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если все обработчики завершены.
+        """
+        schedulers = {id(fsm.scheduler): fsm.scheduler for _, fsm in self._fsms()}
+        return all(await asyncio.gather(*(scheduler.drain(timeout) for scheduler in schedulers.values())))
+
+    def add_update_hook(self, hook: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """
+        Добавляет асинхронную функцию, вызываемую для каждого обновления перед маршрутизацией,
+        например RestCache.on_update для сброса кеша по событиям.
+
+        Args:
+            hook (Callable[[Dict[str, Any]], Awaitable[None]]): Функция, принимающая данные обновления.
+        """
+        self.update_hooks.append(hook)
+
+    async def process_update(self, update: Dict[str, Any], bot: 'BitrixBot' = None, namespace: str = None):
+        """
+        Обрабатывает обновление, проходя по маршрутизаторам и вызывая соответствующие обработчики.
+
+        Args:
+            update (Dict[str, Any]): Данные обновления.
+            bot (BitrixBot, optional): Бот портала, от которого получено обновление. По умолчанию self.bot.
+            namespace (str, optional): Пространство имен FSM (например, ключ портала), чтобы
+                контексты одинаковых ID чатов разных порталов не пересекались.
+        """
+        update = WebhookUpdate.from_flat(update)
+        if bot is None:
+            bot = self.bot
+        level = self.priority_of(update)
+        token = _detector.set(self.stall_detector)
+        try:
+            with priority(level):
+                if self.slots is None:
+                    await self._route(update, bot, namespace)
+                else:
+                    async with self.slots.slot(level):
+                        await self._route(update, bot, namespace)
+        finally:
+            _detector.reset(token)
+
+    async def _route(self, update: WebhookUpdate, bot: 'BitrixBot', namespace: str):
+        for hook in self.update_hooks:
+            await hook(update)
+        for router in self.routers:
+            handled = await router.handle_message(update, bot, namespace)
+            if handled:
+                break
+            handled = await router.handle_callback_query(update, bot, namespace)
+            if handled:
+                break
+
+
+class Router:
+    """
+    Класс для маршрутизации сообщений и команд к соответствующим обработчикам.
+
+    Attributes:
+        message_handlers (List[Tuple[List[Union[MagicFilter, 'State']], Callable]]): Список обработчиков сообщений.
+        callback_query_handlers (Dict[str, Tuple[List[Union[MagicFilter, 'State']], Callable]]): Словарь обработчиков команд.
+        routers (List['Router']): Список вложенных маршрутизаторов.
+        fsm (FSM): Состояние машины состояний для управления контекстом.
+    """
+
+    def __init__(self):
+        """Инициализирует Router с пустыми списками обработчиков и вложенных маршрутизаторов."""
+        self.message_handlers = []
+        self.callback_query_handlers = {}
+        self.timeout_handlers = []
+        self.scheduled_handlers = {}
+        self.routers = []
+        self.fsm = FSM(timer_handler=self.handle_timer)
+        self._text_index = None
+
+    def message(self, *filters: Union[MagicFilter, 'State'], cache: 'HandlerCache' = None, offload: Union[Offloader, bool] = None):
+        """
+        Декоратор для регистрации обработчика сообщений с указанными фильтрами.
+
+        Args:
+            *filters (Union[MagicFilter, State]): Фильтры для обработчика.
+            cache (HandlerCache, optional): Кеш ответов обработчика, зависящих только от текста и состояния.
+            offload (Union[Offloader, bool], optional): Синхронный обработчик выполняется в пуле потоков
+                (True - default_offloader). Корутины из него вызываются через run_async().
+
+        Returns:
+            Callable: Декоратор для регистрации обработчика.
+        """
+        def decorator(func: Callable):
+            handler = offload_handler(func, offload) if offload else func
+            self.message_handlers.append((list(filters), cache.wrap(handler) if cache is not None else handler))
+            return func
+        return decorator
+
+    def callback_query(self, *filters: Union[MagicFilter, 'State'], offload: Union[Offloader, bool] = None):
+        """
+        Декоратор для регистрации обработчика команд с указанными фильтрами.
+
+        Args:
+            *filters (Union[MagicFilter, State]): Фильтры для обработчика.
+            offload (Union[Offloader, bool], optional): Синхронный обработчик выполняется в пуле потоков
+                (True - default_offloader).
+
+        Returns:
+            Callable: Декоратор для регистрации обработчика.
+        """
+        def decorator(func: Callable):
+            self.callback_query_handlers[func.__name__] = (list(filters), offload_handler(func, offload) if offload else func)
+            return func
+        return decorator
+
+    def state_timeout(self, *states: 'State'):
+        """
+        Декоратор для регистрации обработчика истечения времени жизни состояния
+        (FSMContext.set_state(state, ttl=...)). Обработчик вызывается после сброса состояния
+        с аргументами (fsm_context, expired_state).
+
+        Args:
+            *states (State): Состояния, по умолчанию любые.
+
+        Returns:
+            Callable: Декоратор для регистрации обработчика.
+        """
+        def decorator(func: Callable):
+            self.timeout_handlers.append((list(states), func))
+            return func
+        return decorator
+
+    def scheduled(self, name: str = None):
+        """
+        Декоратор для регистрации обработчика запланированного вызова (FSMContext.schedule(name, delay, ...)).
+        Обработчик вызывается с аргументами (fsm_context, data).
+
+        Args:
+            name (str, optional): Имя вызова, по умолчанию имя функции.
+
+        Returns:
+            Callable: Декоратор для регистрации обработчика.
+        """
+        def decorator(func: Callable):
+            self.scheduled_handlers[name or func.__name__] = func
+            return func
+        return decorator
+
+    async def handle_timer(self, fsm_context: FSMContext, name: str, payload: Any) -> bool:
+        """
+        Обрабатывает сработавший таймер FSM маршрутизатора.
+
+        Args:
+            fsm_context (FSMContext): Контекст чата.
+            name (str): Имя запланированного вызова, пустая строка для истечения состояния.
+            payload (Any): Истекшее состояние или данные запланированного вызова.
+
+        Returns:
+            bool: True, если обработчик найден и выполнен.
+        """
+        if not name:
+            for states, handler in self.timeout_handlers:
+                if not states or payload in states:
+                    logging.debug(f"State timeout handler {handler.__name__} for {payload}")
+                    await call_handler(handler, fsm_context, payload)
+                    return True
+            return False
+        handler = self.scheduled_handlers.get(name)
+        if handler is None:
+            logging.warning(f"No scheduled handler {name}")
+            return False
+        await call_handler(handler, fsm_context, payload)
+        return True
+
+    def add_router(self, router: 'Router'):
+        """
+        Добавляет вложенный маршрутизатор в список маршрутизаторов.
+
+        Args:
+            router (Router): Вложенный маршрутизатор для добавления.
+        """
+        self.routers.append(router)
+
+    def _get_text_index(self) -> Tuple[TextMatcher, Dict[int, List[Union[MagicFilter, State]]]]:
+        """
+        Возвращает TextMatcher правил текста обработчиков сообщений (первый фильтр regexp или
+        contains_any каждого обработчика) и остальные фильтры этих обработчиков.
+        Строится заново после изменения списка обработчиков.
+
+        Returns:
+            Tuple[TextMatcher, Dict[int, List[Union[MagicFilter, State]]]]: Правила и остальные фильтры по номеру обработчика.
+        """
+        size = len(self.message_handlers)
+        if self._text_index is None or self._text_index[0] != size:
+            rules: Dict[int, TextRule] = {}
+            rest_filters = {}
+            for index, (filters, _) in enumerate(self.message_handlers):
+                for position, f in enumerate(filters):
+                    if isinstance(f, MagicFilter) and f.text_rule is not None:
+                        rules[index] = f.text_rule
+                        rest_filters[index] = filters[:position] + filters[position + 1:]
+                        break
+            self._text_index = (size, TextMatcher(rules), rest_filters)
+        return self._text_index[1], self._text_index[2]
+
+    async def handle_message(self, message_data: Dict[str, Any], bot: 'BitrixBot' = None, namespace: str = None) -> bool:
+        """
+        Обрабатывает сообщение, проходя по списку обработчиков и вызывая соответствующие.
+
+        Args:
+            message_data (Dict[str, Any]): Данные сообщения.
+            bot (BitrixBot, optional): Бот портала, доступный обработчику как message.bot.
+            namespace (str, optional): Пространство имен FSM.
+
+        Returns:
+            bool: True, если обработчик найден и выполнен, иначе False.
+        """
+        if message_data.get('event') == "ONIMBOTMESSAGEADD":
+            message = Message(message_data, bot)
+            fsm = self.fsm if namespace is None else self.fsm.namespace(namespace)
+            chat_id = message.get_chat_id()
+            fsm_context = await fsm.get_context(chat_id) if chat_id else FSMContext()
+
+            matcher, rest_filters = self._get_text_index()
+            next_match = -1
+            for index, (filters, handler) in enumerate(self.message_handlers):
+                if index in rest_filters:
+                    # правила текста следующих обработчиков проверяются вместе
+                    if next_match < index:
+                        next_match = matcher.first(message.get_text(), index)
+                        if next_match is None:
+                            next_match = len(self.message_handlers)
+                    if next_match != index:
+                        continue
+                    filters = rest_filters[index]
+                if await self._apply_filters(filters, message, fsm_context):
+                    logging.debug(f"Handler {handler.__name__} matched for message: {message.get_text()}")
+                    await call_handler(handler, message, fsm_context)
+                    return True
+            return False
+
+    async def handle_callback_query(self, data: Dict[str, Any], bot: 'BitrixBot' = None, namespace: str = None) -> bool:
+        """
+        Обрабатывает команду, проходя по списку обработчиков и вызывая соответствующие.
+
+        Args:
+            data (Dict[str, Any]): Данные команды.
+            bot (BitrixBot, optional): Бот портала, доступный обработчику как command.bot.
+            namespace (str, optional): Пространство имен FSM.
+
+        Returns:
+            bool: True, если обработчик найден и выполнен, иначе False.
+        """
+        if data.get('event') == "ONIMCOMMANDADD":
+            command = Command(data, bot=bot)
+            fsm = self.fsm if namespace is None else self.fsm.namespace(namespace)
+            chat_id = command.get_chat_id()
+            fsm_context = await fsm.get_context(chat_id) if chat_id else FSMContext()
+
+            for handler_name, (filters, handler) in self.callback_query_handlers.items():
+                if await self._apply_filters(filters, command, fsm_context):
+                    logging.debug(f"Callback handler {handler_name} matched for command: {command.get_command_name()}")
+                    await call_handler(handler, command, fsm_context)
+                    return True
+        return False
+
+    async def _apply_filters(self, filters: List[Union[MagicFilter, State]], obj: Union[Message, Command], fsm_context: FSMContext) -> bool:
+        """
+        Применяет список фильтров к объекту сообщения или команды.
+    
+        Args:
+            filters (List[Union[MagicFilter, State]]): Список фильтров.
+            obj (Union[Message, Command]): Объект сообщения или команды.
+            fsm_context (FSMContext): Контекст состояния FSM.
+    
+        Returns:
+            bool: True, если все фильтры пройдены, иначе False.
+        """
+        for f in filters:
+            if isinstance(f, State):
+                if await fsm_context.get_state() != f:
+                    return False
+            elif callable(f):  # Проверяем, является ли f callable
+                if not await f(obj, fsm_context):
+                    return False
+            else:
+                return False  # Возможно, нужно обработать другие типы фильтров или состояния
+        return True
+
+    async def parse_command_data(self, data: dict) -> dict:
+        """
+        Парсит данные команды из словаря.
+
+        Args:
+            data (dict): Словарь данных команды.
+
+        Returns:
+            dict: Распарсенные данные команды.
+        """
+        return dict(WebhookUpdate.from_flat(data).command)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковый разбор тел вебхуков Bitrix24 (application/x-www-form-urlencoded).
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import quote_plus, unquote_plus
+
+
+MAX_BODY_SIZE = 1024 * 1024
+
+_CACHE_SIZE = 4096
+_CACHED_KEY_SIZE = 128
+_CACHED_VALUE_SIZE = 128
+
+# Ключи событий Bitrix24 и многие значения (токены, домен, идентификаторы) повторяются
+# от запроса к запросу, поэтому результаты декодирования кешируются. Кеш очищается
+# при переполнении. Кешируются только короткие ключи и значения, чтобы тела
+# неаутентифицированных запросов с уникальными длинными ключами не занимали память.
+_key_paths: Dict[str, Tuple[str, ...]] = {}
+_raw_keys: Dict[bytes, Tuple[str, Tuple[str, ...]]] = {}
+_raw_values: Dict[bytes, str] = {}
+
+
+class BodyTooLarge(ValueError):
+    """
+    Тело запроса превышает допустимый размер.
+
+    Attributes:
+        limit (int): Допустимый размер в байтах.
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(f"request body exceeds {limit} bytes")
+        self.limit = limit
+
+
+def split_key(key: str) -> Tuple[str, ...]:
+    """
+    Разбивает ключ формы вида "data[PARAMS][MESSAGE]" на путь ("data", "PARAMS", "MESSAGE").
+
+    Args:
+        key (str): Ключ формы.
+
+    Returns:
+        Tuple[str, ...]: Путь во вложенной структуре.
+    """
+    path = _key_paths.get(key)
+    if path is None:
+        start = key.find('[')
+        if start <= 0 or not key.endswith(']'):
+            path = (key,)
+        else:
+            path = (key[:start],) + tuple(key[start + 1:-1].split(']['))
+        if len(key) <= _CACHED_KEY_SIZE:
+            if len(_key_paths) >= _CACHE_SIZE:
+                _key_paths.clear()
+            _key_paths[key] = path
+    return path
+
+
+class WebhookUpdate(dict):
+    """
+    Обновление вебхука: плоский словарь с исходными ключами формы ("data[PARAMS][MESSAGE]")
+    и вложенная структура, построенная при разборе.
+
+    Плоские ключи сохранены для совместимости с существующими обработчиками и фильтрами.
+
+    Attributes:
+        nested (Dict[str, Any]): Вложенная структура {"data": {"PARAMS": {"MESSAGE": ...}}}.
+    """
+
+    __slots__ = ('nested', '_command')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nested: Dict[str, Any] = {}
+        self._command = None
+        for key, value in dict.items(self):
+            self._insert(key, value)
+
+    @classmethod
+    def from_flat(cls, data: Union[Dict[str, Any], 'WebhookUpdate']) -> 'WebhookUpdate':
+        """
+        Создает обновление из плоского словаря, например из request.post() или записи.
+
+        Args:
+            data (Dict[str, Any]): Плоский словарь с ключами формы.
+
+        Returns:
+            WebhookUpdate: Обновление (тот же объект, если data уже WebhookUpdate).
+        """
+        return data if isinstance(data, cls) else cls(data)
+
+    def add(self, key: str, value: str):
+        """
+        Добавляет поле формы. Повторные ключи игнорируются, как при dict(request.post()).
+
+        Args:
+            key (str): Ключ формы.
+            value (str): Значение.
+        """
+        if key not in self:
+            dict.__setitem__(self, key, value)
+            self._insert(key, value)
+
+    def _insert(self, key: str, value: Any, path: Tuple[str, ...] = None):
+        node = self.nested
+        if path is None:
+            path = split_key(key)
+        for part in path[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[path[-1]] = value
+
+    def get_path(self, *path: str, default: Any = None) -> Any:
+        """
+        Возвращает значение по пути во вложенной структуре.
+
+        Args:
+            *path (str): Путь, например "data", "PARAMS", "MESSAGE".
+            default (Any, optional): Значение, если путь не найден.
+
+        Returns:
+            Any: Значение или вложенный словарь.
+        """
+        node = self.nested
+        for part in path:
+            if not isinstance(node, dict) or part not in node:
+                return default
+            node = node[part]
+        return node
+
+    @property
+    def command(self) -> Dict[str, Any]:
+        """
+        Данные команды data[COMMAND][<id>] с ключами в нижнем регистре, как в Router.parse_command_data.
+        Вычисляются один раз на обновление.
+
+        Returns:
+            Dict[str, Any]: Данные команды, пустой словарь для других событий.
+        """
+        if self._command is None:
+            command = {}
+            commands = self.get_path('data', 'COMMAND')
+            if isinstance(commands, dict):
+                for fields in commands.values():
+                    if isinstance(fields, dict):
+                        command.update((key.lower(), value) for key, value in fields.items())
+            self._command = command
+        return self._command
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._insert(key, value)
+        self._command = None
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def _unquote(raw: bytes, encoding: str) -> str:
+    text = raw.decode(encoding, 'replace')
+    if b'%' in raw or b'+' in raw:
+        return unquote_plus(text, encoding, 'replace')
+    return text
+
+
+def _decode_key(raw: bytes, encoding: str) -> Tuple[str, Tuple[str, ...]]:
+    key = _unquote(raw, encoding)
+    entry = (key, split_key(key))
+    if len(raw) <= _CACHED_KEY_SIZE:
+        if len(_raw_keys) >= _CACHE_SIZE:
+            _raw_keys.clear()
+        _raw_keys[raw] = entry
+    return entry
+
+
+def _decode_value(raw: bytes, encoding: str) -> str:
+    value = _unquote(raw, encoding)
+    if len(raw) <= _CACHED_VALUE_SIZE:
+        if len(_raw_values) >= _CACHE_SIZE:
+            _raw_values.clear()
+        _raw_values[raw] = value
+    return value
+
+
+class FormDecoder:
+    """
+    Потоковый декодер тела application/x-www-form-urlencoded.
+
+    Тело разбирается по мере поступления фрагментов за один проход: пары разделяются,
+    декодируются и сразу добавляются в WebhookUpdate вместе с вложенной структурой.
+
+    Attributes:
+        max_size (int): Максимальный размер тела в байтах, 0 - без ограничения.
+        size (int): Количество полученных байт.
+    """
+
+    def __init__(self, max_size: int = MAX_BODY_SIZE, encoding: str = 'utf-8'):
+        """
+        Args:
+            max_size (int, optional): Максимальный размер тела, по умолчанию 1 МиБ.
+            encoding (str, optional): Кодировка значений.
+        """
+        self.max_size = max_size
+        self.encoding = encoding
+        self.size = 0
+        self._tail = b''
+        self._update = WebhookUpdate()
+
+    def feed(self, chunk: bytes):
+        """
+        Разбирает очередной фрагмент тела.
+
+        Args:
+            chunk (bytes): Фрагмент.
+
+        Raises:
+            BodyTooLarge: Превышен max_size.
+        """
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise BodyTooLarge(self.max_size)
+        if self._tail:
+            chunk = self._tail + chunk
+        pairs = chunk.split(b'&')
+        self._tail = pairs.pop()
+        self._add(pairs)
+
+    def close(self) -> WebhookUpdate:
+        """
+        Завершает разбор.
+
+        Returns:
+            WebhookUpdate: Разобранное обновление.
+        """
+        if self._tail:
+            self._add((self._tail,))
+            self._tail = b''
+        return self._update
+
+    def _add(self, pairs: Iterable[bytes]):
+        update = self._update
+        nested = update.nested
+        encoding = self.encoding
+        raw_keys = _raw_keys
+        raw_values = _raw_values
+        for pair in pairs:
+            if not pair:
+                continue
+            raw_key, _, raw_value = pair.partition(b'=')
+            key, path = raw_keys.get(raw_key) or _decode_key(raw_key, encoding)
+            if key in update:
+                continue
+            value = raw_values.get(raw_value)
+            if value is None:
+                value = _decode_value(raw_value, encoding)
+            dict.__setitem__(update, key, value)
+            node = nested
+            for part in path[:-1]:
+                child = node.get(part)
+                if child.__class__ is not dict:
+                    child = node[part] = {}
+                node = child
+            node[path[-1]] = value
+
+
+@lru_cache(maxsize=64)
+def _field_names(key: str, encoding: str) -> Tuple[bytes, bytes]:
+    return key.encode(encoding) + b'=', quote_plus(key, safe='', encoding=encoding).encode('ascii') + b'='
+
+
+def find_field(body: bytes, key: str, encoding: str = 'utf-8') -> Optional[str]:
+    """
+    Находит значение поля формы в теле без разбора остальных полей.
+
+    Args:
+        body (bytes): Тело application/x-www-form-urlencoded.
+        key (str): Ключ формы, например "auth[application_token]".
+        encoding (str, optional): Кодировка значения.
+
+    Returns:
+        Optional[str]: Значение первого вхождения поля или None.
+    """
+    for name in _field_names(key, encoding):
+        position = -1
+        while True:
+            position = body.find(name, position + 1)
+            if position < 0:
+                break
+            if position == 0 or body[position - 1] == 0x26:  # начало пары, после "&"
+                start = position + len(name)
+                end = body.find(b'&', start)
+                return _unquote(body[start:] if end < 0 else body[start:end], encoding)
+    return None
+
+
+def decode_form(body: Union[bytes, Iterable[bytes]], max_size: int = MAX_BODY_SIZE) -> WebhookUpdate:
+    """
+    Разбирает тело вебхука целиком.
+
+    Args:
+        body (Union[bytes, Iterable[bytes]]): Тело или последовательность фрагментов.
+        max_size (int, optional): Максимальный размер тела.
+
+    Returns:
+        WebhookUpdate: Разобранное обновление.
+
+    Raises:
+        BodyTooLarge: Превышен max_size.
+    """
+    decoder = FormDecoder(max_size)
+    for chunk in ((body,) if isinstance(body, (bytes, bytearray)) else body):
+        decoder.feed(bytes(chunk))
+    return decoder.close()
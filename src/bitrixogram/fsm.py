@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""
+Конечный автомат (FSM) состояний чатов.
+"""
+
+import logging
+import pickle
+import sys
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Tuple
+
+from .timers import Scheduler
+
+
+_state_ids: Dict[Any, int] = {}
+_state_values: List[Any] = [None]
+
+
+def _state_key(state: Any) -> Any:
+    return ('State', state.name) if isinstance(state, State) else state
+
+
+def intern_state(state: Any) -> int:
+    """
+    Возвращает небольшой целочисленный идентификатор состояния. Состояния с одинаковым
+    именем получают один идентификатор, None - идентификатор 0.
+
+    Args:
+        state (Any): Состояние (State или другое хешируемое значение).
+
+    Returns:
+        int: Идентификатор состояния.
+    """
+    if state is None:
+        return 0
+    key = _state_key(state)
+    state_id = _state_ids.get(key)
+    if state_id is None:
+        state_id = _state_ids[key] = len(_state_values)
+        _state_values.append(state)
+    return state_id
+
+
+class _ContextData(dict):
+    """
+    Словарь данных контекста без записи в хранилище: сохраняется в FSM при первом изменении,
+    поэтому чтение данных не создает запись для чата. До первого изменения все обращения
+    к данным чата получают этот же словарь.
+    """
+
+    __slots__ = ('_fsm', '_chat_id', '__weakref__')
+
+    def __init__(self, fsm: 'FSM', chat_id: int):
+        super().__init__()
+        self._fsm = fsm
+        self._chat_id = chat_id
+
+    def _attach(self):
+        if self._fsm is not None:
+            self._fsm._data[self._chat_id] = self
+            self._fsm._detached.pop(self._chat_id, None)
+            self._fsm = None
+
+    def __setitem__(self, key, value):
+        self._attach()
+        super().__setitem__(key, value)
+
+    def update(self, *args, **kwargs):
+        self._attach()
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._attach()
+        return super().setdefault(key, default)
+
+    def __ior__(self, other):
+        self._attach()
+        return super().__ior__(other)
+
+
+class FSMContext:
+    """
+    Класс, представляющий контекст конечного автомата (FSM) для конкретного чата.
+
+    Контекст - легкое представление записи в хранилище FSM: состояние хранится как
+    идентификатор, данные - только если они были записаны.
+
+    Attributes:
+        chat_id (int): Идентификатор чата.
+        state (State): Текущее состояние.
+        data (dict): Дополнительные данные, связанные с контекстом.
+        namespace (str): Пространство имен FSM контекста (например, ключ портала) или None.
+    """
+
+    __slots__ = ('chat_id', '_fsm')
+
+    def __init__(self, chat_id: int = None, fsm: 'FSM' = None):
+        """
+        Инициализация контекста FSM для конкретного чата.
+
+        Args:
+            chat_id (int, optional): Идентификатор чата.
+            fsm (FSM, optional): Хранилище контекстов, по умолчанию собственное.
+        """
+        self.chat_id = chat_id
+        self._fsm = fsm if fsm is not None else FSM()
+
+    @property
+    def state(self):
+        return _state_values[self._fsm._states.get(self.chat_id, 0)]
+
+    @state.setter
+    def state(self, state):
+        state_id = intern_state(state)
+        if state_id:
+            self._fsm._states[self.chat_id] = state_id
+        else:
+            self._fsm._states.pop(self.chat_id, None)
+        if self._fsm._timers:
+            self._fsm._cancel((self.chat_id, ''))
+
+    @property
+    def namespace(self) -> str:
+        return self._fsm.name
+
+    @property
+    def data(self) -> dict:
+        return self._fsm._get_data(self.chat_id)
+
+    @data.setter
+    def data(self, data: dict):
+        self._fsm._cold.pop(self.chat_id, None)
+        self._fsm._detached.pop(self.chat_id, None)
+        if data:
+            self._fsm._data[self.chat_id] = data
+        else:
+            self._fsm._data.pop(self.chat_id, None)
+
+    async def set_state(self, state: 'State', ttl: float = None):
+        """
+        Устанавливает состояние контекста.
+
+        Args:
+            state (State): Новое состояние.
+            ttl (float, optional): Время жизни состояния в секундах. Если состояние не изменится за это время,
+                оно сбрасывается и вызываются обработчики Router.state_timeout.
+        """
+        self.state = state
+        if ttl is not None and state is not None:
+            self._fsm._schedule((self.chat_id, ''), ttl, intern_state(state))
+
+    async def schedule(self, name: str, delay: float, **data):
+        """
+        Планирует вызов обработчика Router.scheduled(name) для этого чата через delay секунд.
+        Повторное планирование с тем же именем заменяет предыдущий таймер. Таймеры сохраняются
+        вместе с контекстами FSM.
+
+        Args:
+            name (str): Имя обработчика.
+            delay (float): Задержка в секундах.
+            **data: Данные для обработчика (должны сериализоваться в JSON для сохранения).
+        """
+        if not name:
+            raise ValueError("timer name must not be empty")
+        self._fsm._schedule((self.chat_id, name), delay, data)
+
+    async def cancel(self, name: str) -> bool:
+        """
+        Отменяет запланированный вызов.
+
+        Args:
+            name (str): Имя обработчика.
+
+        Returns:
+            bool: True, если таймер был запланирован.
+        """
+        return self._fsm._cancel((self.chat_id, name))
+
+    async def get_state(self):
+        """
+        Возвращает текущее состояние контекста.
+
+        Returns:
+            State: Текущее состояние.
+        """
+        return self.state
+
+    async def clear_state(self):
+        """
+        Очищает состояние контекста, устанавливая его в None.
+        """
+        self.state = None
+
+    async def update_data(self, **kwargs):
+        """
+        Обновляет дополнительные данные контекста.
+
+        Args:
+            **kwargs: Пары ключ-значение для обновления данных.
+        """
+        self.data.update(kwargs)
+
+    async def get_data(self):
+        """
+        Возвращает дополнительные данные контекста.
+
+        Returns:
+            dict: Дополнительные данные.
+        """
+        return self.data
+
+    async def get_chat_id(self) -> int:
+        """
+        Возвращает идентификатор чата.
+
+        Returns:
+            int: Идентификатор чата.
+        """
+        return self.chat_id
+
+
+def _refcount(store: dict, key: Any) -> int:
+    return sys.getrefcount(store[key])
+
+
+class FSM:
+    """
+    Класс, представляющий конечный автомат (FSM) для управления контекстами различных чатов.
+
+    Контексты не хранятся как объекты: для чата хранится только идентификатор состояния
+    (если состояние задано) и словарь данных (если данные записаны), чат без состояния
+    и данных не занимает памяти. Данные давно не использованных чатов можно упаковать
+    в бинарный вид методом compact.
+
+    Таймеры состояний и запланированные вызовы хранятся в FSM (по одному на чат и имя),
+    срабатывание обслуживает общий Scheduler.
+
+    Attributes:
+        namespaces (dict): Вложенные FSM с собственными контекстами, например для разных порталов.
+        scheduler (Scheduler): Планировщик таймеров.
+        timer_handler (Callable): Функция (context, name, payload), вызываемая при срабатывании таймера.
+        name (str): Имя пространства имен или None для корневого FSM.
+    """
+
+    def __init__(self, scheduler: Scheduler = None, timer_handler: Callable = None):
+        """
+        Инициализация FSM.
+
+        Args:
+            scheduler (Scheduler, optional): Планировщик таймеров, по умолчанию общий для всех FSM.
+            timer_handler (Callable, optional): Обработчик сработавших таймеров, обычно задается Router.
+        """
+        self._states: Dict[int, int] = {}
+        self._data: Dict[int, dict] = {}
+        self._cold: Dict[int, bytes] = {}
+        self._used: set = set()
+        self._detached: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._timers: Dict[Tuple[int, str], Tuple[float, int, Any]] = {}
+        self.namespaces: Dict[str, 'FSM'] = {}
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        self.timer_handler = timer_handler
+        self.name = None
+
+    def namespace(self, name: str) -> 'FSM':
+        """
+        Возвращает FSM пространства имен name. Контексты чатов разных пространств не пересекаются.
+
+        Args:
+            name (str): Имя пространства, например ключ портала.
+
+        Returns:
+            FSM: FSM пространства имен.
+        """
+        fsm = self.namespaces.get(name)
+        if fsm is None:
+            fsm = self.namespaces[name] = FSM(self.scheduler, self.timer_handler)
+            fsm.name = name
+        return fsm
+
+    def _schedule(self, key: Tuple[int, str], delay: float, payload: Any):
+        when = self.scheduler.time() + delay
+        if key in self._timers:
+            self.scheduler.discard()
+        self._timers[key] = (when, self.scheduler.schedule(when, self, key), payload)
+
+    def _cancel(self, key: Tuple[int, str]) -> bool:
+        if self._timers.pop(key, None) is None:
+            return False
+        self.scheduler.discard()
+        return True
+
+    def _is_current(self, key: Tuple[int, str], seq: int) -> bool:
+        entry = self._timers.get(key)
+        return entry is not None and entry[1] == seq
+
+    def _fire(self, key: Tuple[int, str], seq: int) -> bool:
+        """
+        Срабатывание таймера: для таймера состояния сбрасывает состояние (если оно не менялось),
+        затем передает таймер в timer_handler.
+
+        Returns:
+            bool: False, если таймер устарел (отменен или заменен).
+        """
+        if not self._is_current(key, seq):
+            return False
+        _, _, payload = self._timers.pop(key)
+        chat_id, name = key
+        if not name:
+            if self._states.get(chat_id) != payload:
+                return True
+            del self._states[chat_id]
+            payload = _state_values[payload]
+        if self.timer_handler is not None:
+            self.scheduler.spawn(self.timer_handler(FSMContext(chat_id, self), name, payload))
+        return True
+
+    @property
+    def contexts(self) -> Dict[int, FSMContext]:
+        """
+        Контексты чатов, у которых задано состояние или данные.
+
+        Returns:
+            Dict[int, FSMContext]: Словарь, где ключ - идентификатор чата, а значение - контекст FSM.
+        """
+        return {chat_id: FSMContext(chat_id, self) for chat_id in self.chat_ids()}
+
+    def chat_ids(self) -> set:
+        """
+        Возвращает идентификаторы чатов, у которых задано состояние или данные.
+
+        Returns:
+            set: Идентификаторы чатов.
+        """
+        return self._states.keys() | self._data.keys() | self._cold.keys()
+
+    def _get_data(self, chat_id: int) -> dict:
+        self._used.add(chat_id)
+        data = self._data.get(chat_id)
+        if data is None:
+            blob = self._cold.pop(chat_id, None)
+            if blob is None:
+                data = self._detached.get(chat_id)
+                if data is None:
+                    data = self._detached[chat_id] = _ContextData(self, chat_id)
+                return data
+            data = self._data[chat_id] = pickle.loads(blob)
+        return data
+
+    def compact(self) -> int:
+        """
+        Упаковывает в бинарный вид (pickle) данные чатов, к которым не обращались с предыдущего
+        вызова compact и словарь которых больше нигде не используется (например, обработчиком,
+        ожидающим ответа). Данные распаковываются автоматически при следующем обращении.
+        Данные, которые не сериализуются pickle, остаются неупакованными, в лог пишется предупреждение.
+        Предназначен для периодического вызова, например раз в несколько минут.
+
+        Returns:
+            int: Количество упакованных контекстов.
+        """
+        # словарь, на который ссылается только FSM, имеет столько же ссылок, сколько новый словарь в {0: {}}
+        unused = _refcount({0: {}}, 0) if hasattr(sys, 'getrefcount') else None
+        cold = [chat_id for chat_id in self._data
+                if chat_id not in self._used and (unused is None or _refcount(self._data, chat_id) <= unused)]
+        packed = 0
+        for chat_id in cold:
+            try:
+                blob = pickle.dumps(dict(self._data[chat_id]), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logging.warning(f"FSM data of chat {chat_id} is not compacted, it cannot be pickled: {e!r}")
+                continue
+            self._cold[chat_id] = blob
+            del self._data[chat_id]
+            packed += 1
+        self._used = set()
+        for fsm in self.namespaces.values():
+            fsm.compact()
+        return packed
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Оценивает память, занимаемую контекстами (без вложенных пространств имен).
+
+        Returns:
+            Dict[str, Any]: Количество чатов с состоянием, с данными, с упакованными данными,
+                общий объем в байтах и средний объем на контекст.
+        """
+        total = sys.getsizeof(self._states) + sys.getsizeof(self._data) + sys.getsizeof(self._cold)
+        for chat_id, state_id in self._states.items():
+            total += sys.getsizeof(chat_id)
+        for chat_id, data in self._data.items():
+            total += sys.getsizeof(chat_id) + sys.getsizeof(data)
+            total += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in data.items())
+        for chat_id, blob in self._cold.items():
+            total += sys.getsizeof(chat_id) + sys.getsizeof(blob)
+        contexts = len(self.chat_ids())
+        return {
+            'contexts': contexts,
+            'states': len(self._states),
+            'data': len(self._data),
+            'cold': len(self._cold),
+            'timers': len(self._timers),
+            'bytes': total,
+            'bytes_per_context': total / contexts if contexts else 0.0,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Сериализует непустые контексты (состояние по имени и данные) для сохранения в JSON.
+
+        Returns:
+            Dict[str, Any]: {"contexts": [...], "namespaces": {имя: ...}}.
+        """
+        contexts = []
+        for chat_id in self.chat_ids():
+            state = _state_values[self._states.get(chat_id, 0)]
+            # упакованные данные читаются из копии: они остаются упакованными и не считаются использованными
+            data = self._data.get(chat_id)
+            if data is None:
+                blob = self._cold.get(chat_id)
+                data = pickle.loads(blob) if blob is not None else {}
+            contexts.append({'chat_id': chat_id, 'state': state.name if isinstance(state, State) else state,
+                             'data': dict(data)})
+        timers = []
+        if self._timers:
+            offset = time.time() - self.scheduler.time()
+            for (chat_id, name), (when, _, payload) in self._timers.items():
+                if not name:
+                    state = _state_values[payload]
+                    payload = state.name if isinstance(state, State) else state
+                timers.append({'chat_id': chat_id, 'name': name, 'due': when + offset, 'data': payload})
+        return {'contexts': contexts, 'timers': timers, 'namespaces': {name: fsm.to_dict() for name, fsm in self.namespaces.items()}}
+
+    def load_dict(self, data: Dict[str, Any]):
+        """
+        Восстанавливает контексты из результата to_dict. Состояния восстанавливаются по имени
+        и равны одноименным состояниям StatesGroup.
+
+        Args:
+            data (Dict[str, Any]): Сериализованные контексты.
+        """
+        for item in data.get('contexts', ()):
+            context = FSMContext(item['chat_id'], self)
+            context.state = State(item['state']) if item.get('state') is not None else None
+            context.data = item.get('data') or {}
+        now = time.time()
+        for item in data.get('timers', ()):
+            payload = item.get('data')
+            if not item['name']:
+                payload = intern_state(State(payload))
+            self._schedule((item['chat_id'], item['name']), max(0.0, item['due'] - now), payload)
+        for name, namespace in data.get('namespaces', {}).items():
+            self.namespace(name).load_dict(namespace)
+
+    async def get_context(self, chat_id: int) -> FSMContext:
+        """
+        Возвращает контекст FSM для заданного чата. Запись в хранилище создается только
+        при установке состояния или записи данных.
+
+        Args:
+            chat_id (int): Идентификатор чата.
+
+        Returns:
+            FSMContext: Контекст FSM для заданного чата.
+        """
+        return FSMContext(chat_id, self)
+
+
+default_scheduler = Scheduler()
+
+
+class State:
+    """
+    Класс, представляющий отдельное состояние.
+
+    Атрибуты:
+        name (str): Имя состояния.
+    """
+
+    __slots__ = ('name',)
+
+    def __init__(self, name: str = None):
+
+        self.name = name
+
+    def set_name(self, name: str):
+        """
+        Устанавливает имя состояния.
+
+        Args:
+            name (str): Имя состояния.
+        """
+        self.name = name
+
+    def __eq__(self, other):
+
+        if isinstance(other, State):
+            return self.name == other.name
+        return False
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f"State(name={self.name})"
+
+
+class StatesGroup:
+    """
+    Класс, представляющий группу состояний.
+
+    Метакласс автоматически присваивает имена состояниям на основе атрибутов класса.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, value in cls.__dict__.items():
+            if isinstance(value, State):
+                value.set_name(name)
+
+    def __repr__(self):
+        states = {name: value for name, value in self.__class__.__dict__.items() if isinstance(value, State)}
+        return f"StatesGroup(states={states})"
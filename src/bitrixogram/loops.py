@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Запуск бота на стандартном цикле событий asyncio или на альтернативном (uvloop).
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+from typing import Any, Callable, Coroutine
+
+LOOP_ENV = 'BITRIXOGRAM_LOOP'
+
+
+def loop_factory(name: str = None) -> Callable[[], asyncio.AbstractEventLoop]:
+    """
+    Возвращает функцию создания цикла событий.
+
+    Args:
+        name (str, optional): "asyncio", "uvloop", имя другого модуля с функцией new_event_loop
+            (например, "winloop") или "auto" - uvloop, если он установлен, иначе asyncio.
+            По умолчанию значение переменной окружения BITRIXOGRAM_LOOP или "asyncio":
+            альтернативный цикл включается только явно.
+
+    Returns:
+        Callable[[], AbstractEventLoop]: Функция создания цикла.
+    """
+    name = name or os.environ.get(LOOP_ENV) or 'asyncio'
+    if name == 'asyncio':
+        return asyncio.new_event_loop
+    if name == 'auto':
+        try:
+            return importlib.import_module('uvloop').new_event_loop
+        except ImportError:
+            logging.debug("uvloop is not installed, using the asyncio event loop")
+            return asyncio.new_event_loop
+    return importlib.import_module(name).new_event_loop
+
+
+def loop_name(loop: asyncio.AbstractEventLoop = None) -> str:
+    """
+    Возвращает название реализации цикла событий.
+
+    Args:
+        loop (AbstractEventLoop, optional): Цикл, по умолчанию текущий.
+
+    Returns:
+        str: "asyncio" для стандартного цикла или имя пакета альтернативного цикла.
+    """
+    loop = loop or asyncio.get_running_loop()
+    module = type(loop).__module__.split('.')[0]
+    return 'asyncio' if module == 'asyncio' else module
+
+
+def run(main: Coroutine, loop: str = None, debug: bool = None) -> Any:
+    """
+    Выполняет корутину в новом цикле событий, как asyncio.run, с выбором реализации цикла.
+
+        from bitrixogram.loops import run
+        run(main())                  # стандартный цикл asyncio
+        run(main(), loop="auto")     # uvloop, если установлен, иначе asyncio
+
+    Args:
+        main (Coroutine): Корутина.
+        loop (str, optional): Реализация цикла, см. loop_factory. По умолчанию BITRIXOGRAM_LOOP или "asyncio".
+        debug (bool, optional): Режим отладки asyncio.
+
+    Returns:
+        Any: Результат корутины.
+    """
+    factory = loop_factory(loop)
+    if hasattr(asyncio, 'Runner'):
+        with asyncio.Runner(debug=debug, loop_factory=factory) as runner:
+            return runner.run(main)
+    event_loop = factory()
+    try:
+        asyncio.set_event_loop(event_loop)
+        if debug is not None:
+            event_loop.set_debug(debug)
+        return event_loop.run_until_complete(main)
+    finally:
+        try:
+            _cancel_tasks(event_loop)
+            event_loop.run_until_complete(event_loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            event_loop.close()
+
+
+def _cancel_tasks(loop: asyncio.AbstractEventLoop):
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Сопоставление текста сообщений с ключевыми словами и шаблонами многих обработчиков.
+"""
+
+import bisect
+from typing import Dict, List, NamedTuple, Optional, Pattern, Set, Tuple, Union
+
+
+class Keywords(NamedTuple):
+    """
+    Ключевые слова фильтра MagicFilter.contains_any. Сравниваются без учета регистра (str.casefold).
+
+    Attributes:
+        words (Tuple[str, ...]): Слова или фразы.
+        whole_words (bool): Искать только целые слова.
+    """
+    words: Tuple[str, ...]
+    whole_words: bool = True
+
+
+TextRule = Union[Pattern, Keywords]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class _Automaton:
+    """
+    Автомат Ахо-Корасик: находит ключевые слова всех обработчиков за один проход по тексту.
+    """
+
+    def __init__(self, keywords: Dict[int, Keywords]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int, bool]]] = [[]]
+        for index, rule in keywords.items():
+            for word in rule.words:
+                word = word.casefold()
+                if word:
+                    self._add(word, (index, len(word), rule.whole_words))
+        self._link()
+
+    def _add(self, word: str, output: Tuple[int, int, bool]):
+        state = 0
+        for char in word:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = self._goto[state][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = following
+        self._out[state].append(output)
+
+    def _link(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, following in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[following] = self._goto[fail].get(char, 0)
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+                queue.append(following)
+
+    def search(self, text: str) -> Set[int]:
+        """
+        Возвращает номера обработчиков, ключевые слова которых найдены в тексте.
+        """
+        text = text.casefold()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        size = len(text)
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                for index, length, whole_words in out[state]:
+                    if whole_words:
+                        start = position - length + 1
+                        if start > 0 and _is_word_char(text[start - 1]):
+                            continue
+                        if position + 1 < size and _is_word_char(text[position + 1]):
+                            continue
+                    found.add(index)
+        return found
+
+
+class TextMatcher:
+    """
+    Правила текста обработчиков сообщений маршрутизатора, проверяемые вместе.
+
+    Ключевые слова всех обработчиков (Keywords) объединены в автомат Ахо-Корасик и ищутся
+    за один проход по тексту, независимо от количества обработчиков. Регулярные выражения
+    проверяются скомпилированными шаблонами по порядку обработчиков без вызова асинхронных
+    фильтров. Шаблоны не объединяются в одно выражение с группой на обработчик: re ищет самое
+    левое совпадение в тексте, а не совпадение первого обработчика, а ветви вида (?s:.*?)шаблон,
+    сохраняющие порядок обработчиков, лишают re поиска по литеральному префиксу и проверяются
+    медленнее отдельных шаблонов. Фильтры fuzzy не имеют правила текста: они проверяются как
+    обычные фильтры своего обработчика, а TextMatcher лишь пропускает обработчики, правило
+    текста которых не выполнено. Результат поиска ключевых слов запоминается для последнего текста.
+
+    Attributes:
+        indexes (List[int]): Номера обработчиков с правилами по возрастанию.
+    """
+
+    def __init__(self, rules: Dict[int, TextRule]):
+        """
+        Args:
+            rules (Dict[int, TextRule]): Правила (Keywords или скомпилированный шаблон) по номеру обработчика.
+        """
+        self.indexes = sorted(rules)
+        self._rules = [rules[index] for index in self.indexes]
+        keywords = {index: rule for index, rule in rules.items() if isinstance(rule, Keywords)}
+        self._automaton = _Automaton(keywords) if keywords else None
+        self._text: Optional[str] = None
+        self._found: Set[int] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.indexes)
+
+    def first(self, text: str, index: int = 0) -> Optional[int]:
+        """
+        Находит первый обработчик с номером не меньше index, правило которого выполняется для текста.
+
+        Args:
+            text (str): Текст сообщения.
+            index (int, optional): Номер обработчика, с которого начинается поиск.
+
+        Returns:
+            Optional[int]: Номер обработчика или None.
+        """
+        if self._automaton is not None and text != self._text:
+            self._found = self._automaton.search(text)
+            self._text = text
+        found = self._found
+        position = bisect.bisect_left(self.indexes, index)
+        for handler_index, rule in zip(self.indexes[position:], self._rules[position:]):
+            if isinstance(rule, Keywords):
+                if handler_index in found:
+                    return handler_index
+            elif rule.search(text) is not None:
+                return handler_index
+        return None
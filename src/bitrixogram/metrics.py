@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Гистограмма задержек для нагрузочных тестов и метрик.
+"""
+
+from typing import Any, Dict, Iterable
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек в стиле HDR Histogram.
+
+    Значения хранятся в микросекундах в логарифмически-линейных корзинах: каждый
+    интервал [2^k, 2^(k+1)) делится на 2^sub_bucket_bits корзин, поэтому относительная
+    погрешность не превышает 1 / 2^sub_bucket_bits независимо от величины задержки,
+    а запись значения выполняется за O(1).
+
+    Attributes:
+        sub_bucket_bits (int): Точность: количество бит линейной части корзины.
+        count (int): Количество записанных значений.
+        total (float): Сумма значений в секундах.
+    """
+
+    PERCENTILES = (50.0, 90.0, 95.0, 99.0, 99.9)
+
+    def __init__(self, sub_bucket_bits: int = 7):
+        """
+        Инициализирует пустую гистограмму.
+
+        Args:
+            sub_bucket_bits (int, optional): Точность, по умолчанию 7 (погрешность менее 0.8%).
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self._sub_count = 1 << sub_bucket_bits
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self._min = None
+        self._max = None
+
+    def _index(self, value: int) -> int:
+        sub_count = self._sub_count
+        if value < 2 * sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return sub_count * shift + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        """
+        Возвращает наибольшее значение (мкс), попадающее в корзину.
+        """
+        sub_count = self._sub_count
+        if index < 2 * sub_count:
+            return index
+        shift = index // sub_count - 1
+        top = index - sub_count * shift
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds: float, count: int = 1):
+        """
+        Записывает значение задержки.
+
+        Args:
+            seconds (float): Задержка в секундах.
+            count (int, optional): Количество одинаковых значений.
+        """
+        value = max(0, int(seconds * 1e6))
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+        self.count += count
+        self.total += seconds * count
+        if self._min is None or seconds < self._min:
+            self._min = seconds
+        if self._max is None or seconds > self._max:
+            self._max = seconds
+
+    def merge(self, other: 'LatencyHistogram'):
+        """
+        Добавляет значения другой гистограммы с той же точностью.
+
+        Args:
+            other (LatencyHistogram): Гистограмма.
+        """
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other._min, other._max):
+            if value is not None:
+                self._min = value if self._min is None else min(self._min, value)
+                self._max = value if self._max is None else max(self._max, value)
+
+    def reset(self):
+        """
+        Очищает гистограмму.
+        """
+        self._counts.clear()
+        self.count = 0
+        self.total = 0.0
+        self._min = None
+        self._max = None
+
+    def percentile(self, percent: float) -> float:
+        """
+        Возвращает значение перцентиля.
+
+        Args:
+            percent (float): Перцентиль от 0 до 100.
+
+        Returns:
+            float: Задержка в секундах (верхняя граница корзины), 0 для пустой гистограммы.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._value(index) / 1e6, self._max)
+        return self._max
+
+    def percentiles(self, percents: Iterable[float] = PERCENTILES) -> Dict[str, float]:
+        """
+        Возвращает несколько перцентилей за один проход.
+
+        Args:
+            percents (Iterable[float], optional): Перцентили, по умолчанию 50, 90, 95, 99, 99.9.
+
+        Returns:
+            Dict[str, float]: Словарь {"p50": секунды, ...}.
+        """
+        percents = sorted(percents)
+        result = {}
+        if not self.count:
+            return {self._name(percent): 0.0 for percent in percents}
+        indexes = sorted(self._counts)
+        position, seen = 0, 0
+        for percent in percents:
+            rank = max(1, int(self.count * percent / 100.0 + 0.5))
+            while seen < rank and position < len(indexes):
+                seen += self._counts[indexes[position]]
+                position += 1
+            result[self._name(percent)] = min(self._value(indexes[position - 1]) / 1e6, self._max)
+        return result
+
+    @staticmethod
+    def _name(percent: float) -> str:
+        return 'p' + f"{percent:g}".replace('.', '')
+
+    @property
+    def min(self) -> float:
+        return self._min or 0.0
+
+    @property
+    def max(self) -> float:
+        return self._max or 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Возвращает сводку: количество, min, mean, max и основные перцентили в секундах.
+
+        Returns:
+            Dict[str, Any]: Сводка гистограммы.
+        """
+        return {'count': self.count, 'min': self.min, 'mean': self.mean, 'max': self.max, **self.percentiles()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Сериализует гистограмму вместе с корзинами для последующего объединения.
+
+        Returns:
+            Dict[str, Any]: Сводка и корзины {индекс: количество}.
+        """
+        return {**self.summary(), 'sub_bucket_bits': self.sub_bucket_bits,
+                'buckets': {str(index): count for index, count in sorted(self._counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        """
+        Восстанавливает гистограмму из результата to_dict.
+
+        Args:
+            data (Dict[str, Any]): Сериализованная гистограмма.
+
+        Returns:
+            LatencyHistogram: Гистограмма.
+        """
+        histogram = cls(data.get('sub_bucket_bits', 7))
+        histogram._counts = {int(index): count for index, count in data.get('buckets', {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('mean', 0.0) * histogram.count
+        histogram._min = data.get('min') if histogram.count else None
+        histogram._max = data.get('max') if histogram.count else None
+        return histogram
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная имитация портала Bitrix24 для нагрузочного тестирования.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+
+from aiohttp import web, ClientSession
+
+from .ratelimit import RateLimiter
+
+
+BOT_ID = 1001
+DOMAIN = 'mock.bitrix24.test'
+APPLICATION_TOKEN = 'mockapplicationtoken00000000000'
+
+
+def _auth(domain: str = DOMAIN, application_token: str = APPLICATION_TOKEN) -> Dict[str, Any]:
+    return {
+        'auth[access_token]': 'a' * 64,
+        'auth[expires]': '1729344000',
+        'auth[expires_in]': '3600',
+        'auth[scope]': 'imbot',
+        'auth[domain]': domain,
+        'auth[server_endpoint]': 'https://oauth.bitrix.info/rest/',
+        'auth[status]': 'L',
+        'auth[client_endpoint]': f'https://{domain}/rest/',
+        'auth[member_id]': 'f' * 32,
+        'auth[user_id]': '1',
+        'auth[refresh_token]': 'r' * 64,
+        'auth[application_token]': application_token,
+    }
+
+
+def _params(dialog_id: int, message_id: int, text: str) -> Dict[str, Any]:
+    return {
+        'data[PARAMS][FROM_USER_ID]': str(dialog_id),
+        'data[PARAMS][MESSAGE]': text,
+        'data[PARAMS][TO_CHAT_ID]': str(dialog_id + 10),
+        'data[PARAMS][MESSAGE_TYPE]': 'P',
+        'data[PARAMS][SYSTEM]': 'N',
+        'data[PARAMS][SKIP_COMMAND]': 'N',
+        'data[PARAMS][SKIP_CONNECTOR]': 'N',
+        'data[PARAMS][IMPORTANT_CONNECTOR]': 'N',
+        'data[PARAMS][SILENT_CONNECTOR]': 'N',
+        'data[PARAMS][AUTHOR_ID]': str(dialog_id),
+        'data[PARAMS][CHAT_ID]': str(dialog_id + 10),
+        'data[PARAMS][CHAT_AUTHOR_ID]': str(dialog_id),
+        'data[PARAMS][CHAT_ENTITY_TYPE]': '',
+        'data[PARAMS][COMMAND_CONTEXT]': 'TEXTAREA',
+        'data[PARAMS][MESSAGE_ORIGINAL]': text,
+        'data[PARAMS][TO_USER_ID]': str(BOT_ID),
+        'data[PARAMS][DIALOG_ID]': str(dialog_id),
+        'data[PARAMS][MESSAGE_ID]': str(message_id),
+        'data[PARAMS][CHAT_TYPE]': 'P',
+        'data[PARAMS][LANGUAGE]': 'ru',
+        'data[USER][ID]': str(dialog_id),
+        'data[USER][NAME]': 'Иван Петров',
+        'data[USER][FIRST_NAME]': 'Иван',
+        'data[USER][LAST_NAME]': 'Петров',
+        'data[USER][WORK_POSITION]': '',
+        'data[USER][GENDER]': 'M',
+        'data[USER][IS_BOT]': 'N',
+        'data[USER][IS_CONNECTOR]': 'N',
+        'data[USER][IS_NETWORK]': 'N',
+        'data[USER][IS_EXTRANET]': 'N',
+    }
+
+
+def message_event(text: str = 'hello', dialog_id: int = 1, message_id: int = 100, **auth) -> Dict[str, Any]:
+    """
+    Формирует событие ONIMBOTMESSAGEADD в плоском виде, как его присылает Bitrix24.
+
+    Args:
+        text (str, optional): Текст сообщения.
+        dialog_id (int, optional): ID диалога.
+        message_id (int, optional): ID сообщения.
+        **auth: Переопределение domain и application_token.
+
+    Returns:
+        Dict[str, Any]: Поля формы события.
+    """
+    event = {'event': 'ONIMBOTMESSAGEADD', 'event_handler_id': '7',
+             f'data[BOT][{BOT_ID}][BOT_ID]': str(BOT_ID), f'data[BOT][{BOT_ID}][BOT_CODE]': 'mockbot'}
+    event.update(_params(dialog_id, message_id, text))
+    event['ts'] = str(int(time.time()))
+    event.update(_auth(**auth))
+    return event
+
+
+def command_event(command: str = 'move', params: str = '5', dialog_id: int = 1, message_id: int = 100, **auth) -> Dict[str, Any]:
+    """
+    Формирует событие ONIMCOMMANDADD в плоском виде, как его присылает Bitrix24.
+
+    Args:
+        command (str, optional): Имя команды.
+        params (str, optional): Параметры команды.
+        dialog_id (int, optional): ID диалога.
+        message_id (int, optional): ID сообщения с клавиатурой.
+        **auth: Переопределение domain и application_token.
+
+    Returns:
+        Dict[str, Any]: Поля формы события.
+    """
+    event = {'event': 'ONIMCOMMANDADD', 'event_handler_id': '8'}
+    prefix = 'data[COMMAND][12]'
+    event.update({
+        f'{prefix}[BOT_ID]': str(BOT_ID),
+        f'{prefix}[BOT_CODE]': 'mockbot',
+        f'{prefix}[COMMAND]': command,
+        f'{prefix}[COMMAND_ID]': '12',
+        f'{prefix}[COMMAND_PARAMS]': params,
+        f'{prefix}[COMMAND_CONTEXT]': 'KEYBOARD',
+        f'{prefix}[MESSAGE_ID]': str(message_id),
+    })
+    event.update(_params(dialog_id, message_id, ''))
+    event['ts'] = str(int(time.time()))
+    event.update(_auth(**auth))
+    return event
+
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """
+    Кодирует событие в тело запроса application/x-www-form-urlencoded.
+
+    Args:
+        event (Dict[str, Any]): Поля формы.
+
+    Returns:
+        bytes: Тело запроса.
+    """
+    return urlencode(event).encode('ascii')
+
+
+def unflatten_params(pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Восстанавливает вложенную структуру из плоских параметров вида KEY[SUB][0][NAME].
+
+    Args:
+        pairs (List[Tuple[str, str]]): Пары ключ-значение формы.
+
+    Returns:
+        Dict[str, Any]: Вложенный словарь, индексы массивов остаются строковыми ключами.
+    """
+    result = {}
+    for key, value in pairs:
+        head, bracket, rest = key.partition('[')
+        path = [head] + (rest[:-1].split('][') if bracket and rest.endswith(']') else [])
+        node = result
+        for part in path[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[path[-1]] = value
+    return result
+
+
+class RecordedCall:
+    """
+    Вызов метода REST API, полученный порталом.
+
+    Attributes:
+        time (float): Время получения (time.monotonic).
+        method (str): Метод API.
+        params (Dict[str, Any]): Параметры вызова.
+    """
+
+    __slots__ = ('time', 'method', 'params')
+
+    def __init__(self, time: float, method: str, params: Dict[str, Any]):
+        self.time = time
+        self.method = method
+        self.params = params
+
+    def __repr__(self):
+        return f"RecordedCall(method={self.method}, params={self.params})"
+
+
+class MockPortal:
+    """
+    Имитация портала Bitrix24 на aiohttp для нагрузочного тестирования ботов.
+
+    Принимает вызовы REST API по адресу http://host:port/rest/<метод>, записывает их,
+    ограничивает частоту запросов как настоящий портал, добавляет задержку и ошибки,
+    а также генерирует входящие вебхуки ONIMBOTMESSAGEADD/ONIMCOMMANDADD.
+
+    Attributes:
+        calls (List[RecordedCall]): Записанные вызовы (если record=True).
+        messages (Dict[int, Dict[str, Any]]): Сообщения, отправленные ботом.
+        commands (Dict[int, Dict[str, Any]]): Зарегистрированные команды.
+        limiter (RateLimiter): Ограничитель частоты запросов портала.
+        latency (Union[float, Tuple[float, float], Callable[[str], float]]): Задержка ответа в секундах.
+        error_rate (float): Доля ответов с ошибкой INTERNAL_SERVER_ERROR.
+        limit_error_rate (float): Доля ответов с ошибкой QUERY_LIMIT_EXCEEDED сверх ограничителя.
+        handlers (Dict[str, Callable]): Дополнительные обработчики методов: функция (params) -> result.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rate: float = 2.0, burst: int = 50,
+                 latency: Union[float, Tuple[float, float], Callable[[str], float]] = 0.0,
+                 error_rate: float = 0.0, limit_error_rate: float = 0.0, record: bool = True, seed: int = None):
+        """
+        Инициализирует портал.
+
+        Args:
+            host (str, optional): Адрес для прослушивания.
+            port (int, optional): Порт, 0 - выбрать свободный.
+            rate (float, optional): Запросов в секунду, None - без ограничения. По умолчанию 2, как у Bitrix24.
+            burst (int, optional): Накопление запросов. По умолчанию 50.
+            latency (optional): Задержка ответа: число, диапазон (мин, макс) или функция от метода.
+            error_rate (float, optional): Доля ответов INTERNAL_SERVER_ERROR.
+            limit_error_rate (float, optional): Доля случайных ответов QUERY_LIMIT_EXCEEDED.
+            record (bool, optional): Записывать вызовы в calls.
+            seed (int, optional): Начальное значение генератора случайных чисел.
+        """
+        self.host = host
+        self.port = port
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.limit_error_rate = limit_error_rate
+        self.record = record
+        self.calls: List[RecordedCall] = []
+        self.messages: Dict[int, Dict[str, Any]] = {}
+        self.commands: Dict[int, Dict[str, Any]] = {}
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self.requests = 0
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._next_id = 1
+        self._runner = None
+
+    @property
+    def endpoint(self) -> str:
+        """
+        Адрес REST API для BitrixBot.
+
+        Returns:
+            str: URL вида http://127.0.0.1:port/rest/.
+        """
+        return f"http://{self.host}:{self.port}/rest/"
+
+    def calls_of(self, method: str) -> List[RecordedCall]:
+        """
+        Возвращает записанные вызовы метода, включая вызовы внутри batch.
+
+        Args:
+            method (str): Метод API.
+
+        Returns:
+            List[RecordedCall]: Вызовы метода.
+        """
+        return [call for call in self.calls if call.method == method]
+
+    def _delay(self, method: str) -> float:
+        latency = self.latency
+        if callable(latency):
+            return latency(method)
+        if isinstance(latency, tuple):
+            return self._random.uniform(*latency)
+        return latency
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Обрабатывает вызов метода REST API.
+
+        Args:
+            request (Request): HTTP-запрос.
+
+        Returns:
+            Response: Ответ в формате JSON.
+        """
+        method = request.match_info['method']
+        pairs = parse_qsl((await request.read()).decode('utf-8'), keep_blank_values=True)
+        pairs.extend(request.query.items())
+        params = unflatten_params(pairs)
+        self.requests += 1
+
+        delay = self._delay(method)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if (self.limiter is not None and not self.limiter.try_acquire()) or \
+                (self.limit_error_rate and self._random.random() < self.limit_error_rate):
+            self.rejected += 1
+            return web.json_response({'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}, status=503)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.json_response({'error': 'INTERNAL_SERVER_ERROR', 'error_description': 'Injected error'}, status=500)
+
+        started = time.perf_counter()
+        if method == 'batch':
+            if self.record:
+                self.calls.append(RecordedCall(time.monotonic(), method, params))
+            result = self._batch(params)
+        else:
+            result = self._call(method, params)
+        if 'error' in result:
+            return web.json_response(result, status=400)
+        result['time'] = {'start': started, 'finish': time.perf_counter(), 'duration': time.perf_counter() - started}
+        return web.json_response(result)
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Выполняет метод API.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any]): Параметры метода.
+
+        Returns:
+            Dict[str, Any]: Ответ: {'result': ...} или {'error': ..., 'error_description': ...}.
+        """
+        if self.record:
+            self.calls.append(RecordedCall(time.monotonic(), method, params))
+        handler = self.handlers.get(method) or getattr(self, '_' + method.replace('.', '_'), None)
+        if handler is None:
+            return {'error': 'ERROR_METHOD_NOT_FOUND', 'error_description': f'Method not found: {method}'}
+        try:
+            return {'result': handler(params)}
+        except LookupError as e:
+            return {'error': 'NOT_FOUND', 'error_description': str(e)}
+
+    def _batch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Выполняет метод batch: команды вида "метод?параметры".
+
+        Args:
+            params (Dict[str, Any]): Параметры batch (halt, cmd).
+
+        Returns:
+            Dict[str, Any]: Ответ batch.
+        """
+        results, errors = {}, {}
+        halt = str(params.get('halt', '0')) not in ('0', '')
+        for key, command in (params.get('cmd') or {}).items():
+            method, _, query = command.partition('?')
+            response = self._call(method, unflatten_params(parse_qsl(query, keep_blank_values=True)))
+            if 'error' in response:
+                errors[key] = response
+                if halt:
+                    break
+            else:
+                results[key] = response['result']
+        return {'result': {'result': results, 'result_error': errors, 'result_total': [], 'result_next': [], 'result_time': []}}
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _imbot_message_add(self, params):
+        message_id = self._new_id()
+        self.messages[message_id] = params
+        return message_id
+
+    def _imbot_message_update(self, params):
+        message_id = int(params.get('MESSAGE_ID', 0))
+        if message_id not in self.messages:
+            raise LookupError(f'Message {message_id} not found')
+        self.messages[message_id] = {**self.messages[message_id], **params}
+        return True
+
+    def _imbot_message_delete(self, params):
+        if self.messages.pop(int(params.get('MESSAGE_ID', 0)), None) is None:
+            raise LookupError('Message not found')
+        return True
+
+    def _imbot_command_register(self, params):
+        command_id = self._new_id()
+        self.commands[command_id] = params
+        return command_id
+
+    def _imbot_command_update(self, params):
+        command_id = int(params.get('COMMAND_ID', 0))
+        if command_id not in self.commands:
+            raise LookupError(f'Command {command_id} not found')
+        self.commands[command_id].update(params.get('FIELDS') or {})
+        return True
+
+    def _imbot_command_unregister(self, params):
+        if self.commands.pop(int(params.get('COMMAND_ID', 0)), None) is None:
+            raise LookupError('Command not found')
+        return True
+
+    def _imbot_command_answer(self, params):
+        return self._imbot_message_add(params)
+
+    async def start(self):
+        """
+        Запускает HTTP-сервер портала.
+        """
+        app = web.Application(client_max_size=16 * 1024 ** 2)
+        app.router.add_route('*', '/rest/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        """
+        Останавливает HTTP-сервер портала.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def generate_traffic(self, url: str, rps: float, duration: float, dialogs: int = 1000,
+                               command_ratio: float = 0.0, text: str = 'hello', command: str = 'move',
+                               session: ClientSession = None) -> Dict[str, Any]:
+        """
+        Отправляет синтетические вебхуки на запущенный WebhookListener с заданной частотой.
+
+        Запросы отправляются по расписанию независимо от времени ответа (открытая модель нагрузки),
+        задержка подтверждения считается от запланированного момента отправки.
+
+        Args:
+            url (str): Адрес WebhookListener.
+            rps (float): Частота запросов в секунду.
+            duration (float): Длительность генерации в секундах.
+            dialogs (int, optional): Количество различных DIALOG_ID.
+            command_ratio (float, optional): Доля событий ONIMCOMMANDADD.
+            text (str, optional): Текст сообщений.
+            command (str, optional): Имя команды.
+            session (ClientSession, optional): HTTP-сессия, по умолчанию создается новая.
+
+        Returns:
+            Dict[str, Any]: sent, errors, duration и список latencies (секунды) подтверждений.
+        """
+        own_session = session is None
+        if own_session:
+            session = ClientSession()
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        latencies, errors = [], 0
+        total = int(rps * duration)
+
+        async def send(index: int, scheduled: float):
+            nonlocal errors
+            dialog_id = self._random.randrange(dialogs) + 1
+            if command_ratio and self._random.random() < command_ratio:
+                event = command_event(command, str(index), dialog_id, index + 1)
+            else:
+                event = message_event(text, dialog_id, index + 1)
+            try:
+                async with session.post(url, data=encode_event(event), headers=headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - scheduled)
+
+        tasks = []
+        start = time.perf_counter()
+        try:
+            for index in range(total):
+                scheduled = start + index / rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(send(index, scheduled)))
+            await asyncio.gather(*tasks)
+        finally:
+            if own_session:
+                await session.close()
+        return {'sent': total, 'errors': errors, 'duration': time.perf_counter() - start, 'latencies': latencies}
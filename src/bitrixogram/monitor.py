@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Измерение задержки цикла событий и обнаружение его блокировок.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+from .metrics import LatencyHistogram
+
+
+class LoopStall(NamedTuple):
+    """
+    Блокировка цикла событий, обнаруженная LoopMonitor.
+
+    Attributes:
+        started (float): Время начала блокировки (time.time()).
+        blocked (float): Длительность блокировки на момент снимка стека, в секундах.
+        stack (str): Стек потока цикла событий: выполняемая корутина или синхронный вызов.
+    """
+    started: float
+    blocked: float
+    stack: str
+
+
+class LoopMonitor:
+    """
+    Непрерывное измерение задержки цикла событий.
+
+    Фоновая задача засыпает на interval и записывает в histogram, насколько позже она проснулась:
+    это время ожидания любого обновления в очереди цикла. Поток-наблюдатель проверяет, что задача
+    просыпается, и если цикл не отвечает дольше threshold, сохраняет стек потока цикла (корутину
+    или синхронный вызов, который его блокирует) в stalls и пишет предупреждение в лог.
+    Так медленный ответ портала (задержка цикла в норме) отличается от блокировки цикла
+    обработчиком (есть стек).
+
+    Attributes:
+        interval (float): Период измерения в секундах.
+        threshold (float): Порог блокировки в секундах.
+        histogram (LatencyHistogram): Задержки цикла событий.
+        stalls (Deque[LoopStall]): Последние блокировки.
+        stall_count (int): Количество блокировок.
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, max_stalls: int = 20):
+        """
+        Args:
+            interval (float, optional): Период измерения в секундах, по умолчанию 0.05.
+            threshold (float, optional): Порог блокировки в секундах, по умолчанию 0.1.
+            max_stalls (int, optional): Количество хранимых блокировок со стеками.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = LatencyHistogram()
+        self.stalls: Deque[LoopStall] = deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self._beat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """
+        Запускает измерение в текущем цикле событий и поток-наблюдатель.
+        """
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = loop.create_task(self._run(loop))
+        self._watchdog = threading.Thread(target=self._watch, args=(threading.get_ident(),),
+                                          name='bitrixogram-loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """
+        Останавливает измерение и поток-наблюдатель.
+        """
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # поток завершается за threshold / 2, ожидание не блокирует цикл событий
+        watchdog, self._watchdog = self._watchdog, None
+        await asyncio.get_running_loop().run_in_executor(None, watchdog.join)
+
+    async def _run(self, loop: asyncio.AbstractEventLoop):
+        interval, record = self.interval, self.histogram.record
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            record(max(0.0, loop.time() - started - interval))
+            self._beat = time.monotonic()
+
+    def _watch(self, loop_thread: int):
+        # ожидаемый промежуток между отметками - interval, блокировка - его превышение на threshold
+        captured = 0.0
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or beat == captured:
+                continue
+            frame = sys._current_frames().get(loop_thread)
+            if frame is None:
+                continue
+            captured = beat
+            stall = LoopStall(time.time() - blocked, blocked, ''.join(traceback.format_stack(frame)))
+            self.stalls.append(stall)
+            self.stall_count += 1
+            logging.warning(f"Event loop blocked for {blocked * 1000:.0f} ms, loop thread stack:\n{stall.stack}")
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Возвращает сводку для маршрута метрик.
+
+        Returns:
+            Dict[str, Any]: Сводка гистограммы задержек, количество блокировок и время и длительность
+                последней блокировки. Стеки в сводку не входят: они пишутся в лог и хранятся в stalls.
+        """
+        last = self.stalls[-1] if self.stalls else None
+        return {'lag': self.histogram.summary(), 'stalls': self.stall_count,
+                'last_stall': {'started': last.started, 'blocked': last.blocked} if last is not None else None}
@@ -0,0 +1,689 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих вызовов REST API бота, отделенная от обработчиков.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Deque, Dict, Hashable, List, Optional, Tuple, Union
+
+from .cache import capture_request
+from .client import BitrixError
+from .ratelimit import FairQueue, current_priority, priority
+
+if TYPE_CHECKING:
+    from .client import BitrixBot
+    from .keyboard import ReplyKeyboardMarkup
+
+
+def _chain(source: asyncio.Future, target: asyncio.Future):
+    def copy(_):
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+            target.exception()
+        else:
+            target.set_result(source.result())
+    source.add_done_callback(copy)
+
+
+def _as_exception(error: Any) -> Exception:
+    if isinstance(error, Exception):
+        return error
+    if isinstance(error, dict):
+        return BitrixError.from_response(error)
+    return BitrixError(str(error))
+
+
+class OutboxItem:
+    """
+    Исходящий вызов REST API в очереди Outbox.
+
+    Attributes:
+        method (str): Метод API.
+        params (Dict[str, Any]): Параметры метода.
+        chat_id (Union[int, str]): Чат, в котором соблюдается порядок вызовов, или None.
+        future (asyncio.Future): Результат вызова для обработчиков, которым он нужен.
+        attempts (int): Количество выполненных попыток.
+        error (Any): Последняя ошибка: исключение или описание ошибки от Bitrix24.
+        created (float): Время постановки в очередь (time.time()).
+        priority (int): Класс приоритета вызова (current_priority() при постановке в очередь).
+    """
+
+    __slots__ = ('method', 'params', 'chat_id', 'future', 'attempts', 'error', 'created', 'priority')
+
+    def __init__(self, method: str, params: Dict[str, Any], chat_id: Union[int, str] = None):
+        self.method = method
+        self.params = params
+        self.chat_id = chat_id
+        self.future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+        self.error = None
+        self.created = time.time()
+        self.priority = current_priority()
+
+    def __repr__(self):
+        return f"OutboxItem(method={self.method}, chat_id={self.chat_id}, attempts={self.attempts}, error={self.error})"
+
+
+class Outbox:
+    """
+    Очередь исходящих вызовов REST API: обработчик ставит вызов в очередь и сразу продолжает
+    работу, отправка выполняется фоновой задачей.
+
+    Вызовы одного чата выполняются строго по порядку, по одному. Готовые вызовы разных чатов
+    объединяются в пакеты batch до batch_size команд, одновременно выполняется не более
+    concurrency пакетов, частота запросов ограничивается rate_limiter бота. Неудачный вызов
+    повторяется с экспоненциальной задержкой (следующие вызовы того же чата ждут), после
+    max_attempts попыток он попадает в dead_letters, а future завершается ошибкой BitrixError.
+    Чаты с готовыми вызовами выбираются по классам приоритета вызовов с весами weights
+    (см. ratelimit.priority), пакет отправляется с приоритетом самого срочного вызова.
+
+    Attributes:
+        bot (BitrixBot): Бот, выполняющий вызовы.
+        batch_size (int): Максимальное количество команд в пакете, не более 50.
+        concurrency (int): Максимальное количество одновременно выполняемых пакетов.
+        linger (float): Задержка перед отправкой пакета для накопления вызовов, в секундах.
+        max_attempts (int): Количество попыток до переноса вызова в dead_letters.
+        retry_delay (float): Задержка перед первым повтором, удваивается с каждой попыткой.
+        dead_letters (Deque[OutboxItem]): Вызовы, не выполненные после всех попыток.
+        sent (int): Количество выполненных вызовов.
+        retried (int): Количество повторов.
+        failed (int): Количество вызовов, перенесенных в dead_letters.
+        batches (int): Количество отправленных запросов (пакетов или одиночных вызовов).
+    """
+
+    def __init__(self, bot: 'BitrixBot', batch_size: int = 50, concurrency: int = 2, linger: float = 0.0,
+                 max_attempts: int = 3, retry_delay: float = 1.0, max_dead_letters: int = 1000, weights: Dict[int, float] = None):
+        """
+        Args:
+            bot (BitrixBot): Бот, выполняющий вызовы.
+            batch_size (int, optional): Максимальное количество команд в пакете, не более 50.
+            concurrency (int, optional): Максимальное количество одновременно выполняемых пакетов.
+            linger (float, optional): Задержка перед отправкой пакета для накопления вызовов.
+            max_attempts (int, optional): Количество попыток вызова.
+            retry_delay (float, optional): Задержка перед первым повтором в секундах.
+            max_dead_letters (int, optional): Максимальное количество хранимых невыполненных вызовов.
+            weights (Dict[int, float], optional): Веса классов приоритета, по умолчанию DEFAULT_WEIGHTS.
+        """
+        self.bot = bot
+        self.batch_size = max(1, min(batch_size, 50))
+        self.concurrency = max(1, concurrency)
+        self.linger = linger
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.dead_letters: Deque[OutboxItem] = deque(maxlen=max_dead_letters)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self._queues: Dict[Hashable, Deque[OutboxItem]] = {}
+        self._ready = FairQueue(weights)
+        self._pending = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество вызовов в очереди и в обработке.
+
+        Returns:
+            int: Количество вызовов.
+        """
+        return self._pending
+
+    def submit(self, method: str, params: Dict[str, Any] = None, chat_id: Union[int, str] = None) -> asyncio.Future:
+        """
+        Ставит вызов метода в очередь.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any], optional): Параметры метода.
+            chat_id (Union[int, str], optional): Чат, в котором вызовы выполняются по порядку.
+                Вызовы без чата выполняются независимо.
+
+        Returns:
+            asyncio.Future: Ответ метода (поле result). Ожидать его не обязательно.
+        """
+        params = params or {}
+        capture_request(self.bot, method, params, self)
+        item = OutboxItem(method, params, chat_id)
+        self._enqueue(item)
+        return item.future
+
+    def send_message(self, chat_id: int, text: str, attach: Dict[str, Any] = None, keyboard: 'ReplyKeyboardMarkup' = None) -> asyncio.Future:
+        """
+        Ставит отправку сообщения в очередь. Сообщения одного чата отправляются по порядку.
+
+        Args:
+            chat_id (int): ID чата.
+            text (str): Текст сообщения.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+
+        Returns:
+            asyncio.Future: ID отправленного сообщения.
+        """
+        return self.submit('imbot.message.add', self.bot._message_data(chat_id, text, attach, keyboard), chat_id)
+
+    def retry_dead_letters(self) -> int:
+        """
+        Возвращает невыполненные вызовы в очередь.
+
+        Returns:
+            int: Количество вызовов, поставленных в очередь.
+        """
+        items = list(self.dead_letters)
+        self.dead_letters.clear()
+        for item in items:
+            item.attempts = 0
+            item.error = None
+            item.future = asyncio.get_running_loop().create_future()
+            self._enqueue(item)
+        return len(items)
+
+    async def flush(self, timeout: float = None) -> bool:
+        """
+        Ожидает выполнения всех вызовов в очереди.
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если очередь пуста.
+        """
+        if self._idle is None or self._pending == 0:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._idle.wait()), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, timeout: float = None):
+        """
+        Ожидает выполнения вызовов в очереди и останавливает фоновую задачу.
+        Подходит для WebhookListener.add_shutdown_hook.
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+        """
+        if not await self.flush(timeout):
+            logging.warning(f"Outbox closed with {self._pending} pending calls")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _enqueue(self, item: OutboxItem):
+        key = item if item.chat_id is None else str(item.chat_id)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            queue.append(item)
+            self._make_ready(key)
+        else:
+            queue.append(item)
+        self._pending += 1
+        self._idle.clear()
+
+    def _on_sent(self, item: OutboxItem, result: Any):
+        pass
+
+    def _on_dead(self, item: OutboxItem):
+        pass
+
+    def _make_ready(self, key: Hashable):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+        if self._task is None:
+            # задача не наследует контекст обработчика (например, запись ответов HandlerCache)
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._run())
+        self._ready.push(self._queues[key][0].priority, key)
+        self._wakeup.set()
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            await self._wakeup.wait()
+            if self.linger:
+                await asyncio.sleep(self.linger)
+            await semaphore.acquire()
+            keys = [self._ready.pop()[1] for _ in range(min(self.batch_size, len(self._ready)))]
+            if not self._ready:
+                self._wakeup.clear()
+            if not keys:
+                semaphore.release()
+                continue
+            task = asyncio.ensure_future(self._send(keys))
+            task.add_done_callback(lambda _: semaphore.release())
+
+    async def _send(self, keys: List[Hashable]):
+        items = [self._queues[key][0] for key in keys]
+        self.batches += 1
+        results: Dict[int, Any] = {}
+        errors: Dict[int, Any] = {}
+        try:
+            with priority(min(item.priority for item in items)):
+                if len(items) == 1:
+                    response = await self.bot.rest_command(items[0].method, items[0].params)
+                    if isinstance(response, dict) and 'error' in response:
+                        errors[0] = response
+                    else:
+                        results[0] = response.get('result') if isinstance(response, dict) else response
+                else:
+                    commands = {f"o{index}": (item.method, item.params) for index, item in enumerate(items)}
+                    response = await self.bot.batch(commands)
+                    batch_results, batch_errors = self.bot._parse_batch(response, commands)
+                    for index in range(len(items)):
+                        if f"o{index}" in batch_errors:
+                            errors[index] = batch_errors[f"o{index}"]
+                        else:
+                            results[index] = batch_results[f"o{index}"]
+        except Exception as e:
+            logging.exception("outbox send error")
+            errors = {index: e for index in range(len(items))}
+
+        for index, (key, item) in enumerate(zip(keys, items)):
+            if index in errors:
+                item.attempts += 1
+                item.error = errors[index]
+                if item.attempts < self.max_attempts:
+                    self.retried += 1
+                    asyncio.get_running_loop().call_later(self.retry_delay * 2 ** (item.attempts - 1), self._make_ready, key)
+                    continue
+                logging.warning(f"Outbox call {item.method} for chat {item.chat_id} failed: {item.error}")
+                self.failed += 1
+                self.dead_letters.append(item)
+                if not item.future.done():
+                    item.future.set_exception(_as_exception(item.error))
+                    item.future.exception()
+                self._on_dead(item)
+            else:
+                self.sent += 1
+                if not item.future.done():
+                    item.future.set_result(results[index])
+                self._on_sent(item, results[index])
+            self._done(key)
+
+    def _done(self, key: Hashable):
+        queue = self._queues[key]
+        queue.popleft()
+        if queue:
+            self._make_ready(key)
+        else:
+            del self._queues[key]
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT UNIQUE,
+    method TEXT NOT NULL,
+    params TEXT NOT NULL,
+    chat_id TEXT,
+    created REAL NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, id);
+"""
+
+_PENDING, _DONE, _DEAD = 0, 1, 2
+
+
+class _StoredItem(OutboxItem):
+    __slots__ = ('dedup_key', 'row_id', 'encoded')
+
+    def __init__(self, method: str, params: Dict[str, Any], chat_id: Union[int, str] = None, dedup_key: str = None):
+        super().__init__(method, params, chat_id)
+        self.dedup_key = dedup_key
+        self.row_id = None
+        self.encoded: Optional[str] = None
+
+
+class PersistentOutbox(Outbox):
+    """
+    Очередь исходящих вызовов с записью на диск (SQLite) и доставкой "хотя бы один раз".
+
+    Вызов записывается в базу до отправки, отмечается выполненным после успешного ответа
+    Bitrix24, и невыполненные вызовы отправляются повторно после перезапуска (open()).
+    Записи и отметки нескольких вызовов объединяются в одну транзакцию (group commit) не чаще
+    одного раза в commit_interval, запись выполняется в отдельном потоке.
+
+    Если процесс остановится между ответом портала и отметкой о выполнении, вызов будет
+    отправлен повторно. Ключ dedup_key защищает от повторной постановки в очередь того же
+    ответа, например при повторной доставке вебхука: вызов с ключом уже выполненного вызова
+    не отправляется, future получает сохраненный результат; вызов с ключом ожидающего вызова
+    получает его результат; вызов с ключом вызова из dead_letters отправляется заново.
+    Выполненные записи с ключом хранятся dedup_ttl секунд, без ключа удаляются сразу.
+
+    Attributes:
+        path (str): Путь к файлу базы.
+        commit_interval (float): Интервал объединения записей в одну транзакцию, в секундах.
+        dedup_ttl (float): Время хранения ключей выполненных вызовов, в секундах.
+        commits (int): Количество транзакций.
+        replayed (int): Количество вызовов, восстановленных из базы.
+        deduplicated (int): Количество вызовов, пропущенных по dedup_key.
+    """
+
+    def __init__(self, bot: 'BitrixBot', path: str, commit_interval: float = 0.005, dedup_ttl: float = 86400,
+                 synchronous: str = 'NORMAL', **kwargs):
+        """
+        Args:
+            bot (BitrixBot): Бот, выполняющий вызовы.
+            path (str): Путь к файлу базы SQLite.
+            commit_interval (float, optional): Интервал group commit в секундах.
+            dedup_ttl (float, optional): Время хранения ключей выполненных вызовов в секундах.
+            synchronous (str, optional): PRAGMA synchronous. NORMAL сохраняет данные при падении
+                процесса, FULL - и при отключении питания.
+            **kwargs: Параметры Outbox.
+        """
+        super().__init__(bot, **kwargs)
+        self.path = path
+        self.commit_interval = commit_interval
+        self.dedup_ttl = dedup_ttl
+        self.synchronous = synchronous
+        self.commits = 0
+        self.replayed = 0
+        self.deduplicated = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bitrixogram-outbox')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._opening: Optional[asyncio.Task] = None
+        self._keys: Dict[str, _StoredItem] = {}
+        self._rows: Dict[int, _StoredItem] = {}
+        self._to_write: List[_StoredItem] = []
+        self._finished: List[Tuple[int, int, Optional[str], bool]] = []
+        self._revived: List[int] = []
+        self._committer: Optional[asyncio.Task] = None
+        self._purged = 0.0
+
+    async def open(self) -> int:
+        """
+        Открывает базу, ставит в очередь невыполненные вызовы и загружает dead_letters.
+        Вызывается автоматически при первой записи, но для отправки вызовов, оставшихся
+        после перезапуска, без новых сообщений ее нужно вызвать при старте.
+
+        Returns:
+            int: Количество восстановленных вызовов.
+        """
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open())
+        return await asyncio.shield(self._opening)
+
+    async def _open(self) -> int:
+        pending, dead = await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+        for state, rows in ((_PENDING, pending), (_DEAD, dead)):
+            for row_id, dedup_key, method, params, chat_id in rows:
+                item = _StoredItem(method, json.loads(params), chat_id, dedup_key)
+                item.row_id = row_id
+                if state == _DEAD:
+                    item.attempts = self.max_attempts
+                    self.dead_letters.append(item)
+                    continue
+                if dedup_key is not None:
+                    self._keys[dedup_key] = item
+                self._rows[row_id] = item
+                self._enqueue(item)
+        self.replayed += len(pending)
+        if pending:
+            logging.info(f"Outbox replayed {len(pending)} pending calls from {self.path}")
+        return len(pending)
+
+    def submit(self, method: str, params: Dict[str, Any] = None, chat_id: Union[int, str] = None,
+               dedup_key: str = None) -> asyncio.Future:
+        """
+        Записывает вызов метода и ставит его в очередь после записи на диск.
+
+        Args:
+            method (str): Метод API.
+            params (Dict[str, Any], optional): Параметры метода, должны сериализоваться в JSON.
+            chat_id (Union[int, str], optional): Чат, в котором вызовы выполняются по порядку.
+            dedup_key (str, optional): Ключ, по которому повторный вызов не отправляется,
+                например f"reply:{message_id}".
+
+        Returns:
+            asyncio.Future: Ответ метода (поле result). Ожидать его не обязательно. Если параметры
+                не сериализуются в JSON, вызов не записывается и future завершается с ошибкой
+                TypeError или ValueError.
+        """
+        if dedup_key is not None and dedup_key in self._keys:
+            self.deduplicated += 1
+            return self._keys[dedup_key].future
+        params = params or {}
+        item = _StoredItem(method, params, chat_id, dedup_key)
+        try:
+            item.encoded = json.dumps(params)
+        except (TypeError, ValueError) as e:
+            item.future.set_exception(e)
+            return item.future
+        capture_request(self.bot, method, params, self)
+        if dedup_key is not None:
+            self._keys[dedup_key] = item
+        self._to_write.append(item)
+        self._schedule_commit()
+        return item.future
+
+    def send_message(self, chat_id: int, text: str, attach: Dict[str, Any] = None, keyboard: 'ReplyKeyboardMarkup' = None,
+                     dedup_key: str = None) -> asyncio.Future:
+        """
+        Записывает отправку сообщения и ставит ее в очередь.
+
+        Args:
+            chat_id (int): ID чата.
+            text (str): Текст сообщения.
+            attach (Dict[str, Any], optional): Вложения к сообщению.
+            keyboard (ReplyKeyboardMarkup, optional): Клавиатура для сообщения.
+            dedup_key (str, optional): Ключ для защиты от повторной отправки.
+
+        Returns:
+            asyncio.Future: ID отправленного сообщения.
+        """
+        return self.submit('imbot.message.add', self.bot._message_data(chat_id, text, attach, keyboard), chat_id, dedup_key)
+
+    def retry_dead_letters(self) -> int:
+        """
+        Возвращает невыполненные вызовы в очередь и отмечает их в базе как ожидающие.
+
+        Returns:
+            int: Количество вызовов, поставленных в очередь.
+        """
+        items = [item for item in self.dead_letters if isinstance(item, _StoredItem)]
+        count = super().retry_dead_letters()
+        for item in items:
+            if item.dedup_key is not None:
+                self._keys[item.dedup_key] = item
+            self._rows[item.row_id] = item
+            self._revived.append(item.row_id)
+        self._schedule_commit()
+        return count
+
+    async def flush(self, timeout: float = None) -> bool:
+        """
+        Ожидает записи, выполнения и отметки всех вызовов.
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если очередь пуста.
+        """
+        async def drain():
+            await self._wait_commits()
+            await super(PersistentOutbox, self).flush()
+            await self._wait_commits()
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, timeout: float = None):
+        """
+        Ожидает выполнения вызовов, останавливает отправку и закрывает базу.
+        Невыполненные вызовы останутся в базе до следующего open().
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+        """
+        await super().close(timeout)
+        if self._committer is not None:
+            self._committer.cancel()
+            self._committer = None
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=False)
+
+    def _on_sent(self, item: OutboxItem, result: Any):
+        self._finish(item, _DONE, result)
+
+    def _on_dead(self, item: OutboxItem):
+        self._finish(item, _DEAD, None)
+
+    def _finish(self, item: OutboxItem, state: int, result: Any):
+        if not isinstance(item, _StoredItem):
+            return
+        if item.dedup_key is not None and self._keys.get(item.dedup_key) is item:
+            del self._keys[item.dedup_key]
+        if self._rows.get(item.row_id) is item:
+            del self._rows[item.row_id]
+        self._finished.append((item.row_id, state, json.dumps(result), item.dedup_key is not None))
+        self._schedule_commit()
+
+    def _schedule_commit(self):
+        if self._committer is None:
+            loop = asyncio.get_running_loop()
+            self._committer = contextvars.Context().run(loop.create_task, self._commit_loop())
+
+    async def _wait_commits(self):
+        while self._committer is not None:
+            await asyncio.shield(self._committer)
+
+    async def _commit_loop(self):
+        try:
+            await self.open()
+            while self._to_write or self._finished or self._revived:
+                if self.commit_interval:
+                    await asyncio.sleep(self.commit_interval)
+                await self._commit()
+        finally:
+            self._committer = None
+
+    async def _commit(self):
+        items, self._to_write = self._to_write, []
+        finished, self._finished = self._finished, []
+        revived, self._revived = self._revived, []
+        rows = [(item.dedup_key, item.method, item.encoded, None if item.chat_id is None else str(item.chat_id), item.created)
+                for item in items]
+        try:
+            stored = await asyncio.get_running_loop().run_in_executor(self._executor, self._write, rows, finished, revived)
+        except Exception as e:
+            logging.exception(f"outbox write error in {self.path}")
+            for item in items:
+                self._forget(item)
+                if not item.future.done():
+                    item.future.set_exception(e)
+                    item.future.exception()
+            return
+        self.commits += 1
+        for item, (row_id, state, result) in zip(items, stored):
+            item.row_id = row_id
+            if state == _DONE:
+                # ключ выполненного вызова: повторно не отправляется
+                self.deduplicated += 1
+                self._forget(item)
+                if not item.future.done():
+                    item.future.set_result(result)
+                continue
+            if state == _PENDING and row_id in self._rows:
+                # вызов с этим ключом уже в очереди: результат будет общим
+                self.deduplicated += 1
+                self._forget(item)
+                _chain(self._rows[row_id].future, item.future)
+                continue
+            if state == _DEAD:
+                # вызов с этим ключом не был выполнен: запись возвращена в очередь с новыми параметрами
+                for dead in [dead for dead in self.dead_letters if getattr(dead, 'row_id', None) == row_id]:
+                    self.dead_letters.remove(dead)
+            self._rows[row_id] = item
+            self._enqueue(item)
+
+    def _forget(self, item: _StoredItem):
+        if item.dedup_key is not None and self._keys.get(item.dedup_key) is item:
+            del self._keys[item.dedup_key]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f'PRAGMA synchronous={self.synchronous}')
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _load(self) -> Tuple[List[tuple], List[tuple]]:
+        query = 'SELECT id, dedup_key, method, params, chat_id FROM outbox WHERE state = ? ORDER BY id'
+        connection = self._connect()
+        return connection.execute(query, (_PENDING,)).fetchall(), connection.execute(query, (_DEAD,)).fetchall()
+
+    def _write(self, rows: List[tuple], finished: List[Tuple[int, int, Optional[str], bool]],
+               revived: List[int]) -> List[Tuple[int, Optional[int], Any]]:
+        """
+        Записывает новые вызовы, отметки о выполнении и возвращенные в очередь вызовы одной транзакцией.
+
+        Returns:
+            List[Tuple[int, Optional[int], Any]]: Для каждого нового вызова - ID записи, состояние
+                существующей записи с тем же dedup_key (None для новой записи) и ее результат.
+        """
+        connection = self._connect()
+        stored = []
+        now = time.time()
+        connection.execute('BEGIN')
+        try:
+            # отметки записываются первыми, чтобы новые вызовы видели актуальное состояние ключей
+            connection.executemany('DELETE FROM outbox WHERE id = ?',
+                                   [(row_id,) for row_id, state, result, keep in finished if state == _DONE and not keep])
+            connection.executemany('UPDATE outbox SET state = ?, result = ?, finished = ? WHERE id = ?',
+                                   [(state, result, now, row_id) for row_id, state, result, keep in finished if state != _DONE or keep])
+            connection.executemany('UPDATE outbox SET state = ? WHERE id = ?', [(_PENDING, row_id) for row_id in revived])
+            for row in rows:
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO outbox (dedup_key, method, params, chat_id, created) VALUES (?, ?, ?, ?, ?)', row)
+                if cursor.rowcount:
+                    stored.append((cursor.lastrowid, None, None))
+                    continue
+                row_id, state, result = connection.execute(
+                    'SELECT id, state, result FROM outbox WHERE dedup_key = ?', (row[0],)).fetchone()
+                if state == _DEAD:
+                    connection.execute('UPDATE outbox SET method = ?, params = ?, chat_id = ?, created = ?, state = ?, '
+                                       'result = NULL, finished = NULL WHERE id = ?', (*row[1:], _PENDING, row_id))
+                stored.append((row_id, state, json.loads(result) if result else None))
+            if now - self._purged > 60:
+                connection.execute('DELETE FROM outbox WHERE state = ? AND finished < ?', (_DONE, now - self.dedup_ttl))
+                self._purged = now
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return stored
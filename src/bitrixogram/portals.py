@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Обслуживание ботов нескольких порталов Bitrix24 одним WebhookListener.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import urlparse
+
+from aiohttp import web, ClientSession, TCPConnector
+
+from .client import BitrixBot
+from .dispatcher import Dispatcher
+from .webhook import WebhookListener
+from .cache import RestCache, SingleFlight
+from .formdata import BodyTooLarge, MAX_BODY_SIZE, WebhookUpdate
+from .ratelimit import PriorityRateLimiter, RateLimiter
+
+if TYPE_CHECKING:
+    from .recorder import UpdateRecorder
+
+
+class SessionPool:
+    """
+    Пул HTTP-сессий и ограничителей частоты: одна сессия (пул соединений) и один RateLimiter
+    на хост портала. Боты одного портала используют общие соединения и общий лимит запросов,
+    лимиты разных порталов независимы.
+
+    Attributes:
+        limit_per_host (int): Максимальное количество соединений с хостом.
+        rate (float): Количество запросов в секунду на портал, None - без ограничения.
+        burst (int): Размер накопления запросов.
+        weights (Dict[int, float]): Веса классов приоритета или None.
+        shares (Dict[int, float]): Максимальные доли лимита портала по классам приоритета или None.
+    """
+
+    def __init__(self, limit_per_host: int = 10, rate: float = 2.0, burst: int = 50, weights: Dict[int, float] = None,
+                 shares: Dict[int, float] = None):
+        """
+        Args:
+            limit_per_host (int, optional): Максимальное количество соединений с хостом.
+            rate (float, optional): Запросов в секунду на портал, None - без ограничения.
+            burst (int, optional): Размер накопления запросов.
+            weights (Dict[int, float], optional): Веса классов приоритета. Если заданы weights или shares,
+                хосты получают PriorityRateLimiter.
+            shares (Dict[int, float], optional): Максимальные доли лимита портала по классам приоритета.
+        """
+        self.limit_per_host = limit_per_host
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights
+        self.shares = shares
+        self._sessions: Dict[str, ClientSession] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def session(self, host: str) -> ClientSession:
+        """
+        Возвращает сессию хоста, создавая ее при первом обращении.
+
+        Args:
+            host (str): Хост портала.
+
+        Returns:
+            ClientSession: Сессия.
+        """
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            session = self._sessions[host] = ClientSession(connector=TCPConnector(limit_per_host=self.limit_per_host))
+        return session
+
+    def rate_limiter(self, host: str) -> Optional[RateLimiter]:
+        """
+        Возвращает ограничитель частоты хоста.
+
+        Args:
+            host (str): Хост портала.
+
+        Returns:
+            Optional[RateLimiter]: Ограничитель или None, если rate не задан.
+        """
+        if self.rate is None:
+            return None
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            if self.weights is None and self.shares is None:
+                limiter = RateLimiter(self.rate, self.burst)
+            else:
+                limiter = PriorityRateLimiter(self.rate, self.burst, self.weights, self.shares)
+            self._limiters[host] = limiter
+        return limiter
+
+    async def close(self):
+        """
+        Закрывает все сессии.
+        """
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+class Portal:
+    """
+    Бот портала, обслуживаемый MultiPortalListener.
+
+    Attributes:
+        key (str): Ключ портала: путь вебхука (/<key>) и пространство имен FSM.
+        bot (BitrixBot): Бот портала.
+        domain (str): Домен портала, значение auth[domain] в событиях.
+        updates (int): Количество обработанных обновлений.
+    """
+
+    def __init__(self, key: str, bot: BitrixBot, domain: str, application_token: str = None):
+        """
+        Args:
+            key (str): Ключ портала.
+            bot (BitrixBot): Бот портала.
+            domain (str): Домен портала.
+            application_token (str, optional): Токен приложения портала для проверки вебхуков.
+        """
+        self.key = key
+        self.bot = bot
+        self.domain = domain
+        self.updates = 0
+        self._token_digest = WebhookListener._digest(application_token) if application_token else None
+
+    def verify(self, token: Optional[str]) -> bool:
+        """
+        Проверяет токен приложения за постоянное время.
+
+        Args:
+            token (Optional[str]): Значение auth[application_token] из события.
+
+        Returns:
+            bool: True, если токен верен или проверка не настроена.
+        """
+        return self._token_digest is None or WebhookListener._verify(token, self._token_digest)
+
+    def __repr__(self):
+        return f"Portal(key={self.key}, domain={self.domain}, bot_id={self.bot.base_id})"
+
+
+class MultiPortalListener(WebhookListener):
+    """
+    Прослушивание вебхуков ботов нескольких порталов одним сервером.
+
+    Обновление направляется порталу по пути запроса (/<key>) или, для запросов на "/",
+    по auth[domain] и ID бота из data[BOT]. Все порталы используют общий Dispatcher
+    и общие маршрутизаторы; обработчики получают бота портала в message.bot / command.bot,
+    контексты FSM разделены по ключу портала.
+
+    Attributes:
+        pool (SessionPool): Сессии и ограничители частоты по хостам порталов.
+        portals (Dict[str, Portal]): Порталы по ключу.
+    """
+
+    DOMAIN_FIELD = 'auth[domain]'
+
+    def __init__(self, host: str, port: int, dispatcher: Dispatcher, pool: SessionPool = None, recorder: 'UpdateRecorder' = None,
+                 max_body_size: int = MAX_BODY_SIZE, secret: str = None, expose_metrics: bool = False):
+        """
+        Args:
+            host (str): Хост для прослушивания.
+            port (int): Порт для прослушивания.
+            dispatcher (Dispatcher): Общий диспетчер обработчиков.
+            pool (SessionPool, optional): Пул сессий, по умолчанию SessionPool().
+            recorder (UpdateRecorder, optional): Запись полученных обновлений.
+            max_body_size (int, optional): Максимальный размер тела запроса.
+            secret (str, optional): Общий секрет в параметре ?secret=... адреса обработчика.
+            expose_metrics (bool, optional): Добавить маршрут метрик, см. WebhookListener.
+        """
+        super().__init__(host, port, dispatcher, recorder, max_body_size, secret=secret, expose_metrics=expose_metrics)
+        self.pool = pool or SessionPool()
+        self.portals: Dict[str, Portal] = {}
+        self._by_domain: Dict[str, List[Portal]] = {}
+
+    def add_portal(self, key: str, bot_endpoint: str, bot_token: str, bot_id: str, application_token: str = None,
+                   domain: str = None, cache: RestCache = None, single_flight: SingleFlight = None) -> BitrixBot:
+        """
+        Добавляет бота портала.
+
+        Args:
+            key (str): Ключ портала: путь вебхука /<key> и пространство имен FSM.
+            bot_endpoint (str): Базовый URL REST API портала.
+            bot_token (str): Токен бота (CLIENT_ID).
+            bot_id (str): ID бота.
+            application_token (str, optional): Токен приложения для проверки вебхуков портала. Если не задан
+                и у слушателя нет secret, вебхуки портала не проверяются, в лог пишется предупреждение.
+            domain (str, optional): Домен портала в auth[domain], по умолчанию хост bot_endpoint.
+            cache (RestCache, optional): Кеш ответов REST API бота.
+            single_flight (SingleFlight, optional): Объединение одинаковых запросов бота.
+
+        Returns:
+            BitrixBot: Бот портала, использующий сессию и ограничитель хоста из pool.
+        """
+        if key in self.portals:
+            raise ValueError(f"portal {key} already added")
+        api_host = urlparse(bot_endpoint).hostname
+        bot = BitrixBot(bot_endpoint, bot_token, bot_id, self.pool.session(api_host), self.pool.rate_limiter(api_host), cache, single_flight)
+        if application_token is None and self._secret_digest is None:
+            logging.warning(f"portal {key} has no application_token and the listener has no secret: "
+                            f"its webhooks are accepted without authentication")
+        portal = Portal(key, bot, domain or api_host, application_token)
+        self.portals[key] = portal
+        self._by_domain.setdefault(portal.domain, []).append(portal)
+        return bot
+
+    def remove_portal(self, key: str):
+        """
+        Удаляет портал. Сессия хоста остается в пуле до close().
+
+        Args:
+            key (str): Ключ портала.
+        """
+        portal = self.portals.pop(key)
+        self._by_domain[portal.domain].remove(portal)
+        if not self._by_domain[portal.domain]:
+            del self._by_domain[portal.domain]
+
+    def build_app(self) -> web.Application:
+        """
+        Создает приложение aiohttp с маршрутами "/" и "/{portal}".
+
+        Returns:
+            Application: Приложение aiohttp.
+        """
+        app = super().build_app()
+        app.router.add_post('/{portal}', self.handle_post)
+        return app
+
+    @staticmethod
+    def _match_bot(candidates: List[Portal], data: WebhookUpdate) -> Optional[Portal]:
+        bots = data.get_path('data', 'BOT')
+        if not isinstance(bots, dict):
+            return None
+        for portal in candidates:
+            if str(portal.bot.base_id) in bots:
+                return portal
+        return None
+
+    async def handle_post(self, request):
+        """
+        Определяет портал запроса, проверяет токен приложения и передает обновление диспетчеру.
+
+        Args:
+            request (Request): Запрос вебхука.
+
+        Returns:
+            Response: "OK", 403 для неизвестного портала или неверного токена, 413 для слишком большого тела.
+        """
+        if self._secret_digest is not None and not self._verify(request.query.get('secret'), self._secret_digest):
+            return self._reject()
+        key = request.match_info.get('portal')
+        if key is not None and key not in self.portals:
+            return self._reject()
+
+        def select(field) -> List[Portal]:
+            candidates = [self.portals[key]] if key is not None else self._by_domain.get(field(self.DOMAIN_FIELD), ())
+            token = field(self.TOKEN_FIELD)
+            return [portal for portal in candidates if portal.verify(token)]
+
+        try:
+            data, candidates = await self._read_form(request, select)
+        except BodyTooLarge:
+            return web.Response(status=413, text="Request Entity Too Large")
+        if data is None:
+            return self._reject()
+        portal = candidates[0] if len(candidates) == 1 else self._match_bot(candidates, data)
+        if portal is None:
+            return self._reject()
+
+        logging.debug(f"webhook handle post for {portal.key}: {data}")
+        if self.recorder is not None:
+            self.recorder.record(data)
+        portal.updates += 1
+        await self.dispatcher.process_update(data, portal.bot, portal.key)
+        return web.Response(text="OK")
+
+    async def close(self):
+        """
+        Закрывает сессии порталов и файл записи обновлений.
+        """
+        await super().close()
+        await self.pool.close()
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов к REST API и классы приоритета.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+# Классы приоритета: меньшее значение - более срочная работа.
+INTERACTIVE = 0
+MESSAGES = 1
+BACKGROUND = 2
+BULK = 3
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 8, MESSAGES: 4, BACKGROUND: 2, BULK: 1}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar('bitrixogram_priority', default=MESSAGES)
+
+
+def current_priority() -> int:
+    """
+    Возвращает класс приоритета текущей задачи.
+
+    Returns:
+        int: INTERACTIVE, MESSAGES, BACKGROUND или BULK. По умолчанию MESSAGES.
+    """
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(level: int):
+    """
+    Задает класс приоритета для вызовов REST API и очереди Outbox внутри блока.
+
+    Args:
+        level (int): INTERACTIVE, MESSAGES, BACKGROUND или BULK.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def event_priority(update: Dict[str, Any]) -> int:
+    """
+    Класс приоритета обновления: команды (нажатия кнопок) - INTERACTIVE, сообщения - MESSAGES,
+    остальные события - BACKGROUND.
+
+    Args:
+        update (Dict[str, Any]): Данные обновления.
+
+    Returns:
+        int: Класс приоритета.
+    """
+    event = update.get('event')
+    if event == 'ONIMCOMMANDADD':
+        return INTERACTIVE
+    if event == 'ONIMBOTMESSAGEADD':
+        return MESSAGES
+    return BACKGROUND
+
+
+class FairQueue:
+    """
+    Очередь с взвешенным справедливым обслуживанием классов (stride scheduling).
+
+    Каждый класс получает долю обслуживания, пропорциональную весу, пока в нем есть ожидающие;
+    простаивавший класс не накапливает преимущество.
+
+    Attributes:
+        weights (Dict[int, float]): Веса классов, по умолчанию DEFAULT_WEIGHTS. Класс без веса имеет вес 1.
+    """
+
+    def __init__(self, weights: Dict[int, float] = None):
+        """
+        Args:
+            weights (Dict[int, float], optional): Веса классов.
+        """
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self._lanes: Dict[int, Deque[Any]] = {}
+        self._pass: Dict[int, float] = {}
+        self._clock = 0.0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, lane: int, item: Any):
+        """
+        Добавляет элемент в очередь класса.
+
+        Args:
+            lane (int): Класс приоритета.
+            item (Any): Элемент.
+        """
+        queue = self._lanes.get(lane)
+        if queue is None:
+            queue = self._lanes[lane] = deque()
+        if not queue:
+            self._pass[lane] = max(self._pass.get(lane, 0.0), self._clock)
+        queue.append(item)
+        self._size += 1
+
+    def pop(self, eligible: Callable[[int], bool] = None) -> Optional[Tuple[int, Any]]:
+        """
+        Извлекает следующий элемент.
+
+        Args:
+            eligible (Callable[[int], bool], optional): Классы, которые можно обслужить сейчас.
+
+        Returns:
+            Optional[Tuple[int, Any]]: Класс и элемент или None.
+        """
+        best = None
+        for lane, queue in self._lanes.items():
+            if queue and (eligible is None or eligible(lane)):
+                if best is None or (self._pass[lane], lane) < (self._pass[best], best):
+                    best = lane
+        if best is None:
+            return None
+        self._clock = self._pass[best]
+        self._pass[best] += 1.0 / self.weights.get(best, 1)
+        self._size -= 1
+        return best, self._lanes[best].popleft()
+
+    def lanes(self):
+        """
+        Классы, в которых есть ожидающие элементы.
+
+        Returns:
+            Iterable[int]: Классы приоритета.
+        """
+        return [lane for lane, queue in self._lanes.items() if queue]
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к REST API по алгоритму "token bucket".
+
+    Bitrix24 допускает в среднем 2 запроса в секунду на портал с накоплением до 50 запросов,
+    при превышении портал отвечает ошибкой QUERY_LIMIT_EXCEEDED.
+
+    Attributes:
+        rate (float): Количество запросов в секунду.
+        burst (int): Максимальное количество накопленных запросов.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 50):
+        """
+        Инициализирует ограничитель.
+
+        Args:
+            rate (float, optional): Количество запросов в секунду. По умолчанию 2.
+            burst (int, optional): Размер накопления запросов. По умолчанию 50.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        """
+        Пополняет запас токенов за прошедшее время.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Резервирует токен и ожидает, пока он станет доступен.
+
+        Токен резервируется сразу, поэтому ожидающие запросы обслуживаются в порядке вызова.
+        """
+        self._refill()
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def try_acquire(self) -> bool:
+        """
+        Забирает токен без ожидания, если он доступен.
+
+        Returns:
+            bool: True, если токен получен.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def available(self) -> float:
+        """
+        Возвращает количество доступных токенов.
+
+        Returns:
+            float: Количество токенов (отрицательное, если есть ожидающие запросы).
+        """
+        self._refill()
+        return self._tokens
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class PriorityRateLimiter(RateLimiter):
+    """
+    Ограничитель частоты запросов с классами приоритета.
+
+    Пока токены есть, запросы проходят сразу. Когда запросы ждут, токены распределяются между
+    классами по весам (FairQueue), поэтому массовая рассылка не задерживает ответы на нажатия
+    кнопок. Для класса можно ограничить долю общего лимита портала (shares): например,
+    {BULK: 0.5} - не более половины запросов в секунду даже при свободном лимите.
+    Класс запроса берется из current_priority(), если не задан явно.
+
+    Attributes:
+        shares (Dict[int, float]): Максимальные доли лимита по классам.
+        granted (Dict[int, int]): Количество выданных токенов по классам.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 50, weights: Dict[int, float] = None, shares: Dict[int, float] = None):
+        """
+        Args:
+            rate (float, optional): Количество запросов в секунду. По умолчанию 2.
+            burst (int, optional): Размер накопления запросов. По умолчанию 50.
+            weights (Dict[int, float], optional): Веса классов, по умолчанию DEFAULT_WEIGHTS.
+            shares (Dict[int, float], optional): Максимальные доли лимита по классам (0..1].
+        """
+        super().__init__(rate, burst)
+        self.shares = dict(shares or {})
+        self.granted: Dict[int, int] = {}
+        self._caps = {lane: RateLimiter(rate * share, max(1.0, burst * share)) for lane, share in self.shares.items()}
+        self._queue = FairQueue(weights)
+        self._pump: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int = None):
+        """
+        Ожидает токен для запроса класса priority.
+
+        Args:
+            priority (int, optional): Класс приоритета, по умолчанию current_priority().
+        """
+        lane = current_priority() if priority is None else priority
+        self._refill()
+        if not self._queue and self._tokens >= 1 and self._cap_take(lane):
+            self._grant(lane)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.push(lane, future)
+        if self._pump is None:
+            self._pump = asyncio.ensure_future(self._run())
+        await future
+
+    def _grant(self, lane: int):
+        self._tokens -= 1
+        self.granted[lane] = self.granted.get(lane, 0) + 1
+
+    def _cap_take(self, lane: int) -> bool:
+        cap = self._caps.get(lane)
+        return cap is None or cap.try_acquire()
+
+    def _cap_ready(self, lane: int) -> bool:
+        cap = self._caps.get(lane)
+        return cap is None or cap.available() >= 1
+
+    async def _run(self):
+        try:
+            while self._queue:
+                self._refill()
+                if self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                    continue
+                entry = self._queue.pop(self._cap_ready)
+                if entry is None:
+                    # все ожидающие классы исчерпали свою долю
+                    await asyncio.sleep(min((1 - self._caps[lane].available()) / self._caps[lane].rate for lane in self._queue.lanes()))
+                    continue
+                lane, future = entry
+                if future.done():
+                    continue
+                self._cap_take(lane)
+                self._grant(lane)
+                future.set_result(None)
+        finally:
+            self._pump = None
+
+
+class PrioritySemaphore:
+    """
+    Семафор, выдающий освободившиеся места ожидающим по классам приоритета с весами (FairQueue).
+
+    Attributes:
+        limit (int): Количество мест.
+        active (int): Количество занятых мест.
+    """
+
+    def __init__(self, limit: int, weights: Dict[int, float] = None):
+        """
+        Args:
+            limit (int): Количество мест.
+            weights (Dict[int, float], optional): Веса классов, по умолчанию DEFAULT_WEIGHTS.
+        """
+        self.limit = limit
+        self.active = 0
+        self._queue = FairQueue(weights)
+
+    @property
+    def waiting(self) -> int:
+        """
+        Количество ожидающих.
+
+        Returns:
+            int: Количество ожидающих.
+        """
+        return len(self._queue)
+
+    async def acquire(self, priority: int = None):
+        """
+        Занимает место, ожидая его при необходимости.
+
+        Args:
+            priority (int, optional): Класс приоритета, по умолчанию current_priority().
+        """
+        if self.active < self.limit and not self._queue:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.push(current_priority() if priority is None else priority, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """
+        Освобождает место или передает его следующему ожидающему.
+        """
+        while self._queue:
+            _, future = self._queue.pop()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = None):
+        """
+        Занимает место на время блока async with.
+
+        Args:
+            priority (int, optional): Класс приоритета.
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Запись и воспроизведение вебхуков Bitrix24.
+
+Запись включается передачей UpdateRecorder в WebhookListener. Воспроизведение выполняется
+без обращения к порталу: REST-вызовы бота обслуживает MockPortal.
+
+    python -m bitrixogram.recorder replay updates.jsonl.gz --dispatcher mybot.handlers:build --speed 10 -o v1.json
+    python -m bitrixogram.recorder compare v1.json v2.json
+    python -m bitrixogram.recorder export updates.jsonl.gz events.jsonl
+"""
+
+import argparse
+import asyncio
+import gzip
+import importlib
+import json
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+from .metrics import LatencyHistogram
+
+
+DEFAULT_REDACT = (
+    'auth[access_token]',
+    'auth[refresh_token]',
+    'auth[application_token]',
+    'auth[member_id]',
+    'data[BOT][*][AUTH][*]',
+    'data[COMMAND][*][AUTH][*]',
+)
+
+PERSONAL_FIELDS = (
+    'data[PARAMS][MESSAGE]',
+    'data[PARAMS][MESSAGE_ORIGINAL]',
+    'data[USER][NAME]',
+    'data[USER][FIRST_NAME]',
+    'data[USER][LAST_NAME]',
+    'data[USER][WORK_POSITION]',
+)
+
+REDACTED = '***'
+
+
+class UpdateRecorder:
+    """
+    Записывает полученные обновления с отметками времени в сжатый файл JSON Lines.
+
+    Каждая строка - объект {"t": время получения (unix), "u": обновление}. Значения полей,
+    совпадающих с шаблонами redact, заменяются на "***". В шаблонах "*" заменяет любую
+    последовательность символов, квадратные скобки сравниваются буквально.
+
+    Attributes:
+        path (str): Путь к файлу (.gz).
+        redact (Tuple[str, ...]): Шаблоны скрываемых полей.
+        count (int): Количество записанных обновлений.
+    """
+
+    def __init__(self, path: str, redact: Iterable[str] = DEFAULT_REDACT, flush_every: int = 100):
+        """
+        Открывает файл записи (дописывание в конец).
+
+        Args:
+            path (str): Путь к файлу.
+            redact (Iterable[str], optional): Шаблоны скрываемых полей. По умолчанию DEFAULT_REDACT,
+                для скрытия персональных данных добавьте PERSONAL_FIELDS.
+            flush_every (int, optional): Сбрасывать буфер на диск каждые flush_every обновлений.
+        """
+        self.path = path
+        self.redact = tuple(redact)
+        self._patterns = [re.compile('.*'.join(re.escape(part) for part in pattern.split('*')) + r'\Z') for pattern in self.redact]
+        self.flush_every = flush_every
+        self.count = 0
+        self._redacted: Dict[str, bool] = {}
+        self._file = gzip.open(path, 'at', encoding='utf-8', compresslevel=6)
+
+    def _is_redacted(self, key: str) -> bool:
+        redacted = self._redacted.get(key)
+        if redacted is None:
+            redacted = self._redacted[key] = any(pattern.match(key) for pattern in self._patterns)
+        return redacted
+
+    def record(self, update: Dict[str, Any]):
+        """
+        Записывает обновление.
+
+        Args:
+            update (Dict[str, Any]): Данные обновления.
+        """
+        data = {key: (REDACTED if self._is_redacted(key) else value) for key, value in update.items()}
+        self._file.write(json.dumps({'t': time.time(), 'u': data}, ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        """
+        Закрывает файл записи.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_updates(path: str) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """
+    Читает записанные обновления.
+
+    Args:
+        path (str): Путь к файлу записи (сжатому или нет).
+
+    Yields:
+        Tuple[float, Dict[str, Any]]: Время получения и обновление.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record['t'], record['u']
+
+
+class UpdateReplayer:
+    """
+    Воспроизводит записанные обновления через Dispatcher и измеряет время их обработки.
+
+    Attributes:
+        path (str): Путь к файлу записи.
+        speed (float): Ускорение относительно исходного темпа, 0 - без пауз.
+        histograms (Dict[str, LatencyHistogram]): Время обработки по типам событий и общее ("all").
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        """
+        Args:
+            path (str): Путь к файлу записи.
+            speed (float, optional): Ускорение, по умолчанию исходный темп. 0 - максимально быстро.
+        """
+        self.path = path
+        self.speed = speed
+        self.histograms: Dict[str, LatencyHistogram] = {'all': LatencyHistogram()}
+        self.errors = 0
+
+    async def _process(self, dispatcher, update: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            await dispatcher.process_update(update)
+        except Exception:
+            self.errors += 1
+        elapsed = time.perf_counter() - started
+        self.histograms['all'].record(elapsed)
+        event = str(update.get('event'))
+        histogram = self.histograms.get(event)
+        if histogram is None:
+            histogram = self.histograms[event] = LatencyHistogram()
+        histogram.record(elapsed)
+
+    async def replay(self, dispatcher) -> Dict[str, Any]:
+        """
+        Воспроизводит обновления, сохраняя интервалы между ними с учетом ускорения.
+        Обновления обрабатываются конкурентно, как в WebhookListener.
+
+        Args:
+            dispatcher (Dispatcher): Диспетчер с обработчиками бота.
+
+        Returns:
+            Dict[str, Any]: Количество обновлений, длительность и гистограммы по типам событий.
+        """
+        tasks = []
+        first = None
+        start = time.perf_counter()
+        for recorded_at, update in read_updates(self.path):
+            if first is None:
+                first = recorded_at
+            if self.speed:
+                delay = (recorded_at - first) / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(self._process(dispatcher, update)))
+        await asyncio.gather(*tasks)
+        return {
+            'updates': len(tasks),
+            'errors': self.errors,
+            'duration': time.perf_counter() - start,
+            'speed': self.speed,
+            'histograms': {event: histogram.to_dict() for event, histogram in self.histograms.items()},
+        }
+
+
+def _load_factory(spec: str) -> Callable:
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr or 'build')
+
+
+async def replay_offline(path: str, factory: Callable, speed: float = 1.0, portal_latency: float = 0.0) -> Dict[str, Any]:
+    """
+    Воспроизводит запись без доступа к порталу: бот отправляет REST-вызовы в MockPortal.
+
+    Args:
+        path (str): Путь к файлу записи.
+        factory (Callable): Функция (bot) -> Dispatcher, создающая обработчики бота.
+        speed (float, optional): Ускорение воспроизведения.
+        portal_latency (float, optional): Задержка ответов MockPortal в секундах.
+
+    Returns:
+        Dict[str, Any]: Результаты воспроизведения.
+    """
+    from aiohttp import ClientSession
+    from .client import BitrixBot
+    from .mockportal import MockPortal
+
+    async with MockPortal(rate=None, latency=portal_latency, record=False) as portal, ClientSession() as session:
+        bot = BitrixBot(portal.endpoint, 'replay', 1, session)
+        dispatcher = factory(bot)
+        if asyncio.iscoroutine(dispatcher):
+            dispatcher = await dispatcher
+        result = await UpdateReplayer(path, speed).replay(dispatcher)
+        result['rest_requests'] = portal.requests
+        return result
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> Iterator[str]:
+    """
+    Сравнивает перцентили времени обработки двух воспроизведений.
+
+    Args:
+        old (Dict[str, Any]): Результат базового воспроизведения.
+        new (Dict[str, Any]): Результат нового воспроизведения.
+
+    Yields:
+        str: Строки отчета.
+    """
+    yield f"{'event':<24} {'pct':>5} {'old, ms':>10} {'new, ms':>10} {'change':>8}"
+    for event, histogram in new['histograms'].items():
+        base = old['histograms'].get(event)
+        for name in ('p50', 'p95', 'p99', 'p999'):
+            new_value = histogram[name] * 1e3
+            if base is None:
+                yield f"{event:<24} {name:>5} {'-':>10} {new_value:>10.3f} {'new':>8}"
+                continue
+            old_value = base[name] * 1e3
+            change = f"{new_value / old_value - 1:+.1%}" if old_value else '-'
+            yield f"{event:<24} {name:>5} {old_value:>10.3f} {new_value:>10.3f} {change:>8}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bitrixogram.recorder', description='replay recorded Bitrix24 webhooks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay = commands.add_parser('replay', help='воспроизвести запись через MockPortal')
+    replay.add_argument('path')
+    replay.add_argument('--dispatcher', required=True, help='модуль:функция (bot) -> Dispatcher')
+    replay.add_argument('--speed', type=float, default=1.0, help='ускорение, 0 - без пауз')
+    replay.add_argument('--portal-latency', type=float, default=0.0, help='задержка ответов портала, с')
+    replay.add_argument('-o', '--output', help='файл JSON для результатов')
+
+    cmp = commands.add_parser('compare', help='сравнить два результата воспроизведения')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+
+    export = commands.add_parser('export', help='выгрузить события в JSON Lines для benchmarks.loadgen --events')
+    export.add_argument('path')
+    export.add_argument('output')
+
+    args = parser.parse_args(argv)
+    if args.command == 'replay':
+        result = asyncio.run(replay_offline(args.path, _load_factory(args.dispatcher), args.speed, args.portal_latency))
+        for event, histogram in result['histograms'].items():
+            print(f"{event:<24} n={histogram['count']:<8} p50={histogram['p50'] * 1e3:.3f}ms "
+                  f"p99={histogram['p99'] * 1e3:.3f}ms max={histogram['max'] * 1e3:.3f}ms")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+    elif args.command == 'compare':
+        with open(args.old, encoding='utf-8') as f_old, open(args.new, encoding='utf-8') as f_new:
+            print('\n'.join(compare(json.load(f_old), json.load(f_new))))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for _, update in read_updates(args.path):
+                f.write(json.dumps(update, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик таймеров FSM на одном таймере цикла событий.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Coroutine, List, Optional, Set, Tuple
+
+
+class Scheduler:
+    """
+    Планировщик таймеров FSM на двоичной куче с одним отложенным вызовом цикла событий.
+
+    Добавление таймера - O(log n), отмена выполняется лениво: запись в куче остается и
+    пропускается при срабатывании, если владелец (FSM) больше не считает ее актуальной.
+    Устаревшие записи вычищаются, когда их становится больше половины кучи.
+    Если цикл событий, в котором был запланирован вызов, завершился (повторный asyncio.run,
+    перезапуск слушателя в том же процессе), таймеры переносятся в текущий цикл при следующем
+    добавлении таймера.
+
+    Attributes:
+        fired (int): Количество сработавших таймеров.
+        tasks (Set[asyncio.Task]): Выполняемые обработчики таймеров.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any, Any]] = []
+        self._seq = itertools.count(1)
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._handle_due = None
+        self._loop = None
+        self._stale = 0
+        self.fired = 0
+        self.tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def time(self) -> float:
+        """
+        Текущее время цикла событий (монотонное).
+
+        Returns:
+            float: Время в секундах.
+        """
+        return asyncio.get_running_loop().time()
+
+    def schedule(self, when: float, owner: Any, key: Any) -> int:
+        """
+        Добавляет таймер.
+
+        Args:
+            when (float): Время срабатывания по часам цикла событий.
+            owner (Any): Владелец таймера с методом _fire(key, seq).
+            key (Any): Ключ таймера у владельца.
+
+        Returns:
+            int: Порядковый номер таймера для проверки актуальности.
+        """
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (when, seq, owner, key))
+        if self._loop is not asyncio.get_running_loop() or self._handle is None or when < self._handle_due:
+            # вызов, запланированный в другом (завершенном) цикле, не сработает: таймеры переносятся
+            self._arm(self._heap[0][0])
+        return seq
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        """
+        Запускает обработчик сработавшего таймера. Задача хранится до завершения, ошибка записывается в лог.
+
+        Args:
+            coro (Coroutine): Корутина обработчика.
+
+        Returns:
+            asyncio.Task: Задача обработчика.
+        """
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("timer handler failed", exc_info=task.exception())
+
+    async def drain(self, timeout: float = None) -> bool:
+        """
+        Ожидает завершения выполняемых обработчиков таймеров.
+
+        Args:
+            timeout (float, optional): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если все обработчики завершены.
+        """
+        if not self.tasks:
+            return True
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        return not pending
+
+    def discard(self):
+        """
+        Отмечает, что одна из записей кучи устарела (таймер отменен или заменен).
+        """
+        self._stale += 1
+        if self._stale > 1024 and self._stale * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if entry[2]._is_current(entry[3], entry[1])]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _arm(self, when: float):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._loop = asyncio.get_running_loop()
+        self._handle = self._loop.call_at(when, self._run)
+        self._handle_due = when
+
+    def _run(self):
+        self._handle = None
+        self._handle_due = None
+        heap = self._heap
+        now = self._loop.time()
+        while heap and heap[0][0] <= now:
+            _, seq, owner, key = heapq.heappop(heap)
+            try:
+                if owner._fire(key, seq):
+                    self.fired += 1
+                else:
+                    self._stale = max(0, self._stale - 1)
+            except Exception:
+                logging.exception("timer callback failed")
+        if heap:
+            self._arm(heap[0][0])
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Сервер вебхуков Bitrix24 на aiohttp.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+import socket
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web, ClientSession
+
+from .dispatcher import Dispatcher
+from .formdata import FormDecoder, WebhookUpdate, BodyTooLarge, MAX_BODY_SIZE, decode_form, find_field
+from .loops import loop_name
+from .monitor import LoopMonitor
+
+if TYPE_CHECKING:
+    from .recorder import UpdateRecorder
+
+
+class WebhookListener:
+    """
+    Класс для прослушивания вебхуков и обработки входящих запросов.
+
+    Attributes:
+        host (str): Хост для прослушивания.
+        port (int): Порт для прослушивания.
+        dispatcher (Dispatcher): Диспетчер для обработки обновлений.
+        session (ClientSession): Сессия для HTTP-запросов.
+        recorder (UpdateRecorder): Запись полученных обновлений для воспроизведения.
+        max_body_size (int): Максимальный размер тела запроса в байтах.
+        rejected (int): Количество отклоненных запросов (неверный токен или секрет).
+        ready (bool): Слушатель запущен и принимает вебхуки (маршрут готовности отвечает 200).
+        in_flight (int): Количество обрабатываемых вебхуков.
+        on_shutdown (List[Callable[[], Awaitable[None]]]): Функции, вызываемые в stop после завершения обработки вебхуков.
+        monitor (LoopMonitor): Измерение задержки цикла событий, запускаемое в start, или None.
+        expose_metrics (bool): Маршрут METRICS_PATH добавлен в приложение.
+    """
+
+    TOKEN_FIELD = 'auth[application_token]'
+    HEALTH_PATH = '/healthz'
+    READY_PATH = '/readyz'
+    METRICS_PATH = '/metrics'
+
+    def __init__(self, host: str, port: int, dispatcher: Dispatcher, recorder: 'UpdateRecorder' = None, max_body_size: int = MAX_BODY_SIZE,
+                 application_token: str = None, secret: str = None, reuse_port: bool = False, sock: socket.socket = None, fsm_path: str = None,
+                 lag_threshold: float = 0.1, expose_metrics: bool = False):
+        """
+        Инициализация WebhookListener.
+
+        Args:
+            host (str): Хост для прослушивания.
+            port (int): Порт для прослушивания.
+            dispatcher (Dispatcher): Диспетчер для обработки обновлений.
+            recorder (UpdateRecorder, optional): Запись полученных обновлений, см. bitrixogram.recorder.
+            max_body_size (int, optional): Максимальный размер тела запроса, по умолчанию 1 МиБ.
+            application_token (str, optional): Токен приложения auth[application_token], который портал передает
+                в каждом событии. Если задан, запросы с другим токеном отклоняются до разбора тела.
+            secret (str, optional): Секрет в параметре запроса ?secret=..., добавленный к адресу обработчика
+                при регистрации бота. Если задан, запросы без него отклоняются до чтения тела.
+            reuse_port (bool, optional): SO_REUSEPORT: новый процесс может слушать тот же порт до остановки старого.
+            sock (socket.socket, optional): Готовый слушающий сокет, например переданный systemd (socket activation);
+                host и port в этом случае не используются.
+            fsm_path (str, optional): Файл JSON для контекстов FSM: загружается в start, сохраняется в stop.
+            lag_threshold (float, optional): Порог блокировки цикла событий для LoopMonitor в секундах,
+                None - без измерения задержки цикла.
+            expose_metrics (bool, optional): Добавить маршрут GET METRICS_PATH с metrics() в JSON.
+                Если задан secret, маршрут требует его в параметре ?secret=... По умолчанию выключен.
+        """
+        self.host = host
+        self.port = port
+        self.dispatcher = dispatcher
+        self.session = ClientSession()
+        self.recorder = recorder
+        self.max_body_size = max_body_size
+        self._token_digest = self._digest(application_token) if application_token else None
+        self._secret_digest = self._digest(secret) if secret else None
+        self.rejected = 0
+        self.reuse_port = reuse_port
+        self.sock = sock
+        self.fsm_path = fsm_path
+        self.monitor = LoopMonitor(threshold=lag_threshold) if lag_threshold else None
+        self.expose_metrics = expose_metrics
+        self.ready = False
+        self.in_flight = 0
+        self.on_shutdown: List[Callable[[], Awaitable[None]]] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopped = asyncio.Event()
+        self._stopping = None
+        self._runner = None
+
+    async def handle_post(self, request):
+        """
+        Обрабатывает POST-запрос вебхука.
+
+        Args:
+            request (Request): Запрос вебхука.
+
+        Returns:
+            Response: Ответ с текстом "OK", 403 при неверном токене или секрете, 413, если тело больше max_body_size.
+        """
+        if self._secret_digest is not None and not self._verify(request.query.get('secret'), self._secret_digest):
+            return self._reject()
+        try:
+            data = await self.read_update(request)
+        except BodyTooLarge:
+            return web.Response(status=413, text="Request Entity Too Large")
+        if data is None:
+            return self._reject()
+        logging.debug(f"webhook handle post: {data}")
+        if self.recorder is not None:
+            self.recorder.record(data)
+        await self.dispatcher.process_update(data)
+        return web.Response(text="OK")
+
+    async def read_update(self, request) -> WebhookUpdate:
+        """
+        Читает и разбирает тело вебхука за один проход по мере поступления данных.
+        Тела других типов (multipart) разбираются средствами aiohttp.
+
+        Если задан application_token, тело читается целиком, токен проверяется до разбора
+        остальных полей.
+
+        Args:
+            request (Request): Запрос вебхука.
+
+        Returns:
+            WebhookUpdate: Данные обновления или None, если токен приложения неверен.
+
+        Raises:
+            BodyTooLarge: Тело больше max_body_size.
+        """
+        if self._token_digest is None:
+            data, _ = await self._read_form(request)
+        else:
+            data, _ = await self._read_form(request, lambda field: self._verify(field(self.TOKEN_FIELD), self._token_digest))
+        return data
+
+    async def _read_form(self, request, check: Callable[[Callable[[str], Optional[str]]], Any] = None) -> Tuple[Optional[WebhookUpdate], Any]:
+        """
+        Читает тело вебхука с ограничением max_body_size и проверяет его до разбора.
+
+        Args:
+            request (Request): Запрос вебхука.
+            check (Callable, optional): Проверка, получающая функцию field(name) -> значение поля формы
+                (без разбора остальных полей) и возвращающая результат. Если результат ложный, тело
+                не разбирается. Без проверки тело разбирается по мере поступления.
+
+        Returns:
+            Tuple[Optional[WebhookUpdate], Any]: Данные обновления (None, если проверка не пройдена)
+                и результат проверки.
+
+        Raises:
+            BodyTooLarge: Тело больше max_body_size.
+        """
+        if request.content_type != 'application/x-www-form-urlencoded':
+            data = WebhookUpdate(await request.post())
+            result = check(data.get) if check is not None else True
+            return (data if result else None), result
+        length = request.content_length
+        if self.max_body_size and length is not None and length > self.max_body_size:
+            raise BodyTooLarge(self.max_body_size)
+        if check is None:
+            decoder = FormDecoder(self.max_body_size)
+            async for chunk in request.content.iter_any():
+                decoder.feed(chunk)
+            return decoder.close(), True
+        body = await self._read_body(request)
+        result = check(lambda name: find_field(body, name))
+        if not result:
+            return None, result
+        return decode_form(body, 0), result
+
+    async def _read_body(self, request) -> bytes:
+        chunks = []
+        size = 0
+        async for chunk in request.content.iter_any():
+            size += len(chunk)
+            if self.max_body_size and size > self.max_body_size:
+                raise BodyTooLarge(self.max_body_size)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    @staticmethod
+    def _digest(value: str) -> bytes:
+        return hashlib.sha256(value.encode('utf-8')).digest()
+
+    @classmethod
+    def _verify(cls, value: str, digest: bytes) -> bool:
+        """
+        Сравнивает значение с хешем за постоянное время. Сравниваются хеши фиксированной длины,
+        поэтому время не зависит ни от совпадающего префикса, ни от длины значения.
+        """
+        return hmac.compare_digest(cls._digest(value or ''), digest)
+
+    def _reject(self):
+        self.rejected += 1
+        return web.Response(status=403)
+
+    @web.middleware
+    async def _track_in_flight(self, request, handler):
+        if request.method != 'POST':
+            return await handler(request)
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def handle_health(self, request):
+        """
+        Маршрут проверки жизнеспособности: процесс работает и обслуживает запросы.
+        """
+        return web.Response(text="OK")
+
+    async def handle_ready(self, request):
+        """
+        Маршрут готовности: 200, пока слушатель принимает вебхуки, 503 после начала остановки.
+        """
+        if self.ready:
+            return web.Response(text="OK")
+        return web.Response(status=503, text="Not Ready")
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики слушателя: задержку и блокировки цикла событий, количество
+        обрабатываемых и отклоненных вебхуков, блокировки обработчиков (Dispatcher(stall_threshold=...)).
+
+        Returns:
+            Dict[str, Any]: Метрики, время в секундах.
+        """
+        data = {'event_loop': loop_name(), 'in_flight': self.in_flight, 'rejected': self.rejected}
+        if self.monitor is not None:
+            data['loop'] = self.monitor.summary()
+        detector = self.dispatcher.stall_detector
+        if detector is not None:
+            data['handler_stalls'] = {'count': detector.stalls, 'worst': detector.worst, 'worst_handler': detector.worst_handler}
+        return data
+
+    async def handle_metrics(self, request):
+        """
+        Маршрут метрик: JSON из metrics(), 403 без секрета, если он задан. Стеки блокировок
+        в ответ не входят, они пишутся в лог.
+        """
+        if self._secret_digest is not None and not self._verify(request.query.get('secret'), self._secret_digest):
+            return self._reject()
+        return web.json_response(self.metrics())
+
+    def build_app(self) -> web.Application:
+        """
+        Создает приложение aiohttp с маршрутами вебхука, жизнеспособности, готовности
+        и, если задан expose_metrics, метрик.
+
+        Returns:
+            Application: Приложение aiohttp.
+        """
+        app = web.Application(middlewares=[self._track_in_flight])
+        app.router.add_post('/', self.handle_post)
+        app.router.add_get(self.HEALTH_PATH, self.handle_health)
+        app.router.add_get(self.READY_PATH, self.handle_ready)
+        if self.expose_metrics:
+            app.router.add_get(self.METRICS_PATH, self.handle_metrics)
+        return app
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[None]]):
+        """
+        Добавляет функцию, вызываемую в stop после завершения обработки вебхуков,
+        например для отправки накопленных пакетов REST-запросов.
+
+        Args:
+            hook (Callable[[], Awaitable[None]]): Асинхронная функция без аргументов.
+        """
+        self.on_shutdown.append(hook)
+
+    async def start(self):
+        """
+        Запускает прослушивание вебхуков. Если задан fsm_path, предварительно загружает контексты FSM.
+        """
+        if self.fsm_path:
+            self.dispatcher.load_fsm(self.fsm_path)
+        self._stopped.clear()
+        self._stopping = None
+        self._runner = web.AppRunner(self.build_app(), shutdown_timeout=1.0)
+        await self._runner.setup()
+        if self.sock is not None:
+            site = web.SockSite(self._runner, self.sock)
+        else:
+            site = web.TCPSite(self._runner, self.host, self.port, reuse_port=self.reuse_port or None)
+        await site.start()
+        if self.monitor is not None:
+            self.monitor.start()
+        self.ready = True
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """
+        Останавливает слушатель без потери принятых вебхуков: маршрут готовности начинает отвечать 503,
+        новые соединения не принимаются, обработка принятых вебхуков и выполняемые обработчики таймеров FSM
+        завершаются (не дольше drain_timeout),
+        затем вызываются функции on_shutdown, сохраняются контексты FSM и закрываются ресурсы.
+        Повторные вызовы ожидают завершения первого.
+
+        Args:
+            drain_timeout (float, optional): Максимальное время ожидания обработки принятых вебхуков, с.
+        """
+        if self._stopping is None:
+            self._stopping = asyncio.ensure_future(self._stop(drain_timeout))
+        await asyncio.shield(self._stopping)
+
+    async def _stop(self, drain_timeout: float):
+        self.ready = False
+        deadline = asyncio.get_running_loop().time() + drain_timeout
+        try:
+            if self._runner is not None:
+                for site in list(self._runner.sites):
+                    await site.stop()
+                try:
+                    await asyncio.wait_for(self._idle.wait(), drain_timeout)
+                except asyncio.TimeoutError:
+                    logging.warning(f"webhook listener stopped with {self.in_flight} updates in flight")
+                await self._runner.cleanup()
+                self._runner = None
+            if not await self.dispatcher.drain_timers(max(0.0, deadline - asyncio.get_running_loop().time())):
+                logging.warning("webhook listener stopped with timer handlers still running")
+            for hook in self.on_shutdown:
+                try:
+                    await hook()
+                except Exception:
+                    logging.exception("shutdown hook failed")
+            if self.monitor is not None:
+                await self.monitor.stop()
+            if self.fsm_path:
+                try:
+                    self.dispatcher.save_fsm(self.fsm_path)
+                except Exception:
+                    logging.exception(f"failed to save FSM contexts to {self.fsm_path}")
+        finally:
+            await self.close()
+            self._stopped.set()
+
+    def install_signal_handlers(self, drain_timeout: float = 30.0, signals: Iterable[int] = (signal.SIGTERM, signal.SIGINT)):
+        """
+        Вызывает stop(drain_timeout) при получении SIGTERM или SIGINT. На Windows не поддерживается.
+
+        Args:
+            drain_timeout (float, optional): Время ожидания обработки принятых вебхуков.
+            signals (Iterable[int], optional): Обрабатываемые сигналы.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.stop(drain_timeout)))
+            except NotImplementedError:
+                logging.warning("signal handlers are not supported on this platform")
+                break
+
+    async def wait_stopped(self):
+        """
+        Ожидает завершения stop.
+        """
+        await self._stopped.wait()
+
+    async def serve(self, drain_timeout: float = 30.0):
+        """
+        Запускает слушатель, устанавливает обработчики сигналов и работает до остановки.
+
+        Args:
+            drain_timeout (float, optional): Время ожидания обработки принятых вебхуков при остановке.
+        """
+        await self.start()
+        self.install_signal_handlers(drain_timeout)
+        await self.wait_stopped()
+
+    async def close(self):
+        """
+        Закрывает HTTP-сессию и файл записи обновлений.
+        """
+        await self.session.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    async def __aenter__(self):
+        """
+        Контекстный менеджер для асинхронного запуска прослушивания.
+
+        Returns:
+            WebhookListener: Ссылка на себя.
+        """
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """
+        Контекстный менеджер для асинхронного завершения прослушивания.
+
+        Args:
+            exc_type (Type[BaseException]): Тип исключения.
+            exc_val (BaseException): Значение исключения.
+            exc_tb (TracebackType): Объект трассировки исключения.
+        """
+        await self.stop()
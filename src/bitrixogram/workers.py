@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Выполнение вычислительно тяжелого кода обработчиков в пулах потоков и процессов
+и обнаружение обработчиков, блокирующих цикл событий.
+"""
+
+import asyncio
+import contextvars
+import functools
+import importlib
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, Tuple, Union
+
+_worker_loop: contextvars.ContextVar[asyncio.AbstractEventLoop] = contextvars.ContextVar('bitrixogram_worker_loop')
+
+
+def _in_thread(loop: asyncio.AbstractEventLoop, func: Callable, args: tuple, kwargs: dict) -> Any:
+    _worker_loop.set(loop)
+    return func(*args, **kwargs)
+
+
+def _reference(func: Callable) -> Union[Callable, Tuple[str, str]]:
+    # функции модуля передаются по имени: декоратор offload заменяет их в модуле оберткой
+    qualname = getattr(func, '__qualname__', '')
+    if getattr(func, '__module__', None) and qualname and '<' not in qualname and hasattr(func, '__code__'):
+        return func.__module__, qualname
+    return func
+
+
+def _resolve(target: Union[Callable, Tuple[str, str]]) -> Callable:
+    if not isinstance(target, tuple):
+        return target
+    module, qualname = target
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return getattr(obj, '_offloaded', obj)
+
+
+def _dumps(func: Callable, args: tuple, kwargs: dict) -> bytes:
+    return pickle.dumps((_reference(func), args, kwargs), pickle.HIGHEST_PROTOCOL)
+
+
+def _call_pickled(payload: bytes) -> bytes:
+    target, args, kwargs = pickle.loads(payload)
+    return pickle.dumps(_resolve(target)(*args, **kwargs), pickle.HIGHEST_PROTOCOL)
+
+
+def run_async(awaitable: Awaitable, timeout: float = None) -> Any:
+    """
+    Выполняет корутину в цикле событий из функции, вынесенной в поток (Offloader.run),
+    и ожидает результат. Например, отправка сообщения из синхронного обработчика:
+    run_async(message.bot.send_message(chat_id, text)).
+
+    Args:
+        awaitable (Awaitable): Корутина.
+        timeout (float, optional): Максимальное время ожидания в секундах.
+
+    Returns:
+        Any: Результат корутины.
+    """
+    loop = _worker_loop.get(None)
+    if loop is None:
+        raise RuntimeError("run_async() must be called from a function running in Offloader threads")
+    return asyncio.run_coroutine_threadsafe(awaitable, loop).result(timeout)
+
+
+class Offloader:
+    """
+    Пулы потоков и процессов для вычислительно тяжелых функций обработчиков.
+
+    Пулы создаются при первом использовании, размер пулов ограничен, а max_pending ограничивает
+    количество задач в очереди: при его достижении run() ожидает освобождения места, не
+    накапливая задачи в памяти. В поток передается контекст вызывающего кода (приоритет запросов,
+    запись ответов HandlerCache). Для процессов аргументы и результат сериализуются pickle с
+    наибольшим протоколом в потоке пула, а не в цикле событий; функции модуля передаются по имени.
+
+    Attributes:
+        max_threads (int): Размер пула потоков.
+        max_processes (int): Размер пула процессов.
+        max_pending (int): Максимальное количество задач в работе и в очереди или None.
+        completed (int): Количество выполненных задач.
+    """
+
+    def __init__(self, max_threads: int = None, max_processes: int = None, max_pending: int = None, mp_context=None):
+        """
+        Args:
+            max_threads (int, optional): Размер пула потоков, по умолчанию min(32, cpu + 4).
+            max_processes (int, optional): Размер пула процессов, по умолчанию количество процессоров.
+            max_pending (int, optional): Максимальное количество задач в работе и в очереди.
+            mp_context (optional): Контекст multiprocessing для пула процессов.
+        """
+        cpus = os.cpu_count() or 1
+        self.max_threads = max_threads or min(32, cpus + 4)
+        self.max_processes = max_processes or cpus
+        self.max_pending = max_pending
+        self.completed = 0
+        self._mp_context = mp_context
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество задач в работе и в очереди.
+
+        Returns:
+            int: Количество задач.
+        """
+        return self._pending
+
+    def _threads(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.max_threads, thread_name_prefix='bitrixogram-offload')
+        return self._thread_pool
+
+    def _processes(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(self.max_processes, mp_context=self._mp_context)
+        return self._process_pool
+
+    async def _submit(self, executor: Executor, call: Callable) -> Any:
+        if self.max_pending and self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self._slots is not None:
+            await self._slots.acquire()
+        self._pending += 1
+        try:
+            return await call(executor)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+            if self._slots is not None:
+                self._slots.release()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполняет функцию в пуле потоков. Из функции можно вызывать корутины через run_async().
+
+        Args:
+            func (Callable): Синхронная функция.
+            *args: Аргументы функции.
+            **kwargs: Именованные аргументы функции.
+
+        Returns:
+            Any: Результат функции.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, _in_thread, loop, func, args, kwargs)
+        return await self._submit(self._threads(), lambda executor: loop.run_in_executor(executor, call))
+
+    async def run_in_process(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Выполняет функцию в пуле процессов. Функция, аргументы и результат должны сериализоваться pickle:
+        функция объявляется на уровне модуля, вместо объектов бота и FSM передаются нужные данные.
+
+        Args:
+            func (Callable): Синхронная функция уровня модуля.
+            *args: Аргументы функции.
+            **kwargs: Именованные аргументы функции.
+
+        Returns:
+            Any: Результат функции.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def call(processes: Executor):
+            threads = self._threads()
+            payload = await loop.run_in_executor(threads, _dumps, func, args, kwargs)
+            result = await loop.run_in_executor(processes, _call_pickled, payload)
+            return await loop.run_in_executor(threads, pickle.loads, result)
+        return await self._submit(self._processes(), call)
+
+    async def close(self):
+        """
+        Ожидает завершения задач и останавливает пулы. Подходит для WebhookListener.add_shutdown_hook.
+        """
+        executors = [executor for executor in (self._thread_pool, self._process_pool) if executor is not None]
+        self._thread_pool = self._process_pool = None
+        for executor in executors:
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+
+default_offloader = Offloader()
+
+
+def offload(func: Callable = None, *, process: bool = False, offloader: Offloader = None):
+    """
+    Декоратор синхронной функции, выполняемой в пуле потоков (или процессов при process=True):
+    вызов возвращает корутину, цикл событий не блокируется.
+
+        @offload(process=True)
+        def render_report(rows):
+            ...
+
+        report = await render_report(rows)
+
+    Args:
+        func (Callable, optional): Функция.
+        process (bool, optional): Выполнять в пуле процессов. Функция должна быть объявлена на уровне модуля.
+        offloader (Offloader, optional): Пулы, по умолчанию default_offloader.
+
+    Returns:
+        Callable: Асинхронная обертка функции.
+
+    Raises:
+        TypeError: Если func - корутинная функция: ее вызов в пуле вернул бы невыполненную корутину.
+    """
+    def decorator(func: Callable):
+        if asyncio.iscoroutinefunction(func):
+            raise TypeError(f"cannot offload coroutine function {func.__qualname__}, only synchronous functions run in pools")
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            pools = offloader or default_offloader
+            if process:
+                return await pools.run_in_process(func, *args, **kwargs)
+            return await pools.run(func, *args, **kwargs)
+        wrapper._offloaded = func
+        return wrapper
+    return decorator if func is None else decorator(func)
+
+
+def offload_handler(handler: Callable, offloader: Union[Offloader, bool] = True) -> Callable:
+    """
+    Оборачивает синхронный обработчик (message_or_command, fsm_context) для выполнения в пуле потоков.
+
+    Args:
+        handler (Callable): Синхронный обработчик.
+        offloader (Union[Offloader, bool], optional): Пулы или True для default_offloader.
+
+    Returns:
+        Callable: Асинхронный обработчик.
+
+    Raises:
+        TypeError: Если handler - корутинная функция.
+    """
+    pools = offloader if isinstance(offloader, Offloader) else None
+    return offload(handler, offloader=pools)
+
+
+class _Watched:
+    __slots__ = ('_detector', '_coro', '_name')
+
+    def __init__(self, detector: 'StallDetector', coro, name: str):
+        self._detector = detector
+        self._coro = coro
+        self._name = name
+
+    def __await__(self):
+        coro, check = self._coro, self._detector.check
+        value, error = None, None
+        while True:
+            start = time.perf_counter()
+            try:
+                if error is None:
+                    yielded = coro.send(value)
+                else:
+                    yielded = coro.throw(error)
+            except StopIteration as e:
+                check(self._name, time.perf_counter() - start)
+                return e.value
+            except BaseException:
+                check(self._name, time.perf_counter() - start)
+                raise
+            check(self._name, time.perf_counter() - start)
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+class StallDetector:
+    """
+    Обнаружение обработчиков, блокирующих цикл событий: измеряется каждый непрерывный участок
+    выполнения обработчика между await, и если он дольше threshold, в лог пишется предупреждение.
+    Такой обработчик задерживает обновления всех чатов - его тяжелую часть следует вынести
+    в пул через offload.
+
+    Attributes:
+        threshold (float): Порог в секундах.
+        stalls (int): Количество обнаруженных блокировок.
+        worst (float): Самая долгая блокировка в секундах.
+        worst_handler (str): Обработчик самой долгой блокировки.
+    """
+
+    def __init__(self, threshold: float = 0.1):
+        """
+        Args:
+            threshold (float, optional): Порог в секундах, по умолчанию 0.1.
+        """
+        self.threshold = threshold
+        self.stalls = 0
+        self.worst = 0.0
+        self.worst_handler: Optional[str] = None
+
+    def watch(self, coro, name: str) -> Awaitable:
+        """
+        Оборачивает корутину обработчика для измерения.
+
+        Args:
+            coro (Coroutine): Корутина обработчика.
+            name (str): Имя обработчика для лога.
+
+        Returns:
+            Awaitable: Корутина под наблюдением.
+        """
+        return _Watched(self, coro, name)
+
+    def check(self, name: str, elapsed: float):
+        """
+        Учитывает участок выполнения обработчика.
+
+        Args:
+            name (str): Имя обработчика.
+            elapsed (float): Длительность участка в секундах.
+        """
+        if elapsed < self.threshold:
+            return
+        self.stalls += 1
+        if elapsed > self.worst:
+            self.worst = elapsed
+            self.worst_handler = name
+        logging.warning(f"Handler {name} blocked the event loop for {elapsed * 1000:.0f} ms")
+
+
+_detector: contextvars.ContextVar[Optional[StallDetector]] = contextvars.ContextVar('bitrixogram_stall_detector', default=None)
+
+
+async def call_handler(handler: Callable, *args) -> Any:
+    """
+    Вызывает обработчик, измеряя блокировки цикла событий, если диспетчер задал StallDetector.
+
+    Args:
+        handler (Callable): Асинхронный обработчик.
+        *args: Аргументы обработчика.
+
+    Returns:
+        Any: Результат обработчика.
+    """
+    detector = _detector.get()
+    if detector is None:
+        return await handler(*args)
+    return await detector.watch(handler(*args), getattr(handler, '__name__', repr(handler)))
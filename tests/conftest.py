@@ -0,0 +1,45 @@
+"""
+Общие фикстуры тестов: бот без HTTP.
+"""
+
+from urllib.parse import parse_qsl
+
+import pytest
+
+from bitrixogram.client import BitrixBot
+
+
+class FakeBot(BitrixBot):
+    """
+    Бот без HTTP: запоминает вызовы REST API и отвечает на них порядковыми номерами.
+
+    Attributes:
+        calls (list): Выполненные вызовы (метод, параметры), команды batch - по отдельности.
+        fail (bool): Отвечать ошибкой на все вызовы.
+    """
+
+    def __init__(self):
+        super().__init__('https://portal.test/rest/1/token/', 'token', 1, None)
+        self.calls = []
+        self.fail = False
+
+    def calls_of(self, method: str) -> list:
+        return [params for called, params in self.calls if called == method]
+
+    async def _request(self, method, params=None):
+        if self.fail:
+            return {'error': 'ERROR', 'error_description': 'Injected error'}
+        if method == 'batch':
+            results = {}
+            for key, command in params['cmd'].items():
+                method, query = command.split('?', 1)
+                self.calls.append((method, dict(parse_qsl(query))))
+                results[key] = len(self.calls)
+            return {'result': {'result': results, 'result_error': {}}}
+        self.calls.append((method, params))
+        return {'result': len(self.calls)}
+
+
+@pytest.fixture
+def bot() -> FakeBot:
+    return FakeBot()
@@ -0,0 +1,85 @@
+"""
+Тесты рассылки BitrixBot.broadcast.
+"""
+
+import asyncio
+
+import pytest
+
+from bitrixogram import client
+from bitrixogram.broadcast import BroadcastCheckpoint
+from bitrixogram.ratelimit import RateLimiter
+
+
+class ClosingCheckpoint(BroadcastCheckpoint):
+    """
+    Контрольная точка, запоминающая свои экземпляры и закрытие.
+    """
+
+    opened = []
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.closed = False
+        self.opened.append(self)
+
+    def close(self):
+        super().close()
+        self.closed = True
+
+
+async def send_all(bot, chat_ids, **kwargs) -> list:
+    return [result async for result in bot.broadcast(chat_ids, lambda chat_id: f"hi {chat_id}", **kwargs)]
+
+
+def test_default_rate_limit_without_bot_limiter(bot, caplog):
+    results = asyncio.run(send_all(bot, range(120)))
+    assert len(results) == 120 and all(result.ok for result in results)
+    limiter = bot._broadcast_limiter
+    assert isinstance(limiter, RateLimiter) and limiter.rate == 2.0
+    # три пакета batch заняли три токена общего ограничителя
+    assert limiter._tokens == pytest.approx(limiter.burst - 3, abs=0.5)
+    assert "no rate_limiter" in caplog.text
+
+
+def test_bot_limiter_is_used_as_is(bot):
+    bot.rate_limiter = RateLimiter()
+    asyncio.run(send_all(bot, range(60)))
+    assert bot._broadcast_limiter is None
+
+
+def test_checkpoint_path_is_closed_and_resumed(bot, tmp_path, monkeypatch):
+    monkeypatch.setattr(client, 'BroadcastCheckpoint', ClosingCheckpoint)
+    ClosingCheckpoint.opened = []
+    path = str(tmp_path / 'news.checkpoint')
+
+    results = asyncio.run(send_all(bot, range(10), batch_size=4, checkpoint=path))
+    assert sorted(result.chat_id for result in results) == list(range(10))
+    assert [checkpoint.closed for checkpoint in ClosingCheckpoint.opened] == [True]
+
+    bot.calls.clear()
+    assert asyncio.run(send_all(bot, range(12), checkpoint=path)) != []
+    assert sorted(int(params['DIALOG_ID']) for params in bot.calls_of('imbot.message.add')) == [10, 11]
+    with open(path, encoding='utf-8') as f:
+        assert sorted(int(line) for line in f) == list(range(12))
+
+
+def test_checkpoint_path_is_closed_when_broadcast_stops_early(bot, tmp_path, monkeypatch):
+    monkeypatch.setattr(client, 'BroadcastCheckpoint', ClosingCheckpoint)
+    ClosingCheckpoint.opened = []
+
+    async def main():
+        results = bot.broadcast(range(200), str, batch_size=10, checkpoint=str(tmp_path / 'stop.checkpoint'))
+        async for result in results:
+            break
+        await results.aclose()
+
+    asyncio.run(main())
+    assert [checkpoint.closed for checkpoint in ClosingCheckpoint.opened] == [True]
+
+
+def test_checkpoint_object_is_left_open_for_caller(bot, tmp_path):
+    with BroadcastCheckpoint(str(tmp_path / 'own.checkpoint')) as checkpoint:
+        asyncio.run(send_all(bot, range(5), checkpoint=checkpoint))
+        assert checkpoint._file is not None and len(checkpoint) == 5
+    assert checkpoint._file is None
@@ -0,0 +1,54 @@
+"""
+Тесты потокового разбора тел вебхуков.
+"""
+
+from urllib.parse import parse_qsl
+
+import pytest
+
+from bitrixogram import formdata
+from bitrixogram.formdata import BodyTooLarge, FormDecoder, decode_form, find_field
+from bitrixogram.mockportal import encode_event, message_event
+
+
+def test_decode_matches_parse_qsl():
+    body = encode_event(message_event(text="Привет & 100% + ещё", dialog_id=7))
+    update = decode_form(body)
+    assert dict(update) == dict(parse_qsl(body.decode('ascii'), keep_blank_values=True))
+    assert update.nested['data']['PARAMS']['MESSAGE'] == "Привет & 100% + ещё"
+    assert update.nested['data']['PARAMS']['DIALOG_ID'] == '7'
+
+
+@pytest.mark.parametrize('size', [1, 3, 17, 256])
+def test_decode_in_chunks(size):
+    body = encode_event(message_event(text="разбор по частям"))
+    chunks = [body[start:start + size] for start in range(0, len(body), size)]
+    assert dict(decode_form(chunks)) == dict(decode_form(body))
+
+
+def test_repeated_keys_keep_first_value():
+    assert dict(decode_form(b'a=1&a=2&b=3')) == {'a': '1', 'b': '3'}
+
+
+def test_body_limit():
+    decoder = FormDecoder(max_size=10)
+    decoder.feed(b'a=12345')
+    with pytest.raises(BodyTooLarge):
+        decoder.feed(b'&b=12345')
+
+
+def test_find_field_without_decoding():
+    body = encode_event(message_event(application_token='tok en/1'))
+    assert find_field(body, 'auth[application_token]') == 'tok en/1'
+    assert find_field(body, 'auth[missing]') is None
+
+
+def test_long_keys_and_values_are_not_cached():
+    long_key = 'data[' + 'K' * 10_000 + ']'
+    body = f'{long_key}=1&short=v&long={"V" * 10_000}'.encode('ascii')
+    update = decode_form(body, 0)
+    assert update[long_key] == '1' and update.nested['data']['K' * 10_000] == '1'
+    assert long_key.encode('ascii') not in formdata._raw_keys
+    assert long_key not in formdata._key_paths
+    assert b'short' in formdata._raw_keys
+    assert all(len(raw) <= formdata._CACHED_VALUE_SIZE for raw in formdata._raw_values)
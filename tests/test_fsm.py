@@ -0,0 +1,99 @@
+"""
+Тесты данных контекстов FSM и их упаковки.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+
+import pytest
+
+from bitrixogram.fsm import FSM, FSMContext
+
+
+def test_unsaved_data_is_shared():
+    async def main():
+        context = FSMContext(1, FSM())
+        first = await context.get_data()
+        second = await context.get_data()
+        first['a'] = 1
+        second['b'] = 2
+        return await context.get_data()
+
+    assert asyncio.run(main()) == {'a': 1, 'b': 2}
+
+
+def test_update_data_after_get_data():
+    async def main():
+        context = FSMContext(1, FSM())
+        data = await context.get_data()
+        await context.update_data(a=1)
+        data['b'] = 2
+        return await context.get_data()
+
+    assert asyncio.run(main()) == {'a': 1, 'b': 2}
+
+
+@pytest.mark.skipif(not hasattr(sys, 'getrefcount'), reason="compact packs every idle context without refcounts")
+def test_compact_skips_held_data():
+    async def main():
+        fsm = FSM()
+        held = await FSMContext(1, fsm).get_data()
+        held['answer'] = 'yes'
+        await FSMContext(2, fsm).update_data(step=1)
+        fsm.compact()
+        packed = fsm.compact()
+        held['late'] = True
+        return packed, held, await FSMContext(1, fsm).get_data(), await FSMContext(2, fsm).get_data()
+
+    packed, held, data, unpacked = asyncio.run(main())
+    assert packed == 1
+    assert data is held and data == {'answer': 'yes', 'late': True}
+    assert unpacked == {'step': 1}
+
+
+def test_compact_packs_released_data():
+    async def main():
+        fsm = FSM()
+        data = await FSMContext(1, fsm).get_data()
+        data['answer'] = 'yes'
+        del data
+        fsm.compact()
+        packed = fsm.compact()
+        return packed, await FSMContext(1, fsm).get_data()
+
+    packed, data = asyncio.run(main())
+    assert packed == 1
+    assert data == {'answer': 'yes'}
+
+
+def test_compact_skips_unpicklable_data(caplog):
+    async def main():
+        fsm = FSM()
+        await FSMContext(1, fsm).update_data(lock=threading.Lock())
+        await FSMContext(2, fsm).update_data(step=1)
+        fsm.compact()
+        with caplog.at_level(logging.WARNING):
+            packed = fsm.compact()
+        return fsm, packed, await FSMContext(1, fsm).get_data(), await FSMContext(2, fsm).get_data()
+
+    fsm, packed, locked, unpacked = asyncio.run(main())
+    assert packed == 1
+    assert isinstance(locked['lock'], type(threading.Lock()))
+    assert unpacked == {'step': 1}
+    assert any('chat 1' in record.getMessage() for record in caplog.records)
+
+
+def test_to_dict_keeps_compacted_data_packed():
+    async def main():
+        fsm = FSM()
+        await FSMContext(1, fsm).update_data(step=1)
+        fsm.compact()
+        fsm.compact()
+        saved = fsm.to_dict()
+        return fsm.memory_report()['cold'], fsm.compact(), saved
+
+    cold, packed_again, saved = asyncio.run(main())
+    assert cold == 1 and packed_again == 0
+    assert saved['contexts'] == [{'chat_id': 1, 'state': None, 'data': {'step': 1}}]
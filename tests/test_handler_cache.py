@@ -0,0 +1,57 @@
+"""
+Тесты кеша ответов обработчиков.
+"""
+
+import asyncio
+
+from bitrixogram.cache import HandlerCache
+from bitrixogram.dispatcher import Dispatcher, MagicFilter, Router
+from bitrixogram.mockportal import message_event
+from bitrixogram.outbox import Outbox
+
+F = MagicFilter()
+
+
+def test_handler_cache_replays_through_outbox(bot):
+    cache = HandlerCache(ttl=60)
+    router = Router()
+    runs = []
+
+    @router.message(F.contains_any("faq"), cache=cache)
+    async def faq(message, fsm_context):
+        runs.append(message.get_chat_id())
+        bot.outbox.send_message(message.get_chat_id(), "answer")
+
+    async def main():
+        bot.outbox = Outbox(bot)
+        dispatcher = Dispatcher()
+        dispatcher.add_router(router)
+        for chat_id in (1, 2, 3):
+            await dispatcher.process_update(message_event(text="faq", dialog_id=chat_id))
+        await bot.outbox.close()
+        return bot.outbox.sent
+
+    sent = asyncio.run(main())
+    assert len(runs) == 1 and cache.hits == 2
+    assert sent == 3
+    assert sorted(str(params['DIALOG_ID']) for params in bot.calls_of('imbot.message.add')) == ['1', '2', '3']
+
+
+def test_handler_cache_replays_direct_replies(bot):
+    cache = HandlerCache(ttl=60)
+    router = Router()
+
+    @router.message(F.contains_any("faq"), cache=cache)
+    async def faq(message, fsm_context):
+        await bot.send_message(message.get_chat_id(), "answer")
+
+    async def main():
+        bot.outbox = Outbox(bot)
+        dispatcher = Dispatcher()
+        dispatcher.add_router(router)
+        for chat_id in (1, 2):
+            await dispatcher.process_update(message_event(text="faq", dialog_id=chat_id))
+        return bot.outbox.sent
+
+    assert asyncio.run(main()) == 0
+    assert cache.hits == 1 and len(bot.calls_of('imbot.message.add')) == 2
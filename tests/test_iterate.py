@@ -0,0 +1,149 @@
+"""
+Тесты постраничного перебора списочных методов.
+"""
+
+import asyncio
+
+import pytest
+
+from bitrixogram.client import BitrixError
+
+from conftest import FakeBot
+
+
+class ListBot(FakeBot):
+    """
+    Бот со списком элементов, который отдается страницами по 50 элементов, как в Bitrix24.
+
+    Attributes:
+        pages (list): Смещения запрошенных страниц.
+        fail_at (int): Смещение страницы, на которой метод отвечает ошибкой.
+    """
+
+    PAGE = 50
+
+    def __init__(self, count: int, result_key: str = None):
+        super().__init__()
+        self.items = [{'ID': i} for i in range(count)]
+        self.result_key = result_key
+        self.pages = []
+        self.fail_at = None
+
+    def _page(self, start: int) -> dict:
+        self.pages.append(start)
+        if start == self.fail_at:
+            return {'error': 'QUERY_LIMIT_EXCEEDED', 'error_description': 'Too many requests'}
+        items = self.items[start:start + self.PAGE]
+        result = {self.result_key: items} if self.result_key else items
+        response = {'result': result, 'total': len(self.items)}
+        if start + self.PAGE < len(self.items):
+            response['next'] = start + self.PAGE
+        return response
+
+    async def _request(self, method, params=None):
+        if method != 'batch':
+            self.calls.append((method, params))
+            return self._page(int(params['start']))
+        results, errors = {}, {}
+        for key, command in params['cmd'].items():
+            self.calls.append(('batch', key))
+            page = self._page(int(key[1:]))
+            if 'error' in page:
+                errors[key] = page
+            else:
+                results[key] = page['result']
+        return {'result': {'result': results, 'result_error': errors}}
+
+
+async def collect(bot: ListBot, **kwargs) -> list:
+    return [item['ID'] async for item in bot.iterate('test.item.list', {'filter': 'x'}, **kwargs)]
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_pages_in_order(prefetch):
+    async def main():
+        bot = ListBot(120)
+        assert await collect(bot, prefetch=prefetch) == list(range(120))
+        assert bot.pages == [0, 50, 100]
+        assert all(params['filter'] == 'x' for _, params in bot.calls)
+
+    asyncio.run(main())
+
+
+def test_single_page_and_empty_list():
+    async def main():
+        assert await collect(ListBot(30)) == list(range(30))
+        bot = ListBot(0)
+        assert await collect(bot) == []
+        assert bot.pages == [0]
+
+    asyncio.run(main())
+
+
+def test_start_offset():
+    async def main():
+        bot = ListBot(120)
+        ids = [item['ID'] async for item in bot.iterate('test.item.list', {'start': 50})]
+        assert ids == list(range(50, 120))
+        assert bot.pages == [50, 100]
+
+    asyncio.run(main())
+
+
+def test_result_key():
+    async def main():
+        bot = ListBot(75, result_key='tasks')
+        assert await collect(bot, result_key='tasks') == list(range(75))
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_fan_out_batches_remaining_pages(prefetch):
+    async def main():
+        bot = ListBot(520)
+        assert await collect(bot, prefetch=prefetch, fan_out=4) == list(range(520))
+        direct = [params['start'] for method, params in bot.calls if method == 'test.item.list']
+        batched = [key for method, key in bot.calls if method == 'batch']
+        assert direct == [0]
+        assert batched == [f"p{offset}" for offset in range(50, 520, 50)]
+        assert sorted(bot.pages) == list(range(0, 520, 50))
+
+    asyncio.run(main())
+
+
+def test_error_page_raises():
+    async def main():
+        bot = ListBot(120)
+        bot.fail_at = 50
+        seen = []
+        with pytest.raises(BitrixError):
+            async for item in bot.iterate('test.item.list'):
+                seen.append(item['ID'])
+        assert seen == list(range(50))
+
+    asyncio.run(main())
+
+
+def test_error_in_batch_raises():
+    async def main():
+        bot = ListBot(300)
+        bot.fail_at = 150
+        with pytest.raises(BitrixError):
+            await collect(bot, fan_out=2)
+
+    asyncio.run(main())
+
+
+def test_early_exit_reads_at_most_one_page_ahead():
+    async def main():
+        bot = ListBot(500)
+        pages = bot.iterate('test.item.list')
+        async for item in pages:
+            if item['ID'] == 10:
+                break
+        await pages.aclose()
+        await asyncio.sleep(0)
+        assert bot.pages in ([0], [0, 50])
+
+    asyncio.run(main())
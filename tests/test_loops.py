@@ -0,0 +1,35 @@
+"""
+Тесты выбора цикла событий.
+"""
+
+import asyncio
+
+import pytest
+
+from bitrixogram import loops
+
+
+async def current_loop() -> str:
+    return loops.loop_name()
+
+
+def test_default_is_stdlib_asyncio(monkeypatch):
+    monkeypatch.delenv(loops.LOOP_ENV, raising=False)
+    assert loops.loop_factory() is asyncio.new_event_loop
+    assert loops.run(current_loop()) == 'asyncio'
+
+
+def test_environment_selects_loop(monkeypatch):
+    monkeypatch.setenv(loops.LOOP_ENV, 'asyncio')
+    assert loops.run(current_loop()) == 'asyncio'
+    pytest.importorskip('uvloop')
+    monkeypatch.setenv(loops.LOOP_ENV, 'uvloop')
+    assert loops.run(current_loop()) == 'uvloop'
+
+
+def test_uvloop_only_on_request(monkeypatch):
+    monkeypatch.delenv(loops.LOOP_ENV, raising=False)
+    uvloop = pytest.importorskip('uvloop')
+    assert loops.loop_factory('auto') is uvloop.new_event_loop
+    assert loops.run(current_loop(), loop='uvloop') == 'uvloop'
+    assert loops.run(current_loop(), loop='asyncio') == 'asyncio'
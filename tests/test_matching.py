@@ -0,0 +1,97 @@
+"""
+Тесты совместной проверки правил текста обработчиков (TextMatcher).
+"""
+
+import asyncio
+import re
+
+import pytest
+
+from bitrixogram.dispatcher import Dispatcher, FSMContext, MagicFilter, Message, Router
+from bitrixogram.matching import Keywords, TextMatcher
+from bitrixogram.mockportal import message_event
+
+F = MagicFilter()
+
+
+def test_handler_order_wins_over_position_in_text():
+    matcher = TextMatcher({0: re.compile('world'), 1: re.compile('hello'), 2: Keywords(('hello',))})
+    assert matcher.first('hello world') == 0
+    assert matcher.first('hello world', 1) == 1
+    assert matcher.first('hello world', 2) == 2
+    assert matcher.first('hello world', 3) is None
+    assert matcher.first('goodbye') is None
+
+
+def test_keywords_before_patterns():
+    matcher = TextMatcher({0: Keywords(('price',)), 1: re.compile(r'\d+'), 2: Keywords(('order',))})
+    assert matcher.first('order 42') == 1
+    assert matcher.first('price of order 42') == 0
+    assert matcher.first('order') == 2
+
+
+def test_flags_stay_with_their_pattern():
+    matcher = TextMatcher({0: re.compile('ABC'), 1: re.compile('abc', re.IGNORECASE), 2: re.compile('^second$', re.MULTILINE)})
+    assert matcher.first('ABC') == 0
+    assert matcher.first('abc') == 1
+    assert matcher.first('first\nsecond') == 2
+
+
+def test_patterns_with_groups_and_backreferences():
+    matcher = TextMatcher({0: re.compile(r'(\w)\1'), 1: re.compile('x'), 2: re.compile(r'(?P<n>\d)-(?P=n)'), 3: re.compile('y')})
+    assert matcher.first('x aa') == 0
+    assert matcher.first('x') == 1
+    assert matcher.first('y 1-1') == 2
+    assert matcher.first('y 1-2') == 3
+
+
+def test_keywords_casefold_both_sides():
+    matcher = TextMatcher({0: Keywords(('STRASSE',)), 1: Keywords(('ärger',), whole_words=False)})
+    assert matcher.first('Die Straße') == 0
+    assert matcher.first('ÄRGERLICH') == 1
+
+
+def route(text: str, handlers) -> str:
+    router = Router()
+    chosen = []
+    for name, filters in handlers:
+        async def handler(message, fsm_context, name=name):
+            chosen.append(name)
+        handler.__name__ = name
+        router.message(*filters)(handler)
+
+    async def main():
+        dispatcher = Dispatcher()
+        dispatcher.add_router(router)
+        await dispatcher.process_update(message_event(text=text))
+
+    asyncio.run(main())
+    return chosen[0] if chosen else None
+
+
+async def sequential(text: str, handlers) -> str:
+    message = Message(message_event(text=text))
+    for name, filters in handlers:
+        results = [await f(message, FSMContext()) for f in filters]
+        if all(results):
+            return name
+    return None
+
+
+HANDLERS = [
+    ('digits_long', [F.regexp(r'\d{4}'), F.contains_any('pin')]),
+    ('greeting', [F.contains_any('hello', 'hi')]),
+    ('fuzzy_help', [F.fuzzy('help me')]),
+    ('order', [F.regexp(r'order\s+(\d+)')]),
+    ('digits', [F.regexp(r'\d+')]),
+    ('street', [F.contains_any('Strasse', whole_words=False)]),
+    ('anything', [F.regexp('.')]),
+]
+
+
+@pytest.mark.parametrize('text', [
+    'pin 1234', 'hello 1234', 'HI there', 'helpp me', 'order 12', 'my order 12 hello',
+    'call 555', 'Hauptstraße', 'hmm', '', 'this', 'high',
+])
+def test_router_matches_sequential_filters(text):
+    assert route(text, HANDLERS) == asyncio.run(sequential(text, HANDLERS))
@@ -0,0 +1,67 @@
+"""
+Тесты измерения задержки цикла событий и маршрута метрик.
+"""
+
+import asyncio
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from bitrixogram.dispatcher import Dispatcher
+from bitrixogram.monitor import LoopMonitor
+from bitrixogram.webhook import WebhookListener
+
+
+def blocker():
+    time.sleep(0.3)
+
+
+def test_monitor_captures_blocking_stack():
+    async def main():
+        monitor = LoopMonitor(interval=0.01, threshold=0.1)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocker()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(main())
+    assert monitor.stall_count >= 1
+    assert 'blocker' in monitor.stalls[-1].stack
+    summary = monitor.summary()
+    assert summary['stalls'] == monitor.stall_count
+    assert set(summary['last_stall']) == {'started', 'blocked'}
+    assert not monitor.running
+
+
+async def _get(listener: WebhookListener, path: str):
+    async with TestClient(TestServer(listener.build_app())) as client:
+        response = await client.get(path)
+        return response.status, await response.json() if response.status == 200 else None
+
+
+def test_metrics_route_is_opt_in():
+    async def main():
+        listener = WebhookListener('127.0.0.1', 0, Dispatcher(), lag_threshold=None)
+        try:
+            return await _get(listener, WebhookListener.METRICS_PATH)
+        finally:
+            await listener.close()
+
+    assert asyncio.run(main()) == (404, None)
+
+
+def test_metrics_route_requires_secret():
+    async def main():
+        listener = WebhookListener('127.0.0.1', 0, Dispatcher(), secret='s3cret', expose_metrics=True, lag_threshold=None)
+        try:
+            return (await _get(listener, WebhookListener.METRICS_PATH),
+                    await _get(listener, WebhookListener.METRICS_PATH + '?secret=wrong'),
+                    await _get(listener, WebhookListener.METRICS_PATH + '?secret=s3cret'))
+        finally:
+            await listener.close()
+
+    missing, wrong, valid = asyncio.run(main())
+    assert missing[0] == 403 and wrong[0] == 403
+    assert valid[0] == 200 and valid[1]['in_flight'] == 0 and 'event_loop' in valid[1]
@@ -0,0 +1,42 @@
+"""
+Тесты очереди исходящих вызовов.
+"""
+
+import asyncio
+
+import pytest
+
+from bitrixogram.client import BitrixError
+from bitrixogram.outbox import Outbox
+
+
+def test_outbox_keeps_chat_order(bot):
+    async def main():
+        outbox = Outbox(bot)
+        futures = [outbox.send_message(chat_id % 3, f"m{chat_id}") for chat_id in range(12)]
+        await outbox.close()
+        return await asyncio.gather(*futures)
+
+    results = asyncio.run(main())
+    assert len(set(results)) == 12
+    sent = bot.calls_of('imbot.message.add')
+    for chat_id in range(3):
+        texts = [params['MESSAGE'] for params in sent if str(params['DIALOG_ID']) == str(chat_id)]
+        assert texts == [f"m{index}" for index in range(chat_id, 12, 3)]
+
+
+def test_failed_calls_go_to_dead_letters_and_retry(bot):
+    async def main():
+        outbox = Outbox(bot, max_attempts=2, retry_delay=0.01)
+        bot.fail = True
+        with pytest.raises(BitrixError):
+            await outbox.send_message(1, "hello")
+        await outbox.flush()
+        failed, retried, dead = outbox.failed, outbox.retried, len(outbox.dead_letters)
+        bot.fail = False
+        revived = outbox.retry_dead_letters()
+        await outbox.close()
+        return failed, retried, dead, revived, len(outbox.dead_letters)
+
+    assert asyncio.run(main()) == (1, 1, 1, 1, 0)
+    assert len(bot.calls_of('imbot.message.add')) == 1
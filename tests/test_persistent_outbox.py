@@ -0,0 +1,135 @@
+"""
+Тесты очереди исходящих вызовов с сохранением в SQLite.
+"""
+
+import asyncio
+import datetime
+import os
+
+import pytest
+
+from bitrixogram.client import BitrixError
+from bitrixogram.outbox import PersistentOutbox
+
+from conftest import FakeBot
+
+
+class HangingBot(FakeBot):
+    """
+    Бот, вызовы которого не завершаются: имитирует остановку процесса во время отправки.
+    """
+
+    async def _request(self, method, params=None):
+        await asyncio.Event().wait()
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return os.path.join(tmp_path, 'outbox.db')
+
+
+def test_completed_key_returns_stored_result(bot, path):
+    async def main():
+        outbox = PersistentOutbox(bot, path)
+        first = await outbox.send_message(1, "hello", dedup_key='reply:1')
+        again = await outbox.send_message(1, "hello", dedup_key='reply:1')
+        await outbox.close()
+        return first, again, outbox.deduplicated
+
+    first, again, deduplicated = asyncio.run(main())
+    assert again == first and deduplicated == 1
+    assert len(bot.calls) == 1
+
+
+def test_pending_key_shares_result(bot, path):
+    async def main():
+        outbox = PersistentOutbox(bot, path)
+        first = outbox.send_message(1, "hello", dedup_key='reply:1')
+        second = outbox.send_message(1, "hello", dedup_key='reply:1')
+        results = await asyncio.gather(first, second)
+        await outbox.close()
+        return results
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert len(bot.calls) == 1
+
+
+def test_dead_key_is_sent_again(bot, path):
+    async def main():
+        outbox = PersistentOutbox(bot, path, max_attempts=1)
+        bot.fail = True
+        with pytest.raises(BitrixError):
+            await outbox.send_message(1, "hello", dedup_key='reply:1')
+        await outbox.flush()
+        dead = len(outbox.dead_letters)
+        bot.fail = False
+        result = await outbox.send_message(1, "hello again", dedup_key='reply:1')
+        await outbox.close()
+        return dead, result, len(outbox.dead_letters)
+
+    dead, result, left = asyncio.run(main())
+    assert dead == 1 and left == 0
+    assert result is not None
+    assert len(bot.calls) == 1 and bot.calls[0][1]['MESSAGE'] == "hello again"
+
+
+def test_dead_key_after_restart_is_sent_again(bot, path):
+    async def fail():
+        outbox = PersistentOutbox(bot, path, max_attempts=1)
+        bot.fail = True
+        with pytest.raises(BitrixError):
+            await outbox.send_message(1, "hello", dedup_key='reply:1')
+        await outbox.close()
+
+    async def resend():
+        outbox = PersistentOutbox(bot, path)
+        await outbox.open()
+        dead = len(outbox.dead_letters)
+        bot.fail = False
+        result = await outbox.send_message(1, "hello", dedup_key='reply:1')
+        await outbox.close()
+        return dead, result, len(outbox.dead_letters)
+
+    asyncio.run(fail())
+    dead, result, left = asyncio.run(resend())
+    assert dead == 1 and left == 0
+    assert result is not None and len(bot.calls) == 1
+
+
+def test_unsent_calls_are_replayed_after_restart(bot, path):
+    async def crash():
+        outbox = PersistentOutbox(HangingBot(), path)
+        for chat_id in range(5):
+            outbox.send_message(chat_id, f"m{chat_id}", dedup_key=f"reply:{chat_id}")
+        await asyncio.sleep(0.1)
+
+    async def restart():
+        outbox = PersistentOutbox(bot, path)
+        replayed = await outbox.open()
+        duplicate = outbox.send_message(0, "m0", dedup_key='reply:0')
+        await outbox.close()
+        return replayed, duplicate.result(), outbox.deduplicated
+
+    asyncio.run(crash())
+    replayed, duplicate, deduplicated = asyncio.run(restart())
+    assert replayed == 5 and deduplicated == 1
+    assert duplicate is not None
+    assert len(bot.calls) == 5
+
+
+def test_unserializable_params_reject_only_that_call(bot, path):
+    async def main():
+        outbox = PersistentOutbox(bot, path)
+        before = outbox.send_message(1, "before", dedup_key='reply:1')
+        broken = outbox.submit('im.message.update', {'MESSAGE_ID': 1, 'DATE': datetime.datetime.now()}, 1)
+        after = outbox.send_message(1, "after", dedup_key='reply:2')
+        results = await asyncio.gather(before, broken, after, return_exceptions=True)
+        flushed = await outbox.flush(timeout=1.0)
+        await outbox.close()
+        return results, flushed
+
+    (before, broken, after), flushed = asyncio.run(main())
+    assert isinstance(broken, TypeError)
+    assert before is not None and after is not None and flushed
+    assert [params['MESSAGE'] for params in bot.calls_of('imbot.message.add')] == ["before", "after"]
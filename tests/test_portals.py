@@ -0,0 +1,105 @@
+"""
+Тесты обслуживания ботов нескольких порталов одним слушателем.
+"""
+
+import asyncio
+import logging
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from bitrixogram.dispatcher import Dispatcher, MagicFilter, Router
+from bitrixogram.mockportal import BOT_ID, encode_event, message_event
+from bitrixogram.portals import MultiPortalListener, SessionPool
+
+F = MagicFilter()
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def build_listener(seen: list, **kwargs) -> MultiPortalListener:
+    router = Router()
+
+    @router.message(F.text())
+    async def remember(message, fsm_context):
+        await fsm_context.update_data(count=(await fsm_context.get_data()).get('count', 0) + 1)
+        seen.append((message.bot.base_id, message.get_text(), fsm_context.namespace))
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    return MultiPortalListener('127.0.0.1', 0, dispatcher, pool=SessionPool(rate=None), **kwargs)
+
+
+async def post(listener: MultiPortalListener, requests: list) -> list:
+    statuses = []
+    async with TestClient(TestServer(listener.build_app())) as client:
+        for path, event in requests:
+            response = await client.post(path, data=encode_event(event), headers=FORM)
+            statuses.append(response.status)
+    await listener.close()
+    return statuses
+
+
+def test_routing_by_path_and_domain():
+    seen = []
+
+    async def main():
+        listener = build_listener(seen)
+        listener.add_portal('a', 'https://a.bitrix24.ru/rest/1/x/', 't', BOT_ID, application_token='tokA')
+        listener.add_portal('b', 'https://b.bitrix24.ru/rest/1/x/', 't', BOT_ID, application_token='tokB')
+        return listener, await post(listener, [
+            ('/', message_event('by domain', domain='a.bitrix24.ru', application_token='tokA')),
+            ('/b', message_event('by path', domain='other.ru', application_token='tokB')),
+            ('/', message_event('wrong token', domain='a.bitrix24.ru', application_token='tokB')),
+            ('/a', message_event('wrong path token', application_token='tokB')),
+            ('/c', message_event('unknown portal', application_token='tokA')),
+            ('/', message_event('unknown domain', domain='c.bitrix24.ru', application_token='tokA')),
+        ])
+
+    listener, statuses = asyncio.run(main())
+    assert statuses == [200, 200, 403, 403, 403, 403]
+    assert [(text, namespace) for _, text, namespace in seen] == [('by domain', 'a'), ('by path', 'b')]
+    assert listener.rejected == 4
+    assert listener.portals['a'].updates == 1 and listener.portals['b'].updates == 1
+
+
+def test_bots_of_one_domain_are_told_apart_by_bot_id():
+    seen = []
+
+    async def main():
+        listener = build_listener(seen)
+        listener.add_portal('other', 'https://a.bitrix24.ru/rest/1/x/', 't', str(BOT_ID + 1), application_token='tok')
+        listener.add_portal('mock', 'https://a.bitrix24.ru/rest/1/y/', 't', str(BOT_ID), application_token='tok')
+        return await post(listener, [('/', message_event('hi', domain='a.bitrix24.ru', application_token='tok'))])
+
+    assert asyncio.run(main()) == [200]
+    assert seen == [(str(BOT_ID), 'hi', 'mock')]
+
+
+def test_fsm_contexts_are_separate_per_portal():
+    seen = []
+
+    async def main():
+        listener = build_listener(seen)
+        listener.add_portal('a', 'https://a.bitrix24.ru/rest/1/x/', 't', BOT_ID, application_token='tokA')
+        listener.add_portal('b', 'https://b.bitrix24.ru/rest/1/x/', 't', BOT_ID, application_token='tokB')
+        router_fsm = listener.dispatcher.routers[0].fsm
+        await post(listener, [('/a', message_event('1', application_token='tokA')),
+                              ('/a', message_event('2', application_token='tokA')),
+                              ('/b', message_event('3', application_token='tokB'))])
+        return [await (await router_fsm.namespace(key).get_context(1)).get_data() for key in ('a', 'b')]
+
+    assert asyncio.run(main()) == [{'count': 2}, {'count': 1}]
+
+
+def test_portal_without_token_is_warned_about(caplog):
+    async def main():
+        with caplog.at_level(logging.WARNING):
+            open_listener = build_listener([])
+            open_listener.add_portal('open', 'https://a.bitrix24.ru/rest/1/x/', 't', BOT_ID)
+            secret_listener = build_listener([], secret='s3cret')
+            secret_listener.add_portal('closed', 'https://b.bitrix24.ru/rest/1/x/', 't', BOT_ID)
+        await open_listener.close()
+        await secret_listener.close()
+
+    asyncio.run(main())
+    warnings = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1 and 'portal open' in warnings[0]
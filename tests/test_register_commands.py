@@ -0,0 +1,142 @@
+"""
+Тесты инкрементальной регистрации команд бота.
+"""
+
+import asyncio
+import json
+import os
+from urllib.parse import parse_qsl
+
+import pytest
+
+from conftest import FakeBot
+
+
+class CommandBot(FakeBot):
+    """
+    Бот с командами портала в памяти. Повторная регистрация команды отвечает ошибкой
+    (с ID команды или без него, в зависимости от duplicate) или, как Bitrix24, ее ID.
+    """
+
+    def __init__(self, duplicate: str = 'id'):
+        super().__init__()
+        self.duplicate = duplicate
+        self.commands = {}
+        self.methods = []
+
+    def _call(self, method: str, params: dict):
+        self.methods.append(method)
+        if method == 'imbot.command.register':
+            existing = [command_id for command_id, command in self.commands.items() if command['COMMAND'] == params['COMMAND']]
+            if existing:
+                if self.duplicate == 'id':
+                    return {'result': existing[0]}
+                error = {'error': 'COMMAND_EXISTS', 'error_description': 'Command already registered'}
+                if self.duplicate == 'error_with_id':
+                    error['COMMAND_ID'] = existing[0]
+                return error
+            command_id = len(self.commands) + 1
+            self.commands[command_id] = {'COMMAND': params['COMMAND'], 'TITLE': params.get('LANG[0][TITLE]')}
+            return {'result': command_id}
+        command_id = int(params['COMMAND_ID'])
+        if command_id not in self.commands:
+            return {'error': 'COMMAND_ID_ERROR', 'error_description': 'Command not found'}
+        if method == 'imbot.command.update':
+            self.commands[command_id]['TITLE'] = params.get('FIELDS[LANG][0][TITLE]')
+        else:
+            del self.commands[command_id]
+        return {'result': True}
+
+    async def _request(self, method, params=None):
+        assert method == 'batch'
+        results, errors = {}, {}
+        for key, command in params['cmd'].items():
+            called, query = command.split('?', 1)
+            response = self._call(called, dict(parse_qsl(query)))
+            if 'error' in response:
+                errors[key] = response
+            else:
+                results[key] = response['result']
+        return {'result': {'result': results, 'result_error': errors}}
+
+
+def commands(*names: str, title: str = 'Title') -> list:
+    return [{'COMMAND': name, 'TITLE': title, 'PARAMS': '', 'EVENT_COMMAND_ADD': 'https://bot.test/'} for name in names]
+
+
+@pytest.fixture
+def manifest(tmp_path) -> str:
+    return os.path.join(tmp_path, 'commands.json')
+
+
+def test_incremental_registration(manifest):
+    bot = CommandBot()
+
+    async def main():
+        first = await bot.register_commands(commands('start', 'help_me'), manifest_path=manifest)
+        unchanged = await bot.register_commands(commands('start', 'help_me'), manifest_path=manifest)
+        calls = len(bot.methods)
+        changed = await bot.register_commands(commands('start', title='New') + commands('stop'), manifest_path=manifest)
+        return first, unchanged, calls, changed
+
+    first, unchanged, calls, changed = asyncio.run(main())
+    assert sorted(first['registered']) == ['help_me', 'start'] and not first['errors']
+    assert unchanged == {'registered': [], 'updated': [], 'unregistered': [], 'existing': [], 'errors': {}}
+    # первая регистрация без манифеста: register и update каждой команды
+    assert calls == 4
+    assert changed['registered'] == ['stop'] and changed['updated'] == ['start'] and changed['unregistered'] == ['help_me']
+    assert sorted(command['COMMAND'] for command in bot.commands.values()) == ['start', 'stop']
+    assert [command['TITLE'] for command in bot.commands.values() if command['COMMAND'] == 'start'] == ['New']
+    with open(manifest, encoding='utf-8') as f:
+        assert sorted(json.load(f)['COMMANDS']) == ['start', 'stop']
+
+
+@pytest.mark.parametrize('duplicate', ['id', 'error_with_id'])
+def test_commands_from_an_earlier_deployment_are_adopted(manifest, duplicate):
+    bot = CommandBot(duplicate)
+
+    async def main():
+        await bot.register_commands(commands('start', 'stop'))
+        adopted = await bot.register_commands(commands('start', 'stop', title='New'), manifest_path=manifest)
+        again = await bot.register_commands(commands('start', 'stop', title='New'), manifest_path=manifest)
+        removed = await bot.register_commands(commands('start', title='New'), manifest_path=manifest)
+        return adopted, again, removed
+
+    adopted, again, removed = asyncio.run(main())
+    assert not adopted['errors'] and not again['errors'] and not removed['errors']
+    assert len(bot.commands) == 1
+    assert [command['TITLE'] for command in bot.commands.values()] == ['New']
+    assert again['registered'] == again['updated'] == again['existing'] == []
+    assert removed['unregistered'] == ['stop']
+
+
+def test_existing_command_without_id_is_not_registered_again(manifest):
+    bot = CommandBot('error')
+
+    async def main():
+        await bot.register_commands(commands('start'))
+        first = await bot.register_commands(commands('start'), manifest_path=manifest)
+        calls = len(bot.methods)
+        again = await bot.register_commands(commands('start'), manifest_path=manifest)
+        return first, calls, again
+
+    first, calls, again = asyncio.run(main())
+    assert first['existing'] == ['start'] and not first['errors']
+    assert again['existing'] == [] and len(bot.methods) == calls
+    assert len(bot.commands) == 1
+
+
+def test_command_names_with_separators(manifest):
+    bot = CommandBot()
+    names = ('register_x', 'update_me', 'un_register', 'a|b')
+
+    async def main():
+        first = await bot.register_commands(commands(*names), manifest_path=manifest)
+        second = await bot.register_commands(commands(*names[:2], title='New'), manifest_path=manifest)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert sorted(first['registered']) == sorted(names)
+    assert sorted(second['updated']) == ['register_x', 'update_me']
+    assert sorted(second['unregistered']) == ['a|b', 'un_register']
+    assert not second['errors']
@@ -0,0 +1,56 @@
+"""
+Тесты кеша ответов REST API.
+"""
+
+import asyncio
+
+from bitrixogram.cache import RestCache
+
+
+def test_bot_caches_read_methods(bot):
+    async def main():
+        bot.cache = RestCache(ttl={'user.get': 60})
+        first = await bot.rest_command('user.get', {'ID': 1})
+        second = await bot.rest_command('user.get', {'ID': 1})
+        other = await bot.rest_command('user.get', {'ID': 2})
+        await bot.rest_command('imbot.message.add', {'DIALOG_ID': 1, 'MESSAGE': 'x'})
+        await bot.rest_command('imbot.message.add', {'DIALOG_ID': 1, 'MESSAGE': 'x'})
+        return first, second, other
+
+    first, second, other = asyncio.run(main())
+    assert first == second != other
+    assert len(bot.calls_of('user.get')) == 2
+    assert len(bot.calls_of('imbot.message.add')) == 2
+
+
+def test_expired_and_invalidated_entries_are_reloaded():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return {'result': len(calls)}
+
+    async def main():
+        cache = RestCache(ttl={'user.get': 0.05, 'im.chat.get': 60})
+        await cache.fetch('user.get', {}, loader)
+        await asyncio.sleep(0.1)
+        expired = await cache.fetch('user.get', {}, loader)
+        await cache.fetch('im.chat.get', {'ID': 1}, loader)
+        await cache.on_update({'event': 'ONIMBOTJOINCHAT'})
+        invalidated = await cache.fetch('im.chat.get', {'ID': 1}, loader)
+        return expired, invalidated
+
+    assert asyncio.run(main()) == ({'result': 2}, {'result': 4})
+
+
+def test_errors_are_not_cached():
+    responses = [{'error': 'QUERY_LIMIT_EXCEEDED'}, {'result': 'ok'}]
+
+    async def loader():
+        return responses.pop(0)
+
+    async def main():
+        cache = RestCache(ttl={'user.get': 60})
+        return [await cache.fetch('user.get', {}, loader) for _ in range(3)]
+
+    assert asyncio.run(main()) == [{'error': 'QUERY_LIMIT_EXCEEDED'}, {'result': 'ok'}, {'result': 'ok'}]
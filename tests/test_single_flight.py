@@ -0,0 +1,79 @@
+"""
+Тесты объединения одновременных запросов SingleFlight.
+"""
+
+import asyncio
+
+from bitrixogram.cache import RestCache, SingleFlight
+
+
+def test_single_flight_collapses_requests():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {'result': {'ID': 1}}
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run('user.get', loader) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert len(calls) == 1 and flight.calls == 1 and flight.collapsed == 4
+    assert all(result == {'result': {'ID': 1}} for result in results)
+    assert len({id(result) for result in results}) == 5
+
+
+def test_single_flight_survives_leader_cancellation():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'result': len(calls)}
+
+    async def main():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.run('user.get', loader))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.run('user.get', loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return flight, leader, await asyncio.gather(*followers)
+
+    flight, leader, results = asyncio.run(main())
+    assert leader.cancelled()
+    assert results == [{'result': 2}] * 3
+    assert len(calls) == 2 and flight.calls == 2 and flight.collapsed == 2
+
+
+def test_single_flight_shares_errors():
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('portal is down')
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.run('user.get', loader) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_rest_cache_returns_copies():
+    async def loader():
+        return {'result': {'ID': 1, 'NAME': 'Ann'}}
+
+    async def main():
+        cache = RestCache(ttl={'user.get': 60})
+        first = await cache.fetch('user.get', {'ID': 1}, loader)
+        first['result']['NAME'] = 'changed'
+        second = await cache.fetch('user.get', {'ID': 1}, loader)
+        second['result']['NAME'] = 'changed again'
+        return cache, await cache.fetch('user.get', {'ID': 1}, loader)
+
+    cache, third = asyncio.run(main())
+    assert third == {'result': {'ID': 1, 'NAME': 'Ann'}}
+    assert cache.hits == 2 and cache.misses == 1
@@ -0,0 +1,89 @@
+"""
+Тесты таймеров FSM: время жизни состояний и запланированные вызовы.
+"""
+
+import asyncio
+import logging
+
+from bitrixogram.fsm import FSM, FSMContext, State
+
+
+def test_timers_fire_in_new_event_loop():
+    fired = []
+
+    async def handler(context, name, payload):
+        fired.append((context.chat_id, name, context.namespace))
+
+    fsm = FSM(timer_handler=handler)
+
+    async def first():
+        # цикл завершается раньше, чем истекает ttl
+        await FSMContext(1, fsm).set_state(State('waiting'), ttl=0.2)
+
+    async def second():
+        await FSMContext(2, fsm.namespace('portal')).schedule('remind', 0.05)
+        await asyncio.sleep(0.4)
+
+    asyncio.run(first())
+    asyncio.run(second())
+    assert sorted(fired) == [(1, '', None), (2, 'remind', 'portal')]
+
+
+def test_timer_handlers_are_tracked_and_drained(caplog):
+    finished = []
+
+    async def handler(context, name, payload):
+        await asyncio.sleep(0.05)
+        if name == 'broken':
+            raise RuntimeError(name)
+        finished.append(payload['value'])
+
+    fsm = FSM(timer_handler=handler)
+
+    async def main():
+        await FSMContext(1, fsm).schedule('ok', 0.01, value=1)
+        await FSMContext(2, fsm).schedule('broken', 0.01)
+        await asyncio.sleep(0.03)
+        running = len(fsm.scheduler.tasks)
+        drained = await fsm.scheduler.drain(timeout=1.0)
+        return running, drained
+
+    with caplog.at_level(logging.ERROR):
+        running, drained = asyncio.run(main())
+    assert running == 2 and drained
+    assert finished == [1]
+    assert not fsm.scheduler.tasks
+    assert any(record.exc_info and isinstance(record.exc_info[1], RuntimeError) for record in caplog.records)
+
+
+def test_cancelled_timer_does_not_fire():
+    fired = []
+
+    async def handler(context, name, payload):
+        fired.append(name)
+
+    fsm = FSM(timer_handler=handler)
+
+    async def main():
+        context = FSMContext(1, fsm)
+        await context.schedule('a', 0.05)
+        await context.schedule('b', 0.05)
+        cancelled = await context.cancel('a')
+        await asyncio.sleep(0.15)
+        return cancelled
+
+    assert asyncio.run(main())
+    assert fired == ['b']
+
+
+def test_state_ttl():
+    async def main():
+        context = FSMContext(1, FSM())
+        await context.set_state(State('waiting'), ttl=0.05)
+        before = await context.get_state()
+        await asyncio.sleep(0.1)
+        return before, await context.get_state()
+
+    before, after = asyncio.run(main())
+    assert before == State('waiting')
+    assert after is None
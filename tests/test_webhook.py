@@ -0,0 +1,115 @@
+"""
+Тесты WebhookListener: проверка запросов и жизненный цикл.
+"""
+
+import asyncio
+import datetime
+import os
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from bitrixogram.dispatcher import Dispatcher, MagicFilter, Router
+from bitrixogram.fsm import FSMContext
+from bitrixogram.mockportal import encode_event, message_event
+from bitrixogram.webhook import WebhookListener
+
+F = MagicFilter()
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def build_listener(seen: list, **kwargs) -> WebhookListener:
+    router = Router()
+
+    @router.message(F.text())
+    async def remember(message, fsm_context):
+        seen.append(message.get_text())
+
+    dispatcher = Dispatcher()
+    dispatcher.add_router(router)
+    return WebhookListener('127.0.0.1', 0, dispatcher, lag_threshold=None, **kwargs)
+
+
+async def post(listener: WebhookListener, requests: list) -> list:
+    statuses = []
+    async with TestClient(TestServer(listener.build_app())) as client:
+        for path, body, headers in requests:
+            response = await client.post(path, data=body, headers=headers)
+            statuses.append(response.status)
+    await listener.close()
+    return statuses
+
+
+def test_application_token_is_checked():
+    seen = []
+
+    async def main():
+        listener = build_listener(seen, application_token='tok')
+        return listener, await post(listener, [
+            ('/', encode_event(message_event('valid', application_token='tok')), FORM),
+            ('/', encode_event(message_event('wrong', application_token='tok2')), FORM),
+            ('/', encode_event(message_event('prefix', application_token='to')), FORM),
+            ('/', encode_event({k: v for k, v in message_event('missing').items() if k != 'auth[application_token]'}), FORM),
+            ('/', {**message_event('multipart', application_token='tok')}, None),
+            ('/', {**message_event('multipart wrong', application_token='bad')}, None),
+        ])
+
+    listener, statuses = asyncio.run(main())
+    assert statuses == [200, 403, 403, 403, 200, 403]
+    assert seen == ['valid', 'multipart']
+    assert listener.rejected == 4
+
+
+def test_secret_is_checked_before_body():
+    seen = []
+
+    async def main():
+        listener = build_listener(seen, secret='s3cret')
+        body = encode_event(message_event('hi'))
+        return await post(listener, [('/', body, FORM), ('/?secret=wrong', body, FORM), ('/?secret=s3cret', body, FORM)])
+
+    assert asyncio.run(main()) == [403, 403, 200]
+    assert seen == ['hi']
+
+
+@pytest.mark.parametrize('token', [None, 'tok'])
+def test_body_limit(token):
+    seen = []
+
+    async def main():
+        listener = build_listener(seen, max_body_size=2048, application_token=token)
+        small = encode_event(message_event('small', application_token='tok'))
+        large = encode_event(message_event('x' * 4096, application_token='tok'))
+
+        async def chunks():
+            yield large
+
+        return await post(listener, [('/', small, FORM), ('/', large, FORM), ('/', chunks(), FORM)])
+
+    assert asyncio.run(main()) == [200, 413, 413]
+    assert seen == ['small']
+
+
+def test_stop_finishes_when_fsm_cannot_be_saved(tmp_path, caplog):
+    path = os.path.join(tmp_path, 'fsm.json')
+
+    async def main():
+        dispatcher = Dispatcher()
+        listener = WebhookListener('127.0.0.1', 0, dispatcher, fsm_path=path, lag_threshold=None)
+        await listener.start()
+        await FSMContext(1, dispatcher.FSM).update_data(when=datetime.datetime.now())
+        hooks = []
+
+        async def hook():
+            hooks.append(1)
+
+        listener.add_shutdown_hook(hook)
+        await asyncio.wait_for(listener.stop(drain_timeout=1.0), 5.0)
+        await asyncio.wait_for(listener.wait_stopped(), 1.0)
+        return listener, hooks
+
+    listener, hooks = asyncio.run(main())
+    assert hooks == [1]
+    assert listener.session.closed
+    assert not listener.ready
+    assert any('failed to save FSM' in record.getMessage() for record in caplog.records)
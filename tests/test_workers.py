@@ -0,0 +1,52 @@
+"""
+Тесты выполнения синхронных обработчиков в пулах.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from bitrixogram.dispatcher import Router
+from bitrixogram.workers import Offloader, offload, offload_handler
+
+
+def test_offload_runs_in_thread():
+    loop_thread = threading.get_ident()
+
+    @offload
+    def work(value):
+        return value * 2, threading.get_ident()
+
+    result, thread = asyncio.run(work(21))
+    assert result == 42 and thread != loop_thread
+
+
+def test_offload_handler_runs_sync_handler():
+    offloader = Offloader(max_threads=1)
+    seen = []
+
+    def handler(message, fsm_context):
+        seen.append((message, fsm_context))
+        return 'done'
+
+    async def main():
+        try:
+            return await offload_handler(handler, offloader)('message', 'context')
+        finally:
+            await offloader.close()
+
+    assert asyncio.run(main()) == 'done'
+    assert seen == [('message', 'context')]
+
+
+def test_offload_rejects_coroutine_functions():
+    async def handler(message, fsm_context):
+        pass
+
+    with pytest.raises(TypeError):
+        offload_handler(handler)
+    with pytest.raises(TypeError):
+        offload(handler)
+    with pytest.raises(TypeError):
+        Router().message(offload=True)(handler)